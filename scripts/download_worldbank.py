@@ -2,8 +2,10 @@
 Downloading data and updating README file
 """
 
+from crossborderml.config import CFG
 from crossborderml.pipeline.fetch_extract import run_download
+from crossborderml.pipeline.manifest import DownloadManifest
 
 
 if __name__ == "__main__":
-    run_download()
+    run_download(manifest=DownloadManifest(CFG.paths.download_manifest))
@@ -2,8 +2,10 @@
 Unzip the data in the `raw` directory
 """
 
+from crossborderml.config import CFG
 from crossborderml.pipeline.fetch_extract import run_unzip
+from crossborderml.pipeline.manifest import DownloadManifest
 
 
 if __name__ == "__main__":
-    run_unzip()
+    run_unzip(manifest=DownloadManifest(CFG.paths.download_manifest))
@@ -0,0 +1,6 @@
+SELECT indicator_code, country_code, year, value
+  FROM observations
+ WHERE indicator_code IN ({indicators})
+   AND year >= :start AND year < :stop
+   {country_filter}
+ ORDER BY {order_by};
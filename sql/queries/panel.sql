@@ -0,0 +1,5 @@
+SELECT country_code, year, indicator_code, value
+  FROM observations
+ WHERE indicator_code IN :indicators
+   AND year >= :start AND year < :stop
+   {country_filter};
@@ -0,0 +1,6 @@
+SELECT year, value
+  FROM observations
+ WHERE indicator_code = :indicator
+   AND country_code = :country
+   AND year >= :start AND year < :stop
+ ORDER BY year;
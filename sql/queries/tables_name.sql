@@ -1,4 +1,5 @@
 SELECT name 
   FROM sqlite_master 
  WHERE type='table' 
-   AND name GLOB '*_wide';
\ No newline at end of file
+   AND name GLOB '*_wide'
+   AND NOT (name GLOB 'country_*_wide');
\ No newline at end of file
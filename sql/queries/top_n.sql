@@ -0,0 +1,7 @@
+SELECT country_code, value
+  FROM observations
+ WHERE indicator_code = :indicator
+   AND year = :year
+   AND value IS NOT NULL
+ ORDER BY value {order}, country_code
+ LIMIT :n;
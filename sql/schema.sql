@@ -0,0 +1,21 @@
+-- One row per (indicator, country, year) for all the indicators
+CREATE TABLE IF NOT EXISTS observations (
+  indicator_code   TEXT    NOT NULL,
+  country_code     TEXT    NOT NULL,
+  year             INTEGER NOT NULL,
+  value            REAL,
+  PRIMARY KEY (indicator_code, year, country_code)
+) WITHOUT ROWID;
+
+-- Per-country lookups, the primary key columns are stored in every
+-- index entry so it covers all the columns
+CREATE INDEX IF NOT EXISTS observations_country_year
+  ON observations (country_code, year, value);
+
+-- A counter per table, raised by the stage which rewrites it, so
+-- the readers know their cached results are stale
+CREATE TABLE IF NOT EXISTS _table_versions (
+  table_name   TEXT    PRIMARY KEY,
+  version      INTEGER NOT NULL,
+  updated_at   TEXT
+);
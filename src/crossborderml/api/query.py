@@ -0,0 +1,160 @@
+"""
+Read the processed data without writing SQL:
+
+    service = QueryService()
+    service.get_series("NY.GDP.MKTP.CD", "DEU", (2000, 2024))
+    service.get_panel(["NY.GDP.MKTP.CD", "SP.POP.TOTL"], ["DEU", "FRA"])
+    service.top_n("BX.KLT.DINV.CD.WD", 2022, 10)
+
+The queries (sql/queries) run on the `observations` table, whose
+primary key and index make each one a range seek. The results are
+kept in an LRU cache bounded in bytes (CFG.query.cache_bytes).
+Before answering, the service reads the version of the table in
+_table_versions (one primary key lookup); a stage which rewrites the
+table raises it, and the cache is then emptied. The frames handed
+out are copies, so a caller cannot change the cached ones.
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Hashable, Iterable
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+
+from crossborderml.config import CFG
+from crossborderml.utils import db_utils
+from crossborderml.utils.io_utils import LruCache, render_snippet
+from crossborderml.pipeline.observations import OBSERVATIONS_TABLE
+
+
+def frame_bytes(df: pd.DataFrame | pd.Series) -> int:
+    """Memory of a result, the weight in the cache"""
+    usage = df.memory_usage(deep=True)
+    return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+
+
+class QueryService:
+    """Cached queries over the observations table"""
+
+    def __init__(self,
+                 db_url: str = CFG.sql.db_url,
+                 cache_bytes: int = CFG.query.cache_bytes,
+                 queries_dir: Path = CFG.sql.queries_dir
+                 ) -> None:
+        self.engine: Engine = db_utils.get_engine(db_url)
+        self.cache = LruCache(cache_bytes, weigh=frame_bytes)
+        self.queries_dir = queries_dir
+        self.version: int | None = None
+
+    def table_version(self) -> int:
+        """Version of the observations table; empties a stale cache"""
+        with self.engine.connect() as conn:
+            version = db_utils.table_version(conn, OBSERVATIONS_TABLE)
+        if version != self.version:
+            self.cache.clear()
+            self.version = version
+        return version
+
+    def _cached(self,
+                key: Hashable,
+                run: Callable[[], pd.DataFrame | pd.Series]
+                ) -> Any:
+        """The result of `key`, from the cache or from `run`"""
+        key = (self.table_version(), key)
+        result = self.cache.get(key)
+        if result is None:
+            result = run()
+            self.cache.put(key, result)
+        return result.copy()
+
+    def _read(self, query: str, params: dict[str, Any], **fmt: str
+              ) -> pd.DataFrame:
+        """Run a query of `queries_dir`, its lists bound as IN lists"""
+        stmt = text(render_snippet(self.queries_dir / query, **fmt))
+        lists = [name for name, value in params.items()
+                 if isinstance(value, (list, tuple))]
+        if lists:
+            stmt = stmt.bindparams(
+                *[bindparam(name, expanding=True) for name in lists])
+        with self.engine.connect() as conn:
+            return pd.read_sql_query(stmt, conn, params=params)
+
+    def get_series(self,
+                   indicator: str,
+                   country: str,
+                   years: tuple[int, int] = CFG.sql.year_range
+                   ) -> pd.Series:
+        """The values of one indicator and country, indexed by year"""
+        start, stop = years
+
+        def run() -> pd.Series:
+            df = self._read("series.sql", {
+                "indicator": indicator, "country": country,
+                "start": start, "stop": stop})
+            return pd.Series(df["value"].to_numpy(float),
+                             index=pd.Index(df["year"], name="year"),
+                             name=indicator)
+
+        return self._cached(("series", indicator, country, start, stop), run)
+
+    def get_panel(self,
+                  indicators: Iterable[str],
+                  countries: Iterable[str] | None = None,
+                  years: tuple[int, int] = CFG.sql.year_range
+                  ) -> pd.DataFrame:
+        """
+        One column per indicator, in the given order, and a row per
+        (country_code, year) with at least one value; all the
+        countries if `countries` is None.
+        """
+        indicators = list(dict.fromkeys(indicators))
+        countries = None if countries is None else sorted(set(countries))
+        start, stop = years
+
+        def run() -> pd.DataFrame:
+            params: dict[str, Any] = {
+                "indicators": indicators, "start": start, "stop": stop}
+            country_filter = ""
+            if countries is not None:
+                params["countries"] = countries
+                country_filter = "AND country_code IN :countries"
+            if not indicators or countries == []:
+                df = pd.DataFrame(columns=["country_code", "year",
+                                           "indicator_code", "value"])
+            else:
+                df = self._read("panel.sql", params,
+                                country_filter=country_filter)
+            panel = df.pivot(index=["country_code", "year"],
+                             columns="indicator_code", values="value")
+            panel = panel.reindex(columns=indicators).sort_index()
+            panel.columns.name = None
+            return panel.astype(float)
+
+        return self._cached(
+            ("panel", tuple(indicators),
+             None if countries is None else tuple(countries), start, stop),
+            run)
+
+    def top_n(self,
+              indicator: str,
+              year: int,
+              n: int = 10,
+              ascending: bool = False
+              ) -> pd.DataFrame:
+        """The `n` countries with the largest (or smallest) values"""
+        def run() -> pd.DataFrame:
+            return self._read(
+                "top_n.sql", {"indicator": indicator, "year": year, "n": n},
+                order="ASC" if ascending else "DESC")
+
+        return self._cached(("top_n", indicator, year, n, ascending), run)
+
+    def clear(self) -> None:
+        """Empty the result cache"""
+        self.cache.clear()
+        self.version = None
+
+
+if __name__ == '__main__':
+    print(QueryService().top_n("BX.KLT.DINV.CD.WD", 2022))
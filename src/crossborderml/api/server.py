@@ -0,0 +1,502 @@
+"""
+Serve the observations to notebooks and dashboards over HTTP:
+
+    python -m crossborderml.api.server
+
+    GET /long?indicators=NY.GDP.MKTP.CD,SP.POP.TOTL&countries=DEU,FRA
+        a row per (indicator_code, country_code, year)
+    GET /wide?indicators=NY.GDP.MKTP.CD,SP.POP.TOTL&start=2000&stop=2024
+        a row per (country_code, year), a column per indicator
+    GET /health
+        the run id and the version of the observations table
+
+`countries`, `start` and `stop` are optional (all the countries,
+CFG.sql.year_range). The body is JSON in the "split" layout of
+pandas (pd.read_json(url, orient="split")), or an Arrow IPC stream
+with format=arrow or `Accept: application/vnd.apache.arrow.stream`
+(needs pyarrow). Both are sent in chunks of CFG.server.fetch_rows
+rows, so a large panel is never held in memory.
+
+The requests share a pool of read-only connections (mode=ro,
+query_only). A request reads in one transaction, ended when its
+connection goes back to the pool, so the ETag matches the rows it
+labels and no read outlives its request. An error while the rows
+stream (SQLite or Arrow) closes the connection without the final
+chunk, so the client sees a cut body rather than a complete one.
+The database is put in WAL mode once at start: readers see the
+last committed state while the loader writes, and neither waits
+for the other; the busy timeout covers the short locks of a
+checkpoint. The ETag of a response is built from the id of the last
+pipeline run (CFG.paths.pipeline_state), the version of the
+observations table and the request, so a client sending
+If-None-Match gets 304 until the data change.
+"""
+
+import json
+import queue
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Iterator
+from urllib.parse import parse_qs, urlsplit
+
+from sqlalchemy import make_url
+
+from crossborderml.config import CFG, ServerConfig
+from crossborderml.utils.db_utils import VERSIONS_TABLE
+from crossborderml.utils.io_utils import render_snippet
+from crossborderml.pipeline.observations import OBSERVATIONS_TABLE
+from crossborderml.pipeline.runner import PipelineState
+
+JSON_TYPE: str = "application/json"
+ARROW_TYPE: str = "application/vnd.apache.arrow.stream"
+
+# layout -> ORDER BY of sql/queries/observation_rows.sql
+ROW_ORDERS: dict[str, str] = {
+    # the primary key
+    "long": "indicator_code, year, country_code",
+    # the rows of a (country, year) next to each other
+    "wide": "country_code, year",
+}
+
+
+class RequestError(Exception):
+    """A request which cannot be answered, and its HTTP status"""
+
+    def __init__(self,
+                 message: str,
+                 status: HTTPStatus = HTTPStatus.BAD_REQUEST
+                 ) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _pyarrow() -> ModuleType:
+    """Import pyarrow, or tell the client it is not there"""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise RequestError(
+            "Arrow responses need pyarrow: "
+            "pip install 'crossborderml[columnar]'",
+            HTTPStatus.NOT_ACCEPTABLE) from exc
+    return pyarrow
+
+
+def sqlite_path(db_url: str) -> Path:
+    """The database file of a SQLite URL"""
+    url = make_url(db_url)
+    if url.get_backend_name() != "sqlite" or \
+            url.database in (None, "", ":memory:"):
+        raise ValueError(f"The server reads a SQLite file, not '{db_url}'")
+    return Path(url.database)
+
+
+def enable_wal(path: Path) -> str:
+    """
+    Put the database in WAL mode, which is kept in the file, so the
+    readers do not block the writers.
+
+    Returns:
+        the journal mode
+    """
+    if not path.is_file():
+        raise FileNotFoundError(
+            f"No database at {path}, run the pipeline first")
+    con = sqlite3.connect(path)
+    try:
+        return con.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally:
+        con.close()
+
+
+class ReadOnlyPool:
+    """A fixed number of read-only connections to a SQLite file"""
+
+    def __init__(self,
+                 path: Path,
+                 size: int = CFG.server.pool_size,
+                 busy_timeout_ms: int = CFG.server.busy_timeout_ms,
+                 timeout: float = CFG.server.pool_timeout
+                 ) -> None:
+        self.size = size
+        self.timeout = timeout
+        self._idle: queue.Queue[sqlite3.Connection] = queue.Queue()
+        self._all: list[sqlite3.Connection] = []
+        uri = f"{path.resolve().as_uri()}?mode=ro"
+        for _ in range(size):
+            # autocommit, the reads of a request are wrapped in BEGIN
+            conn = sqlite3.connect(uri, uri=True, isolation_level=None,
+                                   check_same_thread=False,
+                                   timeout=busy_timeout_ms / 1000)
+            conn.execute("PRAGMA query_only=ON")
+            self._all.append(conn)
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection; 503 if none is free in time"""
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty as exc:
+            raise RequestError("All the connections are busy",
+                               HTTPStatus.SERVICE_UNAVAILABLE) from exc
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def snapshot(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection inside a read transaction, so all its
+        reads see the same committed state; it ends when returned.
+        """
+        with self.connection() as conn:
+            conn.execute("BEGIN")
+            yield conn
+
+    def close(self) -> None:
+        """self explanatory"""
+        for conn in self._all:
+            conn.close()
+
+
+def observations_version(conn: sqlite3.Connection) -> int:
+    """The version of the observations table, 0 if never raised"""
+    try:
+        row = conn.execute(
+            f"SELECT version FROM {VERSIONS_TABLE} WHERE table_name = ?",
+            (OBSERVATIONS_TABLE,)).fetchone()
+    except sqlite3.OperationalError:
+        # no _table_versions table yet
+        return 0
+    return int(row[0]) if row else 0
+
+
+def _codes(query: dict[str, list[str]], name: str) -> list[str] | None:
+    """The codes of a parameter, comma separated or repeated"""
+    if name not in query:
+        return None
+    codes = [code for value in query[name]
+             for code in value.split(",") if code]
+    return list(dict.fromkeys(codes))
+
+
+def _year(query: dict[str, list[str]], name: str, default: int) -> int:
+    """self explanatory"""
+    try:
+        return int(query[name][-1]) if name in query else default
+    except ValueError as exc:
+        raise RequestError(f"'{name}' must be a year") from exc
+
+
+@dataclass(frozen=True)
+class PanelRequest:
+    """The parameters of a /long or /wide request"""
+    layout: str
+    indicators: tuple[str, ...]
+    countries: tuple[str, ...] | None
+    years: tuple[int, int]
+    media_type: str
+
+    @classmethod
+    def parse(cls, layout: str, query_string: str, accept: str = ""
+              ) -> "PanelRequest":
+        """
+        Raises:
+            RequestError: a missing or malformed parameter
+        """
+        query = parse_qs(query_string)
+        indicators = _codes(query, "indicators")
+        if not indicators:
+            raise RequestError("'indicators' is required")
+        countries = _codes(query, "countries")
+        start, stop = CFG.sql.year_range
+        years = (_year(query, "start", start), _year(query, "stop", stop))
+        fmt = query.get("format", [""])[-1]
+        if fmt not in ("", "json", "arrow"):
+            raise RequestError(f"Unknown format '{fmt}', use json or arrow")
+        arrow = fmt == "arrow" or (not fmt and ARROW_TYPE in accept)
+        return cls(layout, tuple(indicators),
+                   None if countries is None else tuple(sorted(countries)),
+                   years, ARROW_TYPE if arrow else JSON_TYPE)
+
+    def key(self) -> str:
+        """The request in a canonical form, for the ETag"""
+        return repr(self)
+
+    def columns(self) -> list[str]:
+        """self explanatory"""
+        if self.layout == "long":
+            return ["indicator_code", "country_code", "year", "value"]
+        return ["country_code", "year", *self.indicators]
+
+    def select(self,
+               conn: sqlite3.Connection,
+               queries_dir: Path = CFG.sql.queries_dir
+               ) -> sqlite3.Cursor:
+        """Run sql/queries/observation_rows.sql; rows are fetched later"""
+        params: dict[str, Any] = {"start": self.years[0],
+                                  "stop": self.years[1]}
+        params.update({f"i{k}": code for k, code in
+                       enumerate(self.indicators)})
+        country_filter = ""
+        if self.countries is not None:
+            params.update({f"c{k}": code for k, code in
+                           enumerate(self.countries)})
+            names = ", ".join(f":c{k}" for k in range(len(self.countries)))
+            country_filter = f"AND country_code IN ({names})"
+        sql = render_snippet(
+            queries_dir / "observation_rows.sql",
+            indicators=", ".join(f":i{k}"
+                                 for k in range(len(self.indicators))),
+            country_filter=country_filter,
+            order_by=ROW_ORDERS[self.layout])
+        return conn.execute(sql, params)
+
+    def rows(self, cursor: sqlite3.Cursor, fetch_rows: int
+             ) -> Iterator[list]:
+        """Batches of the rows of `columns()`"""
+        batches = iter(lambda: cursor.fetchmany(fetch_rows), [])
+        if self.layout == "long":
+            yield from batches
+            return
+        position = {code: k + 2 for k, code in enumerate(self.indicators)}
+        row: list | None = None
+        for batch in batches:
+            done = []
+            for code, country, year, value in batch:
+                if row is None or row[0] != country or row[1] != year:
+                    if row is not None:
+                        done.append(row)
+                    row = [country, year] + [None] * len(self.indicators)
+                row[position[code]] = value
+            if done:
+                yield done
+        if row is not None:
+            yield [row]
+
+
+def json_chunks(columns: list[str], batches: Iterator[list]
+                ) -> Iterator[bytes]:
+    """{"columns": [...], "data": [[...], ...]}, a batch at a time"""
+    yield f'{{"columns": {json.dumps(columns)}, "data": ['.encode("utf-8")
+    separator = ""
+    for rows in batches:
+        yield (separator + json.dumps(rows)[1:-1]).encode("utf-8")
+        separator = ", "
+    yield b"]}"
+
+
+class _Pending:
+    """The bytes written by an Arrow stream writer since the last take"""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self.parts: list[bytes] = []
+
+    def write(self, data: Any) -> int:
+        """self explanatory"""
+        self.parts.append(bytes(data))
+        return len(self.parts[-1])
+
+    def flush(self) -> None:
+        """self explanatory"""
+
+    def take(self) -> bytes:
+        """self explanatory"""
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def arrow_chunks(request: PanelRequest, batches: Iterator[list]
+                 ) -> Iterator[bytes]:
+    """An Arrow IPC stream, a record batch per batch of rows"""
+    pa = _pyarrow()
+    string, year, value = pa.string(), pa.int32(), pa.float64()
+    if request.layout == "long":
+        types = [string, string, year, value]
+    else:
+        types = [string, year] + [value] * len(request.indicators)
+    schema = pa.schema(list(zip(request.columns(), types)))
+    sink = _Pending()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        yield sink.take()
+        for rows in batches:
+            writer.write_batch(pa.record_batch(
+                [pa.array(column, type=kind)
+                 for column, kind in zip(zip(*rows), types)],
+                schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """GET /long, /wide and /health"""
+
+    protocol_version = "HTTP/1.1"
+    server: "QueryServer"
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """self explanatory"""
+        url = urlsplit(self.path)
+        try:
+            if url.path == "/health":
+                self._send_json(self.server.health())
+            elif url.path.strip("/") in ROW_ORDERS:
+                self._send_panel(PanelRequest.parse(
+                    url.path.strip("/"), url.query,
+                    self.headers.get("Accept", "")))
+            else:
+                raise RequestError(f"No such path: {url.path}",
+                                   HTTPStatus.NOT_FOUND)
+        except RequestError as err:
+            self._send_json({"error": str(err)}, err.status)
+        except sqlite3.Error as err:
+            self._send_json({"error": str(err)},
+                            HTTPStatus.SERVICE_UNAVAILABLE)
+
+    def _send_json(self,
+                   payload: dict[str, Any],
+                   status: HTTPStatus = HTTPStatus.OK
+                   ) -> None:
+        """A small JSON answer"""
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", JSON_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_panel(self, request: PanelRequest) -> None:
+        """
+        The rows of a request, chunked, or 304 if the ETag matches.
+        The version in the ETag and the rows are read in one snapshot.
+        """
+        with self.server.pool.snapshot() as conn:
+            etag = self.server.etag(conn, request.key())
+            wanted = self.headers.get("If-None-Match", "")
+            if etag in [tag.strip() for tag in wanted.split(",")]:
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            if request.media_type == ARROW_TYPE:
+                _pyarrow()
+            cursor = request.select(conn, self.server.queries_dir)
+            try:
+                batches = request.rows(cursor, self.server.cfg.fetch_rows)
+                # raised while the body is sent
+                stream_errors: tuple[type[Exception], ...] = \
+                    (sqlite3.Error,)
+                if request.media_type == ARROW_TYPE:
+                    chunks = arrow_chunks(request, batches)
+                    stream_errors += (_pyarrow().ArrowException,)
+                else:
+                    chunks = json_chunks(request.columns(), batches)
+                self.send_response(HTTPStatus.OK)
+                self.send_header("Content-Type", request.media_type)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Vary", "Accept")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        if chunk:
+                            self.wfile.write(
+                                b"%x\r\n%b\r\n" % (len(chunk), chunk))
+                except stream_errors as err:
+                    # the status is sent: no terminating chunk, the
+                    # closed connection tells the client the body is cut
+                    print(f"Stream of {self.path} failed: {err}")
+                    self.close_connection = True
+                    return
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # the client went away, free its connection
+                self.close_connection = True
+            finally:
+                cursor.close()
+
+
+class QueryServer(ThreadingHTTPServer):
+    """A thread per request, a pooled read-only connection per thread"""
+
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self,
+                 db_url: str = CFG.sql.db_url,
+                 cfg: ServerConfig = CFG.server,
+                 state_path: Path = CFG.paths.pipeline_state,
+                 queries_dir: Path = CFG.sql.queries_dir
+                 ) -> None:
+        path = sqlite_path(db_url)
+        enable_wal(path)
+        self.cfg = cfg
+        self.state_path = state_path
+        self.queries_dir = queries_dir
+        self.pool = ReadOnlyPool(path, cfg.pool_size, cfg.busy_timeout_ms,
+                                 cfg.pool_timeout)
+        self._state_stamp: int | None = None
+        self._run_id = ""
+        self._lock = threading.Lock()
+        super().__init__((cfg.host, cfg.port), QueryHandler)
+
+    def run_id(self) -> str:
+        """The id of the last pipeline run, read again when it changes"""
+        try:
+            stamp = self.state_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return ""
+        with self._lock:
+            if stamp != self._state_stamp:
+                self._run_id = PipelineState(self.state_path).run_id
+                self._state_stamp = stamp
+            return self._run_id
+
+    def etag(self, conn: sqlite3.Connection, key: str) -> str:
+        """Run id, table version and a digest of the request"""
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        return f'"{self.run_id() or "none"}-' \
+               f'{observations_version(conn)}-{digest}"'
+
+    def health(self) -> dict[str, Any]:
+        """self explanatory"""
+        with self.pool.connection() as conn:
+            version = observations_version(conn)
+        return {"run_id": self.run_id(), "observations_version": version,
+                "pool_size": self.pool.size}
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.close()
+
+
+def serve(db_url: str = CFG.sql.db_url,
+          cfg: ServerConfig = CFG.server
+          ) -> None:
+    """Serve until interrupted"""
+    with QueryServer(db_url, cfg) as server:
+        host, port = server.server_address[:2]
+        print(f"Serving {sqlite_path(db_url)} on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Stopped")
+
+
+if __name__ == '__main__':
+    serve()
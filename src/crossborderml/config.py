@@ -1,5 +1,6 @@
 """Setting the paths and other constant needed in scripts"""
 
+import os
 from dataclasses import dataclass, field
 from pathlib import Path
 
@@ -10,6 +11,11 @@ class UrlConfig:
     world_bank_indicator = \
         "https://api.worldbank.org/v2/en/indicator/{code}?downloadformat=csv"
     timeout: float = 60.0
+    # Number of indicators fetched at the same time
+    max_workers: int = 8
+    # Write the archives to disk in chunks instead of buffering them
+    stream: bool = True
+    chunk_size: int = 1 << 16
 
     def world_bank_indicator_url(self,
                                  code: str
@@ -30,6 +36,14 @@ class PathConfig:
     indicator_yaml: Path = \
         project_root / "src" / "crossborderml" / "conf" / "indicators.yaml"
     data_readme: Path = data_dir / "README.md"
+    download_manifest: Path = data_dir / "download_manifest.json"
+    # fingerprints of the stages the runner has completed
+    pipeline_state: Path = data_dir / "pipeline_state.json"
+    # the timing and size report of each run
+    reports_dir: Path = data_dir / "reports"
+    columnar_dir: Path = processed_data_dir / "columnar"
+    cube_dir: Path = processed_data_dir / "cube"
+    features_dir: Path = processed_data_dir / "features"
 
 
 @dataclass(frozen=True)
@@ -47,6 +61,32 @@ class CsvConfig:
     # The columns which should be there
     basic_cols: list[str] = \
         field(default_factory=lambda: ["Country Name", "Country Code"])
+    # Read the CSVs straight out of the raw zip files instead of
+    # the extracted copies
+    from_archives: bool = False
+    # Schema of the World Bank wide files: the id columns, one
+    # column per year and a trailing empty `Unnamed` column
+    id_cols: list[str] = field(default_factory=lambda: [
+        "Country Name", "Country Code", "Indicator Name", "Indicator Code"])
+    id_dtype: str = "str"  # or "category"
+    value_dtype: str = "float64"  # or "float32"
+    junk_prefix: str = "Unnamed"
+    parse_engine: str = "c"  # or "pyarrow", if installed
+
+    def wide_usecols(self, header: list[str]) -> list[str]:
+        """Names of the columns worth reading, without the junk"""
+        return [col for col in header
+                if col and not col.startswith(self.junk_prefix)]
+
+    def wide_dtypes(self, columns: list[str]) -> dict[str, str]:
+        """Explicit dtype of the id and the year columns"""
+        dtypes: dict[str, str] = {}
+        for col in columns:
+            if col in self.id_cols:
+                dtypes[col] = self.id_dtype
+            elif col.isdigit():
+                dtypes[col] = self.value_dtype
+        return dtypes
 
 
 @dataclass(frozen=True)
@@ -55,7 +95,110 @@ class SqlConfig:
     db_url: str = f"sqlite:///{PathConfig().project_root/'data'/'mydb.sqlite'}"
     queries_dir: Path = PathConfig().project_root / "sql" / "queries"
     snippets_dir: Path = PathConfig().project_root / "sql" / "snippets"
+    # DDL of the tables which are not derived from the CSV names
+    schema_path: Path = PathConfig().project_root / "sql" / "schema.sql"
     year_range: tuple[int, int] = (1960, 2026)
+    # The per-country data: "table" (a copy of the rows per country),
+    # or, when asked for, "view" (indexed wide tables and one view per
+    # country) or "batch" (the copies made in one transaction)
+    partition_mode: str = "table"
+    # Countries per progress report of the "batch" mode
+    partition_batch: int = 50
+    # Tables per UNION ALL statement of the country check (SQLite
+    # allows 500 compound SELECTs)
+    compound_limit: int = 400
+    # LRU sizes of the snippet registry (io_utils.SNIPPETS): the
+    # snippet files, and the whole statements the stages cache (the
+    # per-year SELECTs of each wide table, the country union)
+    snippet_cache: int = 64
+    render_cache: int = 4_096
+    # Set on every new SQLite connection of the shared engines
+    connect_pragmas: tuple[str, ...] = (
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        "temp_store=MEMORY",
+        "busy_timeout=5000",
+    )
+    # Writing the wide tables: "bulk" (executemany), "multi"
+    # (multi-row INSERT) or "default" (pandas per-row inserts)
+    load_method: str = "bulk"
+    chunksize: int = 10_000
+    # Set on the loading connection and restored afterwards
+    # (journal_mode is kept, WAL lets readers work during a load)
+    load_pragmas: tuple[str, ...] = (
+        "journal_mode=WAL",
+        "synchronous=OFF",
+        "cache_size=-200000",
+        "temp_store=MEMORY",
+    )
+
+
+@dataclass(frozen=True)
+class ParallelConfig:
+    """Number of worker processes of the parallel stages"""
+    unzip_workers: int = os.cpu_count() or 1
+    parse_workers: int = os.cpu_count() or 1
+    # Processes pivoting the wide tables into temporary files,
+    # 1 pivots them one by one in the main database
+    pivot_workers: int = os.cpu_count() or 1
+    # Parsed frames waiting for the SQLite writer
+    queue_size: int = 4
+
+
+@dataclass(frozen=True)
+class ColumnarConfig:
+    """The Parquet / Feather copies of the tables (needs pyarrow)"""
+    # "parquet" (compressed) or "feather" (uncompressed Arrow IPC,
+    # memory mapped without a copy when read)
+    file_format: str = "parquet"
+    parquet_compression: str = "zstd"
+    value_dtype: str = "float32"
+    year_dtype: str = "int16"
+
+
+@dataclass(frozen=True)
+class CubeConfig:
+    """The indicator × country × year array (cube.py)"""
+    dtype: str = "float32"
+    data_file: str = "cube.npy"
+    # the country, indicator and year axes
+    axes_file: str = "axes.json"
+
+
+@dataclass(frozen=True)
+class FeatureConfig:
+    """The country-year modelling matrix (features.py)"""
+    lags: tuple[int, ...] = (1, 2)
+    # year on year change, x[t] / x[t-1] - 1
+    growth: bool = True
+    # trailing means over these many years, the current one included
+    windows: tuple[int, ...] = (3, 5)
+    # values a window needs for its mean
+    min_periods: int = 2
+    # a 0/1 column per indicator, 1 where the value is missing
+    missing_mask: bool = True
+    dtype: str = "float32"
+
+
+@dataclass(frozen=True)
+class QueryConfig:
+    """The query API over the observations table (api/query.py)"""
+    # bytes of results kept by a QueryService
+    cache_bytes: int = 64 * 2**20
+
+
+@dataclass(frozen=True)
+class ServerConfig:
+    """The local HTTP server of the observations (api/server.py)"""
+    host: str = "127.0.0.1"
+    port: int = 8750
+    # read-only SQLite connections, one per request being served
+    pool_size: int = 8
+    # seconds a request waits for a free connection
+    pool_timeout: float = 30.0
+    busy_timeout_ms: int = 10_000
+    # rows per fetch, and per streamed chunk or Arrow batch
+    fetch_rows: int = 5_000
 
 
 @dataclass(frozen=True)
@@ -66,6 +209,12 @@ class Config:
     validd: ValidData = ValidData()
     csv: CsvConfig = CsvConfig()
     sql: SqlConfig = SqlConfig()
+    parallel: ParallelConfig = ParallelConfig()
+    columnar: ColumnarConfig = ColumnarConfig()
+    cube: CubeConfig = CubeConfig()
+    features: FeatureConfig = FeatureConfig()
+    query: QueryConfig = QueryConfig()
+    server: ServerConfig = ServerConfig()
 
 
 CFG = Config()
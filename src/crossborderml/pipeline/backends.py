@@ -0,0 +1,149 @@
+"""
+The database behind CFG.sql.db_url.
+
+All the stages reach the database through SQLAlchemy, so the URL
+picks the backend:
+    - "sqlite:///<file>": SQLite, the default.
+    - "duckdb:///<file>": an embedded DuckDB file (no server). The
+      wide frames are loaded as a whole instead of row by row, the
+      long tables are made with its native UNPIVOT, and its
+      queries run on all the cores.
+A backend holds the SQL which differs between the two: the long
+tables, the partition modes, the wide table loads and the clauses
+of sql/schema.sql DuckDB does not parse (`ddl`). With it the load,
+pivot, partition, observations, cube, features, columnar and
+query stages run on both; the HTTP server (api/server.py) opens
+SQLite files only and refuses any other URL.
+
+DuckDB is optional: pip install 'crossborderml[duckdb]' (duckdb and
+its SQLAlchemy dialect duckdb_engine).
+"""
+
+import importlib
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import make_url
+from sqlalchemy.engine import Connection, Engine
+
+from crossborderml.config import CFG
+from crossborderml.utils import db_utils, io_utils
+from crossborderml.pipeline.pivot_wide_to_long import PivotOneIndicator, \
+    create_long_table
+
+
+class SqliteBackend:
+    """SQLite: the stages' own SQL"""
+    name: str = "sqlite"
+    # The long tables can be built in worker processes
+    parallel_pivot: bool = True
+    partition_modes: tuple[str, ...] = ("view", "table", "batch")
+    # The "view" partition indexes "Country Code" in the wide tables
+    index_views: bool = True
+    # Clauses of sql/schema.sql the backend does not parse
+    unsupported_ddl: tuple[str, ...] = ()
+
+    def __init__(self, engine: Engine) -> None:
+        self.engine = engine
+        self.db_url: str = engine.url.render_as_string(hide_password=False)
+
+    def ddl(self, statement: str) -> str:
+        """A statement of sql/schema.sql as the backend takes it"""
+        for clause in self.unsupported_ddl:
+            statement = statement.replace(clause, "")
+        return statement
+
+    def create_long_table(self, wide_table: str) -> None:
+        """<Indicator>_long from <Indicator>_wide"""
+        create_long_table(wide_table, self.db_url)
+
+
+class DuckDbBackend(SqliteBackend):
+    """DuckDB: UNPIVOT and whole-frame loads"""
+    name = "duckdb"
+    # DuckDB runs one statement on all the cores already
+    parallel_pivot = False
+    # The bound :country_code of "batch" is SQLite syntax
+    partition_modes = ("view", "table")
+    # A filter is answered from the zone maps of the column
+    index_views = False
+    # A table layout of SQLite, DuckDB has no rowid tables
+    unsupported_ddl = ("WITHOUT ROWID",)
+
+    def create_long_table(self,
+                          wide_table: str,
+                          snipt_path: Path =
+                          CFG.sql.snippets_dir / "per_year_unpivot"
+                          ) -> None:
+        """
+        <Indicator>_long with UNPIVOT, in the row order of the
+        SQLite pivot
+        """
+        pivot = PivotOneIndicator(
+            wide_table, self.db_url, CFG.sql.snippets_dir / "per_year_select")
+        if not pivot.year_column:
+            raise ValueError(f"No year columns in '{wide_table}'")
+        sql_txt = io_utils.render_snippet(
+            snipt_path,
+            long_table=pivot.long_table,
+            wide_table=wide_table,
+            year_columns=", ".join(f'"{yr}"' for yr in pivot.year_column))
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(sql_txt)
+
+    @staticmethod
+    def write_wide_table(conn: Connection,
+                         table_name: str,
+                         df_i: pd.DataFrame
+                         ) -> None:
+        """Replace `table_name` with the frame, read by DuckDB as is"""
+        if conn.in_transaction():
+            conn.commit()
+        frame_name = f"_frame_{table_name}"
+        duck = conn.connection.driver_connection
+        duck.register(frame_name, df_i)
+        try:
+            with conn.begin():
+                conn.exec_driver_sql(
+                    f"CREATE OR REPLACE TABLE {table_name} AS "
+                    f"SELECT * FROM {frame_name}")
+        finally:
+            duck.unregister(frame_name)
+
+
+BACKENDS: dict[str, type[SqliteBackend]] = {
+    "sqlite": SqliteBackend,
+    "duckdb": DuckDbBackend,
+}
+
+
+def _require_duckdb() -> None:
+    """Import the DuckDB modules, or say how to get them"""
+    try:
+        importlib.import_module("duckdb")
+        importlib.import_module("duckdb_engine")
+    except ImportError as exc:
+        raise ImportError(
+            "A duckdb:/// database needs duckdb and duckdb_engine: "
+            "pip install 'crossborderml[duckdb]'") from exc
+
+
+def backend_for(engine: Engine) -> SqliteBackend:
+    """The backend of an engine"""
+    try:
+        return BACKENDS[engine.dialect.name](engine)
+    except KeyError:
+        raise ValueError(
+            f"No backend for '{engine.dialect.name}', expected one of "
+            f"{tuple(BACKENDS)}") from None
+
+
+def get_backend(db_url: str = CFG.sql.db_url) -> SqliteBackend:
+    """The backend of a database URL, on the shared engine"""
+    scheme = make_url(db_url).get_backend_name()
+    if scheme not in BACKENDS:
+        raise ValueError(
+            f"No backend for '{scheme}', expected one of {tuple(BACKENDS)}")
+    if scheme == "duckdb":
+        _require_duckdb()
+    return backend_for(db_utils.get_engine(db_url))
@@ -0,0 +1,265 @@
+"""
+Columnar copies of the tables, next to the SQLite database:
+
+    <columnar_dir>/long/indicator_code=<code>/part-0.<ext>
+        country_code (dictionary), year (int16), value (float32),
+        from the `observations` table
+    <columnar_dir>/wide/indicator_code=<code>/part-0.<ext>
+        the wide table, with dictionary encoded id columns and the
+        years as float32
+
+There is one file per indicator (hive partitioning), so reading a
+few indicators opens only their files, and only the asked columns
+are read. Parquet files are compressed; Feather files are written
+uncompressed and memory mapped when read, without a copy.
+
+pyarrow is optional (pip install 'crossborderml[columnar]'), it is
+imported only when one of these functions is called.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Iterable
+from urllib.parse import quote
+
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from crossborderml.config import CFG, ColumnarConfig
+from crossborderml.utils import db_utils, io_utils
+from crossborderml.pipeline.observations import OBSERVATIONS_TABLE
+
+# file_format -> (file extension, pyarrow.dataset format)
+FILE_FORMATS: dict[str, tuple[str, str]] = {
+    "parquet": ("parquet", "parquet"),
+    "feather": ("feather", "ipc"),
+}
+PARTITION_KEY: str = "indicator_code"
+# the country column of each kind, for the loader's filter
+COUNTRY_COLUMNS: dict[str, str] = {
+    "long": "country_code",
+    "wide": "Country Code",
+}
+
+
+def _pyarrow() -> ModuleType:
+    """Import pyarrow, or say how to get it"""
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise ImportError(
+            "The columnar files need pyarrow: "
+            "pip install 'crossborderml[columnar]'") from exc
+    return pyarrow
+
+
+def _check_format(file_format: str) -> None:
+    """self explanatory"""
+    if file_format not in FILE_FORMATS:
+        raise ValueError(
+            f"Unknown columnar format '{file_format}', expected one of "
+            f"{tuple(FILE_FORMATS)}")
+
+
+def long_to_arrow(df: pd.DataFrame, cfg: ColumnarConfig = CFG.columnar) -> Any:
+    """An observations frame of one indicator as an Arrow table"""
+    pa = _pyarrow()
+    return pa.table({
+        "country_code": pa.array(df["country_code"],
+                                 pa.string()).dictionary_encode(),
+        "year": pa.array(df["year"].to_numpy(cfg.year_dtype)),
+        "value": pa.array(df["value"].to_numpy(cfg.value_dtype),
+                          from_pandas=True),
+    })
+
+
+def wide_to_arrow(df: pd.DataFrame,
+                  cfg: ColumnarConfig = CFG.columnar,
+                  id_cols: list[str] | None = None
+                  ) -> Any:
+    """A wide frame as an Arrow table, other columns are dropped"""
+    pa = _pyarrow()
+    if id_cols is None:
+        id_cols = CFG.csv.id_cols
+    columns: dict[str, Any] = {}
+    for col in df.columns:
+        if col in id_cols:
+            columns[col] = pa.array(df[col], pa.string()).dictionary_encode()
+        elif col.isdigit():
+            columns[col] = pa.array(df[col].to_numpy(cfg.value_dtype),
+                                    from_pandas=True)
+    return pa.table(columns)
+
+
+def write_partition(table: Any,
+                    directory: Path,
+                    cfg: ColumnarConfig = CFG.columnar
+                    ) -> Path:
+    """
+    Write the file of one partition atomically; the temporary
+    file starts with '.', which the loader ignores.
+    """
+    _check_format(cfg.file_format)
+    _pyarrow()
+    # pylint: disable=import-outside-toplevel
+    from pyarrow import feather, parquet
+    extension, _ = FILE_FORMATS[cfg.file_format]
+    directory.mkdir(parents=True, exist_ok=True)
+    target = directory / f"part-0.{extension}"
+    fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=".part-0.")
+    os.close(fd)
+    try:
+        if cfg.file_format == "parquet":
+            parquet.write_table(
+                table, tmp_name, compression=cfg.parquet_compression)
+        else:
+            feather.write_feather(table, tmp_name, compression="uncompressed")
+        os.replace(tmp_name, target)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return target
+
+
+def partition_dir(root: Path, kind: str, indicator_code: str) -> Path:
+    """<root>/<kind>/indicator_code=<code>"""
+    return root / kind / f"{PARTITION_KEY}={quote(indicator_code, safe='')}"
+
+
+def _drop_stale(root: Path, kind: str, written: set[Path]) -> None:
+    """Remove the partitions of the indicators which are gone"""
+    kind_dir = root / kind
+    if not kind_dir.is_dir():
+        return
+    for path in kind_dir.iterdir():
+        if path.is_dir() and path not in written:
+            shutil.rmtree(path)
+
+
+def export_long(engine: Engine,
+                root: Path = CFG.paths.columnar_dir,
+                cfg: ColumnarConfig = CFG.columnar
+                ) -> int:
+    """
+    Write the long partitions from the observations table.
+
+    Returns:
+        number of rows written
+    """
+    if not inspect(engine).has_table(OBSERVATIONS_TABLE):
+        raise ValueError(
+            f"No `{OBSERVATIONS_TABLE}` table, build it first "
+            "(pipeline.observations)")
+    with engine.connect() as conn:
+        # the primary key order, no sort needed
+        df = pd.read_sql_query(text(
+            "SELECT indicator_code, country_code, year, value "
+            f"FROM {OBSERVATIONS_TABLE} "
+            "ORDER BY indicator_code, year, country_code"), conn)
+    written: set[Path] = set()
+    for code, df_i in df.groupby("indicator_code", sort=False):
+        directory = partition_dir(root, "long", str(code))
+        write_partition(long_to_arrow(df_i, cfg), directory, cfg)
+        written.add(directory)
+    _drop_stale(root, "long", written)
+    return len(df)
+
+
+def export_wide(engine: Engine,
+                root: Path = CFG.paths.columnar_dir,
+                cfg: ColumnarConfig = CFG.columnar,
+                tables_path: Path = CFG.sql.queries_dir / "tables_name.sql"
+                ) -> int:
+    """
+    Write a partition for each wide table.
+
+    Returns:
+        number of rows written
+    """
+    with engine.connect() as conn:
+        wide_tables = [row[0] for row in conn.execute(
+            text(io_utils.get_snippet(tables_path)))]
+    written: set[Path] = set()
+    n_rows: int = 0
+    for wide_table in sorted(wide_tables):
+        with engine.connect() as conn:
+            df_i = pd.read_sql_query(
+                text(f"SELECT * FROM {wide_table}"), conn)
+        codes = df_i.get("Indicator Code", pd.Series(dtype=object)).dropna()
+        if codes.empty:
+            print(f"- Table: {wide_table} has no indicator code, skipped")
+            continue
+        directory = partition_dir(root, "wide", str(codes.iloc[0]))
+        write_partition(wide_to_arrow(df_i, cfg), directory, cfg)
+        written.add(directory)
+        n_rows += len(df_i)
+    _drop_stale(root, "wide", written)
+    return n_rows
+
+
+def export_columnar(db_url: str = CFG.sql.db_url,
+                    root: Path = CFG.paths.columnar_dir,
+                    cfg: ColumnarConfig = CFG.columnar
+                    ) -> dict[str, int]:
+    """
+    Write the long and the wide partitions.
+
+    Returns:
+        {kind: number of rows written}
+    """
+    _check_format(cfg.file_format)
+    _pyarrow()
+    engine: Engine = db_utils.get_engine(db_url)
+    rows = {"long": export_long(engine, root, cfg),
+            "wide": export_wide(engine, root, cfg)}
+    for kind, n_rows in rows.items():
+        print(f"[OK] {kind}: {n_rows} rows  →  {root / kind}")
+    return rows
+
+
+def read_columnar(kind: str = "long",
+                  indicators: Iterable[str] | None = None,
+                  columns: list[str] | None = None,
+                  countries: Iterable[str] | None = None,
+                  root: Path = CFG.paths.columnar_dir,
+                  file_format: str = CFG.columnar.file_format
+                  ) -> Any:
+    """
+    Read the columnar files as an Arrow table. Only the files of
+    `indicators` and only `columns` are read; the files are memory
+    mapped. The partition column `indicator_code` is added.
+    """
+    _check_format(file_format)
+    if kind not in COUNTRY_COLUMNS:
+        raise ValueError(
+            f"Unknown kind '{kind}', expected one of "
+            f"{tuple(COUNTRY_COLUMNS)}")
+    _pyarrow()
+    # pylint: disable=import-outside-toplevel
+    from pyarrow import dataset, fs
+    data = dataset.dataset(
+        str(root / kind),
+        format=FILE_FORMATS[file_format][1],
+        partitioning="hive",
+        filesystem=fs.LocalFileSystem(use_mmap=True))
+    condition = None
+    if indicators is not None:
+        condition = dataset.field(PARTITION_KEY).isin(list(indicators))
+    if countries is not None:
+        by_country = dataset.field(COUNTRY_COLUMNS[kind]).isin(list(countries))
+        condition = by_country if condition is None \
+            else condition & by_country
+    return data.to_table(columns=columns, filter=condition)
+
+
+def read_frame(kind: str = "long", **kwargs: Any) -> pd.DataFrame:
+    """`read_columnar` as a DataFrame"""
+    return read_columnar(kind, **kwargs).to_pandas()
+
+
+if __name__ == '__main__':
+    export_columnar()
@@ -0,0 +1,186 @@
+"""
+All the indicators as one array, next to the SQLite database:
+
+    <cube_dir>/cube.npy    float32, shape (indicator, country, year),
+                           NaN where there is no observation
+    <cube_dir>/axes.json   {"indicators": [...], "countries": [...],
+                            "years": [first, ..., last]}
+
+The cube is built with a single query of the `observations` table.
+`load_cube` maps the file read only (np.load with mmap_mode), so
+nothing is copied until it is touched, and processes loading the
+same file share the pages of the OS cache. Slicing one indicator,
+or one indicator and country, gives a view; the years are a
+contiguous range, so a year is found by arithmetic.
+"""
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from crossborderml.config import CFG, CubeConfig
+from crossborderml.utils import db_utils
+from crossborderml.utils.io_utils import replace_atomically
+from crossborderml.pipeline.observations import OBSERVATIONS_TABLE
+
+
+@dataclass(frozen=True)
+class Cube:
+    """The array and its axes"""
+    data: np.ndarray
+    indicators: list[str]
+    countries: list[str]
+    years: list[int]
+
+    def __post_init__(self) -> None:
+        expected = (len(self.indicators), len(self.countries), len(self.years))
+        if self.data.shape != expected:
+            raise ValueError(
+                f"Cube of shape {self.data.shape} does not match its axes "
+                f"{expected}")
+
+    @staticmethod
+    def _positions(axis: list[str], keys: Iterable[str], name: str
+                   ) -> list[int]:
+        """self explanatory"""
+        lookup = {key: i for i, key in enumerate(axis)}
+        try:
+            return [lookup[key] for key in keys]
+        except KeyError as exc:
+            raise KeyError(f"Unknown {name} {exc.args[0]!r}") from None
+
+    def year_slice(self, start: int | None = None, stop: int | None = None
+                   ) -> slice:
+        """The years start..stop-1 as a slice of the last axis"""
+        first = self.years[0] if self.years else 0
+        return slice(None if start is None else max(0, start - first),
+                     None if stop is None else max(0, stop - first))
+
+    def indicator(self, code: str) -> np.ndarray:
+        """country × year of one indicator, a view"""
+        return self.data[self._positions(self.indicators, [code],
+                                         "indicator")[0]]
+
+    def series(self, code: str, country: str) -> np.ndarray:
+        """The years of one indicator and country, a view"""
+        i = self._positions(self.indicators, [code], "indicator")[0]
+        j = self._positions(self.countries, [country], "country")[0]
+        return self.data[i, j]
+
+    def select(self,
+               indicators: Iterable[str] | None = None,
+               countries: Iterable[str] | None = None,
+               years: tuple[int, int] | None = None
+               ) -> np.ndarray:
+        """
+        A sub-cube; `years` is a (start, stop) range. Picking
+        indicators or countries copies the picked rows.
+        """
+        out = self.data
+        if years is not None:
+            out = out[..., self.year_slice(*years)]
+        if indicators is not None:
+            out = out[self._positions(self.indicators, indicators,
+                                      "indicator")]
+        if countries is not None:
+            out = out[:, self._positions(self.countries, countries,
+                                         "country")]
+        return out
+
+
+def frame_to_cube(df: pd.DataFrame, dtype: str = CFG.cube.dtype) -> Cube:
+    """
+    Scatter the observations rows (indicator_code, country_code,
+    year, value) into a cube, the axes sorted.
+    """
+    indicators = pd.Categorical(df["indicator_code"])
+    countries = pd.Categorical(df["country_code"])
+    years = df["year"].to_numpy(np.int64)
+    if len(years):
+        first, last = int(years.min()), int(years.max())
+    else:
+        first, last = 0, -1
+    data = np.full((len(indicators.categories), len(countries.categories),
+                    last - first + 1), np.nan, dtype=dtype)
+    data[indicators.codes, countries.codes, years - first] = \
+        df["value"].to_numpy(dtype, na_value=np.nan)
+    return Cube(data=data,
+                indicators=[str(c) for c in indicators.categories],
+                countries=[str(c) for c in countries.categories],
+                years=list(range(first, last + 1)))
+
+
+def read_observations(engine: Engine) -> pd.DataFrame:
+    """The whole observations table"""
+    if not inspect(engine).has_table(OBSERVATIONS_TABLE):
+        raise ValueError(
+            f"No `{OBSERVATIONS_TABLE}` table, build it first "
+            "(pipeline.observations)")
+    with engine.connect() as conn:
+        return pd.read_sql_query(text(
+            "SELECT indicator_code, country_code, year, value "
+            f"FROM {OBSERVATIONS_TABLE}"), conn)
+
+
+def save_cube(cube: Cube,
+              root: Path = CFG.paths.cube_dir,
+              cfg: CubeConfig = CFG.cube
+              ) -> Path:
+    """
+    Write the array and its axes, each file atomically. The array
+    goes first, so the axes file is never newer than the array it
+    describes.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+
+    def write_data(path: Path) -> None:
+        with open(path, "wb") as f_out:
+            np.save(f_out, cube.data, allow_pickle=False)
+
+    def write_axes(path: Path) -> None:
+        path.write_text(json.dumps({
+            "indicators": cube.indicators,
+            "countries": cube.countries,
+            "years": cube.years,
+        }), encoding="utf-8")
+
+    replace_atomically(root / cfg.data_file, write_data)
+    replace_atomically(root / cfg.axes_file, write_axes)
+    return root / cfg.data_file
+
+
+def build_cube(db_url: str = CFG.sql.db_url,
+               root: Path = CFG.paths.cube_dir,
+               cfg: CubeConfig = CFG.cube
+               ) -> Cube:
+    """Build the cube from the observations table and save it"""
+    engine: Engine = db_utils.get_engine(db_url)
+    cube = frame_to_cube(read_observations(engine), cfg.dtype)
+    path = save_cube(cube, root, cfg)
+    n_values = int(np.count_nonzero(~np.isnan(cube.data)))
+    print(f"[OK] cube {cube.data.shape}, {n_values} values  →  {path}")
+    return cube
+
+
+def load_cube(root: Path = CFG.paths.cube_dir,
+              cfg: CubeConfig = CFG.cube,
+              mmap_mode: str | None = "r"
+              ) -> Cube:
+    """Map the saved cube, read only; mmap_mode=None reads it in memory"""
+    axes = json.loads((root / cfg.axes_file).read_text(encoding="utf-8"))
+    data = np.load(root / cfg.data_file, mmap_mode=mmap_mode,
+                   allow_pickle=False)
+    return Cube(data=data,
+                indicators=axes["indicators"],
+                countries=axes["countries"],
+                years=axes["years"])
+
+
+if __name__ == '__main__':
+    build_cube()
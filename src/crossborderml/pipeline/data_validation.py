@@ -6,20 +6,35 @@ from pathlib import Path
 
 import pandas as pd
 
-from crossborderml.config import CFG
-from crossborderml.utils.io_utils import FileFinder
+from crossborderml.config import CFG, CsvConfig
+from crossborderml.utils.io_utils import ArchiveMember, FileFinder, \
+    locate_header, read_csv
+
+
+# dtypes pd.read_csv gives the wide files without being told
+INFERRED_DTYPES: tuple[str, ...] = ("float64", "str")
 
 
 class ReadCsv:
     """
     Read a CSV file (with a given number of header rows)
-    into a DataFrame.
+    into a DataFrame. The file may also be a member of a zip
+    archive.
+    With a `schema`, the junk columns are never read and the id
+    and year columns get explicit dtypes instead of inferred ones.
     """
     # pylint: disable=too-few-public-methods
-    def __init__(self, file_path: Path, header_rows: int) -> None:
+    def __init__(self,
+                 file_path: Path | ArchiveMember,
+                 header_rows: int,
+                 schema: CsvConfig | None = None
+                 ) -> None:
         try:
-            self.df: pd.DataFrame = \
-                pd.read_csv(file_path, header=header_rows)
+            if schema is None:
+                self.df: pd.DataFrame = \
+                    read_csv(file_path, header=header_rows)
+            else:
+                self.df = self._read_typed(file_path, header_rows, schema)
         except PermissionError as exc:
             raise PermissionError(
                 f"Permission Error in loading {file_path}"
@@ -41,6 +56,34 @@ class ReadCsv:
                 f"Unexpected parameters in loading {file_path}"
                 ) from exc
 
+    @staticmethod
+    def _read_typed(file_path: Path | ArchiveMember,
+                    header_rows: int,
+                    schema: CsvConfig
+                    ) -> pd.DataFrame:
+        """Read the header line alone, then only the useful columns"""
+        line, header = locate_header(file_path, header_rows)
+        usecols = schema.wide_usecols(header)
+        dtypes = schema.wide_dtypes(usecols)
+        # The parser is much slower with a dtype per column, so the
+        # dtypes it infers by itself are only checked afterwards
+        forced = {col: dtype for col, dtype in dtypes.items()
+                  if dtype not in INFERRED_DTYPES}
+        df = read_csv(file_path,
+                      # pyarrow skips the blank lines of the preamble
+                      # only after counting them
+                      header=line if schema.parse_engine == "pyarrow"
+                      else header_rows,
+                      usecols=usecols,
+                      dtype=forced or None,
+                      engine=schema.parse_engine)
+        for col, dtype in dtypes.items():
+            if dtype == "float64" and df[col].dtype != dtype:
+                if not pd.api.types.is_numeric_dtype(df[col]):
+                    raise ValueError(f"Column {col} is not numeric")
+                df[col] = df[col].astype(dtype)
+        return df
+
 
 class ValidateCsv:
     """Assert CSV data"""
@@ -62,16 +105,19 @@ class ValidateCsv:
             raise AssertionError(f"Missing columns: {missing}")
 
 
-def main() -> None:
+def main(from_archives: bool = CFG.csv.from_archives) -> None:
     """Self explanatory"""
     get_files: FileFinder = FileFinder(
-        directory=CFG.paths.extracted_data_dir,
+        directory=CFG.paths.raw_data_dir if from_archives
+        else CFG.paths.extracted_data_dir,
         prefix=CFG.validd.file_prefix,
+        extension=CFG.validd.file_extentions if from_archives else "",
+        in_archives=from_archives,
         )
 
-    csv_files: set[Path] = get_files.get_file_paths()
+    csv_files: set[Path] | set[ArchiveMember] = get_files.get_file_paths()
     for fpath in csv_files:
-        csv = ReadCsv(fpath, CFG.csv.header_rows)
+        csv = ReadCsv(fpath, CFG.csv.header_rows, CFG.csv)
         valid_df = ValidateCsv(csv.df)
         valid_df.assert_cols(CFG.csv.basic_cols)
 
@@ -3,11 +3,38 @@ Download the resuested file and save it as a zip file
 """
 
 
+import os
+import time
+import tempfile
 from typing import TextIO, Callable
 from pathlib import Path
 import requests
+from requests.adapters import HTTPAdapter
 
 from crossborderml.config import CFG
+from crossborderml.pipeline.manifest import DownloadManifest
+
+
+def pooled_session(pool_size: int) -> requests.Session:
+    """
+    Return a session whose connection pool is large enough to be
+    shared by `pool_size` concurrent downloads.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def format_rate(n_bytes: int, seconds: float) -> str:
+    """Return a human readable transfer rate"""
+    rate = n_bytes / seconds if seconds > 0 else float(n_bytes)
+    for unit in ("B/s", "KB/s", "MB/s"):
+        if rate < 1024:
+            return f"{rate:.1f} {unit}"
+        rate /= 1024
+    return f"{rate:.1f} GB/s"
 
 
 class IndicatorDownloader:
@@ -18,10 +45,16 @@ class IndicatorDownloader:
             dest_dir: Path,
             logger: TextIO,
             session: requests.Session | None = None,
+            stream: bool = False,
+            chunk_size: int = CFG.urls.chunk_size,
+            manifest: DownloadManifest | None = None,
             ) -> None:
         self.dest_dir = dest_dir
         self.logger = logger
         self.session = session or requests.Session()
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.manifest = manifest
 
     def download(
             self,
@@ -31,17 +64,90 @@ class IndicatorDownloader:
             CFG.urls.world_bank_indicator_url,
             timeout: float = CFG.urls.timeout,
             ) -> bool:
-        """Attempt to download"""
+        """
+        Attempt to download. With a manifest, the request is
+        conditional and an unchanged archive is not fetched again.
+        """
         url = url_builder(code)
         self.logger.write(f"\nDownloading '{name}' from:  \n{url}  \n")
+        kwargs: dict = {}
+        if self.stream:
+            kwargs["stream"] = True
+        if self.manifest is not None:
+            headers = self.manifest.conditional_headers(
+                name, self.dest_dir / f"{name}.zip")
+            if headers:
+                kwargs["headers"] = headers
         try:
-            resp = self.session.get(url, timeout=timeout)
+            resp = self.session.get(url, timeout=timeout, **kwargs)
             resp.raise_for_status()
         except requests.RequestException as exc:
             self.logger.write(f"Fetch failed for {name}:\n {exc}")
             return False
 
-        return self.save_zip(name, resp.content)
+        if resp.status_code == 304:
+            resp.close()
+            self.logger.write(f"'{name}' not modified, kept the local copy\n")
+            return True
+
+        if self.stream:
+            saved = self.save_stream(name, resp)
+        else:
+            saved = self.save_zip(name, resp.content)
+        if saved and self.manifest is not None:
+            changed = self.manifest.record(
+                name, code, self.dest_dir / f"{name}.zip",
+                etag=resp.headers.get("ETag"),
+                last_modified=resp.headers.get("Last-Modified"))
+            if not changed:
+                self.logger.write(f"'{name}' content is unchanged\n")
+        return saved
+
+    def save_stream(
+            self,
+            name: str,
+            resp: requests.Response
+            ) -> bool:
+        """
+        Write the response body chunk by chunk into a temporary
+        file in the destination directory and atomically rename
+        it to `<name>.zip`, so peak memory is one chunk and a
+        failed transfer never leaves a truncated archive behind.
+        """
+        tmp_path: Path | None = None
+        try:
+            self.dest_dir.mkdir(parents=True, exist_ok=True)
+            path = self.dest_dir / f"{name}.zip"
+            size: int = 0
+            start = time.perf_counter()
+            with tempfile.NamedTemporaryFile(
+                    dir=self.dest_dir, prefix=f".{name}.", suffix=".part",
+                    delete=False) as tmp:
+                tmp_path = Path(tmp.name)
+                for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                    if chunk:
+                        tmp.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp_path, path)
+            tmp_path = None
+            elapsed = time.perf_counter() - start
+            self.logger.write(
+                f"Saved '{name}' to {path} "
+                f"({size} bytes, {format_rate(size, elapsed)})  \n")
+            return True
+        except requests.RequestException as exc:
+            self.logger.write(f"Fetch failed for {name}:\n {exc}")
+        except PermissionError:
+            self.logger.write(f"Permission denied saving {name}")
+        except FileNotFoundError:
+            self.logger.write(f"Invalid path for {name}")
+        except OSError as exc:
+            self.logger.write(f"OS error saving {name}: {exc}")
+        finally:
+            resp.close()
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+        return False
 
     def save_zip(
             self,
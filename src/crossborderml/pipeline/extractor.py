@@ -0,0 +1,101 @@
+"""
+Extract the indicator CSVs out of the archives.
+
+Only the members whose name starts with the given prefix are
+written (the Metadata_* files are never read by the pipeline),
+and a member is skipped when the file on disk already has the
+same size and CRC. Archives are handled in a process pool.
+"""
+
+import zlib
+import zipfile
+from pathlib import Path
+from itertools import repeat
+from dataclasses import dataclass, field
+
+from crossborderml.config import CFG
+from crossborderml.utils.pool_utils import process_pool
+
+
+@dataclass
+class ExtractResult:
+    """What happened to one archive"""
+    zip_path: Path
+    extracted: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    error: str | None = None
+
+    @property
+    def members(self) -> list[str]:
+        """All the selected members, written or already up to date"""
+        return self.extracted + self.skipped
+
+
+def _crc32(path: Path, chunk_size: int = 1 << 16) -> int:
+    """CRC-32 of a file, the same checksum zip stores per member"""
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _is_current(info: zipfile.ZipInfo, target: Path) -> bool:
+    """True if `target` already holds the content of the member"""
+    return target.is_file() and \
+        target.stat().st_size == info.file_size and \
+        _crc32(target) == info.CRC
+
+
+def extract_selected(
+        zip_path: Path,
+        extract_dir: Path,
+        prefix: str = CFG.validd.file_prefix
+        ) -> ExtractResult:
+    """
+    Extract the members of one archive starting with `prefix`
+    into `extract_dir`. Errors are returned, not raised, so a
+    bad archive does not stop the pool.
+    """
+    result = ExtractResult(zip_path)
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not info.filename.startswith(prefix):
+                    continue
+                if _is_current(info, extract_dir / info.filename):
+                    result.skipped.append(info.filename)
+                else:
+                    zf.extract(info, extract_dir)
+                    result.extracted.append(info.filename)
+    except zipfile.BadZipFile:
+        result.error = f"Bad zip file: {zip_path}"
+    except PermissionError:
+        result.error = f"Permission denied extracting: {zip_path}"
+    except OSError as exc:
+        result.error = f"File error with `{zip_path}`: {exc}"
+    return result
+
+
+def extract_all(
+        zip_paths: list[Path],
+        extract_dir: Path,
+        prefix: str = CFG.validd.file_prefix,
+        max_workers: int = CFG.parallel.unzip_workers
+        ) -> list[ExtractResult]:
+    """
+    Run `extract_selected` over all the archives, in a process
+    pool if more than one worker is asked for.
+
+    Returns:
+        One result per archive, in the order of `zip_paths`
+    """
+    extract_dir.mkdir(parents=True, exist_ok=True)
+    if max_workers <= 1 or len(zip_paths) <= 1:
+        return [extract_selected(p, extract_dir, prefix) for p in zip_paths]
+    with process_pool(max_workers,
+                      ("crossborderml.pipeline.extractor",)) as pool:
+        return list(pool.map(extract_selected,
+                             zip_paths,
+                             repeat(extract_dir),
+                             repeat(prefix)))
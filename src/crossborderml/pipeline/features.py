@@ -0,0 +1,246 @@
+"""
+The modelling matrix of the FDI growth model: a row per
+(country, year) and, for each indicator, the columns
+
+    <code>            the value
+    <code>_lag<k>     the value k years before, for k in CFG.features.lags
+    <code>_yoy        year on year growth, x[t] / x[t-1] - 1
+    <code>_mean<w>    mean of the last w years, the current one included
+    <code>_missing    1.0 where the value is missing, else 0.0
+
+The observations are scattered into an (indicator, country, year)
+array (cube.frame_to_cube) and each feature is computed on the whole
+array along its year axis: a lag is a shifted slice, a rolling mean
+a difference of cumulative sums which skips the missing years. Each
+result is then laid out as a block of columns, without a loop over
+the countries or the indicators.
+
+The matrix is cached in CFG.paths.features_dir as
+features_<key>.npy and features_<key>.json (columns and axes). The
+key hashes the version stamp of the observations table
+(_table_versions) and CFG.features, so a rebuilt table or another
+configuration makes a new matrix; the older files are removed.
+"""
+
+import json
+import hashlib
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from crossborderml.config import CFG, FeatureConfig
+from crossborderml.utils import db_utils
+from crossborderml.utils.io_utils import replace_atomically
+from crossborderml.pipeline.cube import Cube, frame_to_cube, \
+    read_observations
+from crossborderml.pipeline.observations import OBSERVATIONS_TABLE
+
+
+@dataclass(frozen=True)
+class FeatureMatrix:
+    """The features, a row per (country, year), countries first"""
+    data: np.ndarray
+    columns: list[str]
+    # the first columns hold their values
+    indicators: list[str]
+    countries: list[str]
+    years: list[int]
+    key: str = ""
+
+    def __post_init__(self) -> None:
+        expected = (len(self.countries) * len(self.years), len(self.columns))
+        if self.data.shape != expected:
+            raise ValueError(
+                f"Matrix of shape {self.data.shape} does not match its "
+                f"axes {expected}")
+
+    def index(self) -> pd.MultiIndex:
+        """self explanatory"""
+        return pd.MultiIndex.from_product([self.countries, self.years],
+                                          names=["country_code", "year"])
+
+    def to_frame(self, dropna: bool = True) -> pd.DataFrame:
+        """
+        The matrix as a DataFrame; with `dropna` the country-years
+        without any observed value are left out.
+        """
+        df = pd.DataFrame(np.asarray(self.data), index=self.index(),
+                          columns=self.columns)
+        if dropna:
+            values = df.iloc[:, :len(self.indicators)]
+            df = df[values.notna().any(axis=1).to_numpy()]
+        return df
+
+
+def shift_years(values: np.ndarray, k: int) -> np.ndarray:
+    """The value k years before, NaN for the first k years"""
+    out = np.full_like(values, np.nan)
+    if k < values.shape[-1]:
+        out[..., k:] = values[..., :values.shape[-1] - k]
+    return out
+
+
+def growth(values: np.ndarray) -> np.ndarray:
+    """x[t] / x[t-1] - 1, NaN where x[t-1] is missing or zero"""
+    previous = shift_years(values, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = values / previous - 1
+    out[previous == 0] = np.nan
+    return out
+
+
+def rolling_mean(values: np.ndarray, window: int, min_periods: int = 1
+                 ) -> np.ndarray:
+    """
+    Mean of the observed values of the last `window` years, the
+    current one included; NaN with fewer than `min_periods` values.
+    """
+    observed = ~np.isnan(values)
+    # float64 sums, so the differences keep their precision
+    sums = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,))
+    np.cumsum(np.where(observed, values, 0.0), axis=-1, out=sums[..., 1:])
+    counts = np.zeros(sums.shape, dtype=np.int32)
+    np.cumsum(observed, axis=-1, out=counts[..., 1:])
+    stop = np.arange(1, values.shape[-1] + 1)
+    start = np.maximum(stop - window, 0)
+    n = counts[..., stop] - counts[..., start]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = (sums[..., stop] - sums[..., start]) / n
+    out[n < max(min_periods, 1)] = np.nan
+    return out.astype(values.dtype)
+
+
+def feature_blocks(cfg: FeatureConfig) -> list[str]:
+    """The column suffixes, one block of indicators each"""
+    blocks = [""] + [f"_lag{k}" for k in cfg.lags]
+    if cfg.growth:
+        blocks.append("_yoy")
+    blocks += [f"_mean{w}" for w in cfg.windows]
+    if cfg.missing_mask:
+        blocks.append("_missing")
+    return blocks
+
+
+def cube_features(cube: Cube, cfg: FeatureConfig = CFG.features
+                  ) -> FeatureMatrix:
+    """The features of all the indicators of a cube"""
+    values = np.asarray(cube.data, dtype=cfg.dtype)
+    n_ind, n_cty, n_year = values.shape
+    blocks = feature_blocks(cfg)
+    data = np.empty((n_cty * n_year, n_ind * len(blocks)), dtype=cfg.dtype)
+
+    def put(position: int, block: np.ndarray) -> None:
+        # (indicator, country, year) -> rows (country, year) × indicator
+        data[:, position * n_ind:(position + 1) * n_ind] = \
+            block.transpose(1, 2, 0).reshape(-1, n_ind)
+
+    position = 0
+    put(position, values)
+    for k in cfg.lags:
+        position += 1
+        put(position, shift_years(values, k))
+    if cfg.growth:
+        position += 1
+        put(position, growth(values))
+    for window in cfg.windows:
+        position += 1
+        put(position, rolling_mean(values, window, cfg.min_periods))
+    if cfg.missing_mask:
+        position += 1
+        put(position, np.isnan(values))
+    return FeatureMatrix(
+        data=data,
+        columns=[f"{code}{suffix}" for suffix in blocks
+                 for code in cube.indicators],
+        indicators=list(cube.indicators),
+        countries=list(cube.countries),
+        years=list(cube.years))
+
+
+def cache_key(stamp: str, cfg: FeatureConfig = CFG.features) -> str:
+    """Hash of the data version and of the feature configuration"""
+    payload = json.dumps({"observations": stamp, "features": asdict(cfg)},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def save_features(matrix: FeatureMatrix,
+                  root: Path = CFG.paths.features_dir
+                  ) -> Path:
+    """
+    Write the matrix and its axes, the axes last, so a matrix is
+    complete once its JSON file exists; other keys are removed.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    data_path = root / f"features_{matrix.key}.npy"
+    axes_path = data_path.with_suffix(".json")
+
+    def write_data(path: Path) -> None:
+        with open(path, "wb") as f_out:
+            np.save(f_out, matrix.data, allow_pickle=False)
+
+    def write_axes(path: Path) -> None:
+        path.write_text(json.dumps({
+            "key": matrix.key,
+            "columns": matrix.columns,
+            "indicators": matrix.indicators,
+            "countries": matrix.countries,
+            "years": matrix.years,
+        }), encoding="utf-8")
+
+    replace_atomically(data_path, write_data)
+    replace_atomically(axes_path, write_axes)
+    for old in root.glob("features_*"):
+        if old.stem != data_path.stem:
+            old.unlink(missing_ok=True)
+    return data_path
+
+
+def load_features(key: str,
+                  root: Path = CFG.paths.features_dir,
+                  mmap_mode: str | None = "r"
+                  ) -> FeatureMatrix | None:
+    """The cached matrix of `key`, mapped read only; None if absent"""
+    axes_path = root / f"features_{key}.json"
+    if not axes_path.is_file():
+        return None
+    axes = json.loads(axes_path.read_text(encoding="utf-8"))
+    data = np.load(axes_path.with_suffix(".npy"), mmap_mode=mmap_mode,
+                   allow_pickle=False)
+    return FeatureMatrix(data=data, columns=axes["columns"],
+                         indicators=axes["indicators"],
+                         countries=axes["countries"], years=axes["years"],
+                         key=key)
+
+
+def build_features(db_url: str = CFG.sql.db_url,
+                   root: Path = CFG.paths.features_dir,
+                   cfg: FeatureConfig = CFG.features,
+                   force: bool = False
+                   ) -> FeatureMatrix:
+    """
+    The feature matrix of the observations table, from the cache
+    unless the table or the configuration changed (or `force`).
+    """
+    engine: Engine = db_utils.get_engine(db_url)
+    # the stamp is read before the rows, so the rows are never older
+    with engine.connect() as conn:
+        stamp = db_utils.table_stamp(conn, OBSERVATIONS_TABLE)
+    key = cache_key(stamp, cfg)
+    if not force:
+        cached = load_features(key, root)
+        if cached is not None:
+            print(f"- Features {key} are up to date")
+            return cached
+    cube = frame_to_cube(read_observations(engine), cfg.dtype)
+    matrix = replace(cube_features(cube, cfg), key=key)
+    path = save_features(matrix, root)
+    print(f"[OK] features {matrix.data.shape}  →  {path}")
+    return matrix
+
+
+if __name__ == '__main__':
+    build_features()
@@ -2,27 +2,77 @@
 Download data from the sources and unzip them if needed
 """
 
+import io
 from typing import TextIO
 from pathlib import Path
 from datetime import datetime
-import zipfile
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import yaml
 
 from crossborderml.config import CFG
+from crossborderml.utils import instrument
 from crossborderml.utils.io_utils import load_yaml
-from crossborderml.pipeline.downloader import IndicatorDownloader
+from crossborderml.pipeline.downloader import IndicatorDownloader, \
+    pooled_session
+from crossborderml.pipeline.manifest import DownloadManifest
+from crossborderml.pipeline.extractor import extract_all
+
+
+def _download_one(
+        name: str,
+        code: str,
+        dest_dir: Path,
+        session: requests.Session,
+        stream: bool = CFG.urls.stream,
+        manifest: DownloadManifest | None = None,
+        ) -> tuple[bool, str]:
+    """
+    Download a single indicator into its own log buffer, so the
+    workers never interleave their lines in the shared log.
+
+    Returns:
+        (success flag, log text of this download)
+    """
+    buffer = io.StringIO()
+    dl = IndicatorDownloader(
+        dest_dir=dest_dir, logger=buffer, session=session, stream=stream,
+        manifest=manifest)
+    with instrument.unit(name) as record:
+        try:
+            ok = dl.download(name, code)
+        except (requests.exceptions.RequestException, OSError) as exc:
+            buffer.write(f"Error downloading '{name}': {exc}\n")
+            ok = False
+        archive = dest_dir / f"{name}.zip"
+        if ok and archive.exists():
+            record.bytes_written = archive.stat().st_size
+    return ok, buffer.getvalue()
 
 
 def run_download(
         indicators_path: Path = CFG.paths.indicator_yaml,
         dest_dir: Path = CFG.paths.raw_data_dir,
-        readme_path: Path = CFG.paths.data_readme
+        readme_path: Path = CFG.paths.data_readme,
+        max_workers: int = CFG.urls.max_workers,
+        session: requests.Session | None = None,
+        stream: bool = CFG.urls.stream,
+        manifest: DownloadManifest | None = None,
         ) -> None:
-    """Download the files selected in indicators.yaml and log results."""
+    """
+    Download the files selected in indicators.yaml and log results.
+
+    Up to `max_workers` indicators are fetched at the same time over
+    one pooled session; the log is still written in the order of
+    indicators.yaml. With `stream` the archives are written to disk
+    in chunks rather than held in memory. With a `manifest` the
+    requests are conditional, so unchanged archives are skipped.
+    """
 
     success_count: int = 0
     failure_count: int = 0
+    failed: list[str] = []
+    max_workers = max(1, max_workers)
 
     with open(readme_path, 'a', encoding='utf-8') as log:
         log.write(f'\n## [{datetime.now()}]:\n')
@@ -34,34 +84,65 @@ def run_download(
                 yaml.YAMLError, KeyError) as exc:
             log.write(f"Failed to load indicators: {exc}\n")
             return
-        dl = IndicatorDownloader(dest_dir=dest_dir, logger=log)
-        for name, code in indicators.items():
-            try:
-                ok = dl.download(name, code)
+        session = session or pooled_session(max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                name: pool.submit(
+                    _download_one, name, code, dest_dir, session, stream,
+                    manifest)
+                for name, code in indicators.items()
+            }
+            # Collect in the yaml order to keep the log readable
+            for name, future in futures.items():
+                ok, text = future.result()
+                log.write(text)
                 if ok:
                     success_count += 1
                 else:
                     failure_count += 1
-            except (requests.exceptions.RequestException, OSError) as exc:
-                log.write(f"Error downloading '{name}': {exc}\n")
-                failure_count += 1
+                    failed.append(name)
 
         log.write(f"\nDownload complete. {success_count} succeeded, "
                   f"{failure_count} failed.\n")
+        if failed:
+            log.write(f"Failed indicators: {failed}\n")
+        if manifest is not None:
+            manifest.save()
+
+
+def _is_extracted(
+        zip_path: Path,
+        extract_dir: Path,
+        manifest: DownloadManifest
+        ) -> bool:
+    """
+    True if the manifest says this archive was already unzipped and
+    its CSV files are still in `extract_dir`.
+    """
+    members = manifest.get_members(zip_path.stem)
+    return (not manifest.is_changed(zip_path.stem, "unzip")
+            and bool(members)
+            and all((extract_dir / m).exists() for m in members))
 
 
 def _unzip_all_zips(
         zip_dir: Path,
         log: TextIO,
-        extract_dir: Path
+        extract_dir: Path,
+        manifest: DownloadManifest | None = None,
+        max_workers: int = CFG.parallel.unzip_workers,
         ) -> None:
     """
-    Unzips all .zip files in the given directory to `extract_dir`.
+    Unzips the indicator CSVs of all .zip files in the given
+    directory to `extract_dir`, `max_workers` archives at a time.
 
     Args:
         zip_dir: Path to the directory containing .zip files.
         extract_dir: Destination directory for extracted content.
         log: File-like object for logging progress.
+        manifest: If given, archives unchanged since their last
+        extraction are skipped.
+        max_workers: Number of extraction processes.
     """
     try:
         zip_files = list(zip_dir.glob("*.zip"))
@@ -73,35 +154,45 @@ def _unzip_all_zips(
         log.write(f"No zip files found in {zip_dir}\n")
         return
 
-    extract_dir.mkdir(parents=True, exist_ok=True)
-
-    for zip_path in zip_files:
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
-        except zipfile.BadZipFile:
-            log.write(f"Bad zip file: {zip_path}\n")
-        except PermissionError:
-            log.write(f"Permission denied extracting: {zip_path}\n")
-        except OSError as exc:
-            log.write(f"File error with `{zip_path}`: {exc}\n")
+    pending: list[Path] = []
+    for zip_path in sorted(zip_files):
+        if manifest is not None and \
+           _is_extracted(zip_path, extract_dir, manifest):
+            log.write(f"Skipped unchanged `{zip_path.name}`  \n")
         else:
-            log.write(
-                f"Extracted `{zip_path.name}` to `{extract_dir}`  \n")
+            pending.append(zip_path)
+
+    for result in extract_all(pending, extract_dir,
+                              CFG.validd.file_prefix, max_workers):
+        if result.error:
+            log.write(f"{result.error}\n")
+            continue
+        log.write(
+            f"Extracted `{result.zip_path.name}` to `{extract_dir}` "
+            f"({len(result.extracted)} written, "
+            f"{len(result.skipped)} up to date)  \n")
+        if manifest is not None:
+            manifest.set_members(result.zip_path.stem, result.members)
+            manifest.mark_done(result.zip_path.stem, "unzip")
 
 
 def run_unzip(
         zip_dir: Path = CFG.paths.raw_data_dir,
         extract_dir: Path = CFG.paths.extracted_data_dir,
-        log_path: Path = CFG.paths.data_readme
+        log_path: Path = CFG.paths.data_readme,
+        manifest: DownloadManifest | None = None,
+        max_workers: int = CFG.parallel.unzip_workers,
         ) -> None:
     """Unzip all the files"""
     with open(log_path, 'a', encoding='utf-8') as log:
         log.write(f'\n## [{datetime.now()}]:  \n')
         log.write(f'Unzipping files from `{zip_dir}`  \n')
-        _unzip_all_zips(zip_dir, log, extract_dir)
+        _unzip_all_zips(zip_dir, log, extract_dir, manifest, max_workers)
+    if manifest is not None:
+        manifest.save()
 
 
 if __name__ == '__main__':
-    run_download()
-    run_unzip()
+    MANIFEST = DownloadManifest(CFG.paths.download_manifest)
+    run_download(manifest=MANIFEST)
+    run_unzip(manifest=MANIFEST)
@@ -5,13 +5,13 @@ csv files
 
 from typing import TextIO
 from pathlib import Path
-import zipfile
 import requests
 
 from crossborderml.config import CFG
 from crossborderml.utils.io_utils import load_yaml
 from crossborderml.utils.io_utils import FileFinder
 from crossborderml.pipeline.downloader import IndicatorDownloader
+from crossborderml.pipeline.extractor import extract_selected
 
 
 class IndicatorSpec:
@@ -80,23 +80,26 @@ class RecoveryRunner:
                             f"valid zip file at {file_path}\n")
 
     def unzip(self, zip_path: Path, log: TextIO) -> None:
-        """Self explanatory"""
-        try:
-            with zipfile.ZipFile(zip_path, "r") as zf:
-                zf.extractall(self.extract_dir)
+        """Extract only the indicator CSVs of the archive"""
+        self.extract_dir.mkdir(parents=True, exist_ok=True)
+        result = extract_selected(
+            zip_path, self.extract_dir, CFG.validd.file_prefix)
+        if result.error:
+            log.write(result.error)
+        else:
             log.write(f"Unzipped {zip_path}")
-        except (zipfile.BadZipFile, zipfile.BadZipFile):
-            log.write(f"Corrupt zip: {zip_path}")
 
 
-def main():
+def main(from_archives: bool = CFG.csv.from_archives):
     """Self explanatory"""
 
     spec = IndicatorSpec(CFG.paths.indicator_yaml)
     lister = FileFinder(
-        directory=CFG.paths.extracted_data_dir,
+        directory=CFG.paths.raw_data_dir if from_archives
+        else CFG.paths.extracted_data_dir,
         prefix=CFG.validd.file_prefix,
-        extension=CFG.validd.file_extentions
+        extension=CFG.validd.file_extentions,
+        in_archives=from_archives
         )
     existing = lister.get_file_names(
         CFG.validd.file_prefix,
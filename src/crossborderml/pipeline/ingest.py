@@ -0,0 +1,246 @@
+"""
+Validate and load each CSV in a single pass.
+
+`data_validation.main` and `load_sql.load_all_wide_tables`
+each parse every CSV. Here each file is parsed once:
+1. Read the CSV into a DataFrame (ReadCsv).
+2. Run the ValidateCsv checks on the frame in memory.
+3. Write the same frame to its "<Indicator>_wide" table.
+A file which cannot be read or fails a check is reported and
+not loaded; the other files are still processed.
+
+`ingest_parallel` does the same with the parsing spread over a
+process pool: the parsed frames go through a bounded queue to a
+single writer thread, since SQLite allows one writer only. The
+queue bounds the number of frames held in memory.
+"""
+
+import queue
+import threading
+from pathlib import Path
+from typing import Iterable
+from collections import deque
+from concurrent.futures import Future
+
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from crossborderml.config import CFG, CsvConfig
+from crossborderml.utils import instrument
+from crossborderml.utils.pool_utils import process_pool
+from crossborderml.utils.io_utils import ArchiveMember
+from crossborderml.utils.string_utils import derive_table_name
+from crossborderml.pipeline.manifest import DownloadManifest
+from crossborderml.pipeline.data_validation import ReadCsv, ValidateCsv
+from crossborderml.pipeline import load_sql
+
+
+def source_size(csv_path: Path | ArchiveMember) -> int:
+    """Bytes of the CSV, inside its archive or on disk"""
+    if isinstance(csv_path, ArchiveMember):
+        return csv_path.size
+    return csv_path.stat().st_size
+
+
+def read_valid_frame(
+        csv_path: Path | ArchiveMember,
+        header_rows: int,
+        base_cols: list[str],
+        schema: CsvConfig | None = None
+        ) -> pd.DataFrame:
+    """
+    Parse a CSV and run the validation checks on it.
+
+    Raises:
+        AssertionError: if the frame fails a check
+        ValueError, PermissionError: if the file cannot be read
+    """
+    csv = ReadCsv(csv_path, header_rows, schema)
+    valid_df = ValidateCsv(csv.df)
+    valid_df.assert_not_empty()
+    valid_df.assert_cols(base_cols)
+    return csv.df
+
+
+def ingest_all(
+        csv_files: Iterable[Path | ArchiveMember] | None = None,
+        db_url: str = CFG.sql.db_url,
+        header_rows: int = CFG.csv.header_rows,
+        base_cols: list[str] | None = None,
+        manifest: DownloadManifest | None = None,
+        schema: CsvConfig | None = CFG.csv,
+        ) -> dict[str, str]:
+    """
+    Validate and load all the CSVs (by default the ones
+    `load_sql.get_files` finds), parsed with the wide-file
+    `schema`.
+
+    Returns:
+        {file name: reason} for the files which were not loaded
+    """
+    if csv_files is None:
+        csv_files = load_sql.get_files()
+    if base_cols is None:
+        base_cols = CFG.csv.basic_cols
+
+    engine: Engine = load_sql.get_engine(db_url)
+    print(f"Using database URL: {db_url}")
+    failures: dict[str, str] = {}
+
+    with load_sql.bulk_connection(engine) as conn:
+        for csv_path in sorted(csv_files):
+            table_name = derive_table_name(csv_path, suffix='wide')
+            if load_sql.is_up_to_date(
+                    conn, csv_path.name, table_name, manifest):
+                print(f"- CSV: {csv_path.name} is unchanged, skipped")
+                continue
+
+            with instrument.unit(
+                    table_name, "table",
+                    bytes_read=source_size(csv_path)) as record:
+                try:
+                    df_i = read_valid_frame(
+                        csv_path, header_rows, base_cols, schema)
+                except (AssertionError, ValueError, PermissionError) as exc:
+                    failures[csv_path.name] = str(exc)
+                    print(f"[FAILED] {csv_path.name} not loaded: {exc}")
+                    record.status = "failed"
+                    continue
+                record.rows_in = record.rows_out = len(df_i)
+                load_sql.write_wide_table(conn, table_name, df_i)
+                del df_i
+            if manifest is not None:
+                manifest.mark_done_for(csv_path.name, "load")
+            print(f"[OK] {csv_path.name}  →  Table: {table_name}")
+
+    if manifest is not None:
+        manifest.save()
+    return failures
+
+
+def _parse_job(
+        csv_path: Path | ArchiveMember,
+        header_rows: int,
+        base_cols: list[str],
+        schema: CsvConfig | None
+        ) -> tuple[pd.DataFrame | None, str | None]:
+    """
+    Worker side of `ingest_parallel`.
+
+    Returns:
+        (frame, None) or (None, reason) if the file is not valid
+    """
+    try:
+        return read_valid_frame(csv_path, header_rows, base_cols, schema), None
+    except (AssertionError, ValueError, PermissionError) as exc:
+        return None, str(exc)
+
+
+def _write_frames(
+        engine: Engine,
+        frames: "queue.Queue[tuple[str, str, pd.DataFrame] | None]",
+        manifest: DownloadManifest | None,
+        errors: list[BaseException]
+        ) -> None:
+    """
+    The single writer: drain the queue into SQLite until the None
+    sentinel arrives. After an error it keeps draining, so the
+    producer never blocks on a full queue.
+    """
+    with load_sql.bulk_connection(engine) as conn:
+        while (item := frames.get()) is not None:
+            if errors:
+                continue
+            csv_name, table_name, df_i = item
+            try:
+                # the parsing was done by a worker, this is the write
+                with instrument.unit(table_name, "table",
+                                     rows_in=len(df_i), rows_out=len(df_i)):
+                    load_sql.write_wide_table(conn, table_name, df_i)
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append(exc)
+                continue
+            if manifest is not None:
+                manifest.mark_done_for(csv_name, "load")
+            print(f"[OK] {csv_name}  →  Table: {table_name}")
+
+
+def ingest_parallel(
+        csv_files: Iterable[Path | ArchiveMember] | None = None,
+        db_url: str = CFG.sql.db_url,
+        header_rows: int = CFG.csv.header_rows,
+        base_cols: list[str] | None = None,
+        manifest: DownloadManifest | None = None,
+        schema: CsvConfig | None = CFG.csv,
+        max_workers: int = CFG.parallel.parse_workers,
+        queue_size: int = CFG.parallel.queue_size,
+        ) -> dict[str, str]:
+    """
+    `ingest_all` with `max_workers` parsing processes and one
+    SQLite writer thread. Files are handed to the writer in sorted
+    order; at most `max_workers` files are being parsed and
+    `queue_size` frames wait for the writer at any time.
+
+    Returns:
+        {file name: reason} for the files which were not loaded
+    """
+    if csv_files is None:
+        csv_files = load_sql.get_files()
+    if base_cols is None:
+        base_cols = CFG.csv.basic_cols
+    if max_workers <= 1:
+        return ingest_all(csv_files, db_url, header_rows, base_cols,
+                          manifest, schema)
+
+    engine: Engine = load_sql.get_engine(db_url)
+    print(f"Using database URL: {db_url}")
+    pending = []
+    for csv_path in sorted(csv_files):
+        table_name = derive_table_name(csv_path, suffix='wide')
+        if load_sql.is_up_to_date(engine, csv_path.name, table_name, manifest):
+            print(f"- CSV: {csv_path.name} is unchanged, skipped")
+        else:
+            pending.append((csv_path, table_name))
+
+    failures: dict[str, str] = {}
+    errors: list[BaseException] = []
+    frames: "queue.Queue[tuple[str, str, pd.DataFrame] | None]" = \
+        queue.Queue(maxsize=max(1, queue_size))
+    writer = threading.Thread(
+        target=_write_frames, args=(engine, frames, manifest, errors))
+    writer.start()
+
+    def hand_over(job: tuple[Path | ArchiveMember, str, Future]) -> None:
+        csv_path, table_name, future = job
+        df_i, reason = future.result()
+        if df_i is None:
+            failures[csv_path.name] = str(reason)
+            print(f"[FAILED] {csv_path.name} not loaded: {reason}")
+        else:
+            # blocks while the queue is full
+            frames.put((csv_path.name, table_name, df_i))
+
+    try:
+        with process_pool(max_workers,
+                          ("crossborderml.pipeline.ingest",)) as pool:
+            in_flight: deque = deque()
+            for csv_path, table_name in pending:
+                if len(in_flight) >= max_workers:
+                    hand_over(in_flight.popleft())
+                in_flight.append((csv_path, table_name, pool.submit(
+                    _parse_job, csv_path, header_rows, base_cols, schema)))
+            while in_flight:
+                hand_over(in_flight.popleft())
+    finally:
+        frames.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
+
+    if manifest is not None:
+        manifest.save()
+    return failures
+
+
+if __name__ == '__main__':
+    ingest_parallel(manifest=DownloadManifest(CFG.paths.download_manifest))
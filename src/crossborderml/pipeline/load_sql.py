@@ -3,7 +3,10 @@ Load each validated CSV into a SQLite table named:
 <Indicator>_wide.
 
 1. Find all CSV files under the “extracted_data_dir” that
-   match the expected prefix/extension.
+   match the expected prefix/extension (or, with
+   CFG.csv.from_archives, the matching members of the zip
+   files in “raw_data_dir”, which are read without
+   extracting them).
 2. For each CSV:
    a. Derive a safe table name: use the filename
       stem + "_wide", replacing any non-alphanumeric
@@ -11,67 +14,220 @@ Load each validated CSV into a SQLite table named:
       Example: "GDP.csv" → "GDP_wide";
                "API.AG.LND.ZS.csv" → "API_AG_LND_ZS_wide".
    b. Read the CSV into a pandas DataFrame (using the same
-      header rows as validation).
+      header rows and wide-file schema as validation).
    c. Inside a transaction:
       i.  Drop any existing table by that same name.
       ii. Write the DataFrame to SQL (creating a new
       "<Indicator>_wide" table whose columns exactly match
-      the CSV).
+      the CSV), by default with executemany batches of
+      CFG.sql.chunksize rows.
    d. Delete the DataFrame to free memory before processing
       the next file.
 3. After all CSVs are processed, the database file (at
    CFG.sql.db_url) contains one “_wide” table per indicator.
+
+All files are written over one connection tuned with
+CFG.sql.load_pragmas for the duration of the load.
+
+With a download manifest, CSVs whose archive did not change since
+they were last loaded are skipped, as long as their table exists.
 """
 
+import time
+import sqlite3
 from pathlib import Path
+from typing import Any, Iterator
+from contextlib import contextmanager
 
 import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
-
-from crossborderml.config import CFG
-from crossborderml.utils.io_utils import FileFinder
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from crossborderml.config import CFG, CsvConfig
+from crossborderml.pipeline import backends
+from crossborderml.pipeline.data_validation import ReadCsv
+from crossborderml.utils import db_utils
+from crossborderml.utils.io_utils import ArchiveMember, FileFinder
+from crossborderml.pipeline.manifest import DownloadManifest
 from crossborderml.utils.string_utils import derive_table_name
 
 
-def get_files() -> set[Path]:
+def get_files(
+        from_archives: bool = CFG.csv.from_archives
+        ) -> set[Path] | set[ArchiveMember]:
     """Return the paths for CSV files"""
     csv_finder = FileFinder(
-        directory=CFG.paths.extracted_data_dir,
+        directory=CFG.paths.raw_data_dir if from_archives
+        else CFG.paths.extracted_data_dir,
         prefix=CFG.validd.file_prefix,
-        extension=CFG.validd.file_extentions)
+        extension=CFG.validd.file_extentions,
+        in_archives=from_archives)
     return csv_finder.get_file_paths()
 
 
 def get_engine(db_url: str) -> Engine:
     """
-    Create (or return a cached) SQLAlchemy engine based on
-    CFG.sql.db_url
+    Return the shared SQLAlchemy engine based on CFG.sql.db_url
     """
-    return create_engine(db_url)
+    return db_utils.get_engine(db_url)
+
 
+# Most bound parameters one statement may have
+SQLITE_MAX_VARIABLES: int = \
+    32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
 
-def load_all_wide_tables() -> None:
+
+@contextmanager
+def bulk_connection(
+        engine: Engine,
+        pragmas: tuple[str, ...] = CFG.sql.load_pragmas
+        ) -> Iterator[Connection]:
+    """
+    A connection with the loading PRAGMAs set. They are restored
+    when leaving, except journal_mode which is persistent.
+    """
+    with engine.connect() as conn:
+        previous: list[tuple[str, Any]] = []
+        if engine.dialect.name == "sqlite":
+            for pragma in pragmas:
+                key = pragma.split("=")[0].strip()
+                previous.append(
+                    (key, conn.exec_driver_sql(f"PRAGMA {key}").scalar()))
+                conn.exec_driver_sql(f"PRAGMA {pragma}")
+            conn.commit()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction():
+                conn.rollback()
+            for key, value in reversed(previous):
+                if key != "journal_mode":
+                    conn.exec_driver_sql(f"PRAGMA {key}={value}")
+            conn.commit()
+
+
+def is_up_to_date(
+        conn: Engine | Connection,
+        csv_name: str,
+        table_name: str,
+        manifest: DownloadManifest | None
+        ) -> bool:
+    """
+    True if the manifest says the archive behind `csv_name` was
+    loaded already and its table is still in the database.
+    """
+    return manifest is not None and \
+        manifest.is_unchanged(csv_name, "load") and \
+        inspect(conn).has_table(table_name)
+
+
+def _sql_type(dtype) -> str:
+    """Column type pandas.to_sql would give this dtype in SQLite"""
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(dtype):
+        return "FLOAT"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "DATETIME"
+    return "TEXT"
+
+
+def bulk_insert(
+        conn: Connection,
+        table_name: str,
+        df_i: pd.DataFrame,
+        chunksize: int = CFG.sql.chunksize
+        ) -> None:
+    """
+    Create the table from the dtypes of the frame, then insert the
+    rows with executemany in batches of `chunksize`.
+    """
+    columns = [f'"{col}"' for col in df_i.columns]
+    conn.exec_driver_sql(
+        f'CREATE TABLE "{table_name}" (' +
+        ", ".join(f"{col} {_sql_type(dtype)}"
+                  for col, dtype in zip(columns, df_i.dtypes)) + ")")
+    insert = (f'INSERT INTO "{table_name}" ({", ".join(columns)}) '
+              f'VALUES ({", ".join("?" for _ in columns)})')
+    # Python values, with None for the missing ones
+    rows = list(map(tuple, df_i.to_numpy(dtype=object, na_value=None)))
+    for start in range(0, len(rows), chunksize):
+        conn.exec_driver_sql(insert, rows[start:start + chunksize])
+
+
+def write_wide_table(
+        conn: Connection,
+        table_name: str,
+        df_i: pd.DataFrame,
+        method: str = CFG.sql.load_method,
+        chunksize: int = CFG.sql.chunksize
+        ) -> None:
+    """Replace `table_name` with the frame, in one transaction"""
+    if conn.dialect.name == "duckdb":
+        backends.DuckDbBackend.write_wide_table(conn, table_name, df_i)
+        return
+    if conn.in_transaction():
+        # close the one a previous read has begun
+        conn.commit()
+    with conn.begin():
+        conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+        if method == "bulk":
+            bulk_insert(conn, table_name, df_i, chunksize)
+        elif method == "multi":
+            # keep each statement under the bound-parameter limit
+            rows = max(1, SQLITE_MAX_VARIABLES // max(1, len(df_i.columns)))
+            df_i.to_sql(table_name, con=conn, if_exists="replace",
+                        index=False, method="multi",
+                        chunksize=min(chunksize, rows))
+        else:
+            df_i.to_sql(table_name, con=conn, if_exists="replace",
+                        index=False, chunksize=chunksize)
+
+
+def load_all_wide_tables(
+        manifest: DownloadManifest | None = None,
+        schema: CsvConfig | None = CFG.csv,
+        method: str = CFG.sql.load_method,
+        ) -> None:
     """self explanatory"""
-    csv_files: set[Path] = get_files()
+    csv_files: set[Path] | set[ArchiveMember] = get_files()
 
     engine: Engine = get_engine(CFG.sql.db_url)
     print(f"Using database URL: {CFG.sql.db_url}")
 
-    for csv_path in sorted(csv_files):
-        table_name = derive_table_name(csv_path, suffix='wide')
-        print(f"- CSV: {csv_path.name}  →  Table: {table_name}")
+    total_rows: int = 0
+    total_time: float = 0.0
+    with bulk_connection(engine) as conn:
+        for csv_path in sorted(csv_files):
+            table_name = derive_table_name(csv_path, suffix='wide')
+            if is_up_to_date(conn, csv_path.name, table_name, manifest):
+                print(f"- CSV: {csv_path.name} is unchanged, skipped")
+                continue
+            print(f"- CSV: {csv_path.name}  →  Table: {table_name}")
+
+            df_i: pd.DataFrame = \
+                ReadCsv(csv_path, CFG.csv.header_rows, schema).df
+
+            start = time.perf_counter()
+            write_wide_table(conn, table_name, df_i, method)
+            elapsed = time.perf_counter() - start
+            total_rows += len(df_i)
+            total_time += elapsed
+            del df_i
 
-        df_i: pd.DataFrame = pd.read_csv(csv_path, header=CFG.csv.header_rows)
+            if manifest is not None:
+                manifest.mark_done_for(csv_path.name, "load")
 
-        with engine.begin() as conn:
-            conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
-            df_i.to_sql(table_name, con=conn, if_exists="replace", index=False)
-        del df_i
+            print(f"[OK] Connection and transaction test for table "
+                  f"'{table_name}' succeeded.\n")
 
-        print(f"[OK] Connection and transaction test for table '{table_name}'"
-              " succeeded.\n")
+    print(f"Loaded {total_rows} rows in {total_time:.2f} s "
+          f"({total_rows / total_time if total_time else 0:.0f} rows/s)")
+    if manifest is not None:
+        manifest.save()
 
 
 if __name__ == '__main__':
-    load_all_wide_tables()
+    load_all_wide_tables(DownloadManifest(CFG.paths.download_manifest))
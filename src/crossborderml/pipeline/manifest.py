@@ -0,0 +1,166 @@
+"""
+Keep a record of the downloaded archives, so the indicators
+which did not change since the last run are neither fetched
+nor processed again.
+
+For each indicator the manifest keeps:
+    - code:            World Bank indicator code
+    - etag:            ETag header sent by the server
+    - last_modified:   Last-Modified header sent by the server
+    - size:            size of the archive in bytes
+    - sha256:          hash of the archive
+    - members:         CSV files extracted from the archive
+    - stages:          {stage: sha256 of the archive the stage
+                       last processed}
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any
+
+from crossborderml.config import CFG, ValidData
+
+
+def file_sha256(path: Path, chunk_size: int = CFG.urls.chunk_size) -> str:
+    """Return the SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize(name: str) -> str:
+    """Same cleaning as the table names get"""
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+class DownloadManifest:
+    """
+    A small JSON file next to the raw archives. It is safe to
+    update from the download threads.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: dict[str, dict[str, Any]] = {}
+        if path.exists():
+            try:
+                self.entries = json.loads(path.read_text(encoding='utf-8'))
+            except (json.JSONDecodeError, OSError):
+                # A broken manifest only costs a full refresh
+                self.entries = {}
+
+    def save(self) -> None:
+        """Write the manifest atomically"""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(
+                json.dumps(self.entries, indent=2, sort_keys=True),
+                encoding='utf-8')
+            os.replace(tmp_path, self.path)
+
+    def conditional_headers(self, name: str, archive: Path) -> dict[str, str]:
+        """
+        Return the If-None-Match / If-Modified-Since headers for an
+        indicator, only if its archive is still on disk and intact.
+        """
+        with self._lock:
+            entry = self.entries.get(name)
+        if not entry or not archive.exists() or \
+           archive.stat().st_size != entry.get("size"):
+            return {}
+        headers: dict[str, str] = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record(self,
+               name: str,
+               code: str,
+               archive: Path,
+               etag: str | None,
+               last_modified: str | None
+               ) -> bool:
+        """
+        Record a freshly downloaded archive.
+
+        Returns:
+            True if the content differs from the previous download
+        """
+        sha256 = file_sha256(archive)
+        with self._lock:
+            entry = self.entries.setdefault(name, {"stages": {}})
+            changed = entry.get("sha256") != sha256
+            entry.update(code=code,
+                         etag=etag,
+                         last_modified=last_modified,
+                         size=archive.stat().st_size,
+                         sha256=sha256)
+        return changed
+
+    def is_changed(self, name: str, stage: str) -> bool:
+        """True if `stage` has not yet processed the current archive"""
+        with self._lock:
+            entry = self.entries.get(name)
+            if not entry or "sha256" not in entry:
+                return True
+            return entry["stages"].get(stage) != entry["sha256"]
+
+    def mark_done(self, name: str, stage: str) -> None:
+        """Remember that `stage` processed the current archive"""
+        with self._lock:
+            entry = self.entries.get(name)
+            if entry and "sha256" in entry:
+                entry["stages"][stage] = entry["sha256"]
+
+    def set_members(self, name: str, members: list[str]) -> None:
+        """Remember the CSV files extracted from an archive"""
+        with self._lock:
+            if name in self.entries:
+                self.entries[name]["members"] = sorted(members)
+
+    def get_members(self, name: str) -> list[str]:
+        """Return the CSV files extracted from an archive"""
+        with self._lock:
+            return list(self.entries.get(name, {}).get("members", []))
+
+    def name_for(self,
+                 file_or_table: str,
+                 validd: ValidData = CFG.validd
+                 ) -> str | None:
+        """
+        Map an extracted CSV name or a table derived from it back
+        to its indicator name, e.g.
+        "API_NY_GDP_MKTP_CD_DS2_en_csv_v2_391573_wide" -> "gdp"
+        """
+        cleaned = _normalize(file_or_table)
+        with self._lock:
+            for name, entry in self.entries.items():
+                code = entry.get("code")
+                if code and cleaned.startswith(
+                        _normalize(f"{validd.file_prefix}{code}"
+                                   f"{validd.file_suffix}")):
+                    return name
+        return None
+
+    def is_unchanged(self, file_or_table: str, stage: str) -> bool:
+        """
+        True if the indicator behind a file or table is known and
+        `stage` already processed its current archive.
+        """
+        name = self.name_for(file_or_table)
+        return name is not None and not self.is_changed(name, stage)
+
+    def mark_done_for(self, file_or_table: str, stage: str) -> None:
+        """`mark_done` for the indicator behind a file or table"""
+        name = self.name_for(file_or_table)
+        if name is not None:
+            self.mark_done(name, stage)
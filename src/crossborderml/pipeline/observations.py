@@ -0,0 +1,148 @@
+"""
+Gather all the indicators in a single fact table:
+
+    observations(indicator_code, country_code, year, value)
+
+The table (sql/schema.sql) is keyed on (indicator_code, year,
+country_code) and indexed on (country_code, year), so a lookup by
+indicator or by country is an index seek in one table instead of a
+scan over every <file>_long table.
+It is filled straight from the wide tables, which carry the
+"Indicator Code"; each indicator replaces its own rows. The
+per-country copies of partition_by_country (country_<code>_wide)
+are not read. A wide table may list a country twice (the CO2 file
+has two ROU rows), the first row of a country is kept and the
+others are logged. A run which
+rewrites rows raises the version of the table in _table_versions,
+which invalidates the results cached by api.query.QueryService.
+"""
+
+from pathlib import Path
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from crossborderml.config import CFG
+from crossborderml.utils import db_utils, instrument, io_utils
+from crossborderml.pipeline import backends, load_sql
+from crossborderml.pipeline.manifest import DownloadManifest
+from crossborderml.pipeline.pivot_wide_to_long import PivotOneIndicator
+
+OBSERVATIONS_TABLE: str = "observations"
+
+
+def split_statements(sql: str) -> list[str]:
+    """Split a script on ';', dropping the comments and empty parts"""
+    code = "\n".join(line for line in sql.splitlines()
+                     if not line.lstrip().startswith("--"))
+    return [stmt.strip() for stmt in code.split(";") if stmt.strip()]
+
+
+def create_observations_table(
+        conn: Connection,
+        schema_path: Path = CFG.sql.schema_path
+        ) -> None:
+    """Run the DDL of the schema file, it is safe to run again"""
+    backend = backends.backend_for(conn.engine)
+    for statement in split_statements(io_utils.get_snippet(schema_path)):
+        conn.execute(text(backend.ddl(statement)))
+
+
+def load_indicator(
+        conn: Connection,
+        wide_table: str,
+        db_url: str,
+        snipt_path: Path = CFG.sql.snippets_dir / "per_year_observation"
+        ) -> int:
+    """
+    Replace the rows of the indicator(s) in `wide_table`; of the
+    rows repeating a country only the first one is read.
+
+    Returns:
+        number of rows stored
+    """
+    pivot = PivotOneIndicator(wide_table, db_url, snipt_path)
+    if not pivot.year_column:
+        print(f"- Table: {wide_table} has no year columns, skipped")
+        return 0
+    repeated = repeated_countries(conn, wide_table)
+    if repeated:
+        print(f"[WARN] {wide_table}: {sum(repeated.values())} rows repeat "
+              f"a country, the first row is kept: {sorted(repeated)}")
+    union_block = "\nUNION ALL\n".join(pivot.build_select_clause())
+    indicators = f'(SELECT DISTINCT "Indicator Code" FROM {wide_table})'
+    conn.execute(text(
+        f"DELETE FROM {OBSERVATIONS_TABLE} "
+        f"WHERE indicator_code IN {indicators}"))
+    # a key written twice is an error, not a silent replace
+    conn.execute(text(
+        f"INSERT INTO {OBSERVATIONS_TABLE} "
+        f"(indicator_code, country_code, year, value)\n{union_block}"))
+    # DuckDB gives no rowcount for an INSERT ... SELECT
+    return conn.execute(text(
+        f"SELECT COUNT(*) FROM {OBSERVATIONS_TABLE} "
+        f"WHERE indicator_code IN {indicators}")).scalar()
+
+
+def repeated_countries(conn: Connection, wide_table: str) -> dict[str, int]:
+    """{country code: rows past the first} of the repeated countries"""
+    return {code: count - 1 for code, count in conn.execute(text(
+        f'SELECT "Country Code", COUNT(*) FROM {wide_table} '
+        f'GROUP BY "Indicator Code", "Country Code" HAVING COUNT(*) > 1'))}
+
+
+def build_observations(
+        db_url: str = CFG.sql.db_url,
+        manifest: DownloadManifest | None = None,
+        tables_path: Path = CFG.sql.queries_dir / "tables_name.sql",
+        schema_path: Path = CFG.sql.schema_path,
+        wide_tables: list[str] | None = None
+        ) -> int:
+    """
+    Create the observations table if needed and load every wide
+    table (or the `wide_tables`) into it, in one transaction. With a
+    manifest, the wide tables whose archive did not change since
+    they were last gathered are skipped.
+
+    Returns:
+        number of rows stored by this run
+    """
+    engine: Engine = db_utils.get_engine(db_url)
+    total_rows: int = 0
+    with load_sql.bulk_connection(engine) as conn:
+        existed = inspect(conn).has_table(OBSERVATIONS_TABLE)
+        if wide_tables is None:
+            wide_tables = [row[0] for row in conn.execute(
+                text(io_utils.get_snippet(tables_path)))]
+        conn.commit()
+        with conn.begin():
+            create_observations_table(conn, schema_path)
+            rewritten: bool = False
+            for wide_table in wide_tables:
+                if existed and manifest is not None and \
+                   manifest.is_unchanged(wide_table, "observations"):
+                    continue
+                with instrument.unit(wide_table, "table") as record:
+                    n_rows = load_indicator(conn, wide_table, db_url)
+                    record.rows_out = n_rows
+                total_rows += n_rows
+                rewritten = True
+                print(f"[OK] {wide_table}  →  {n_rows} observations")
+            if rewritten:
+                db_utils.bump_table_version(conn, OBSERVATIONS_TABLE)
+        if manifest is not None:
+            for wide_table in wide_tables:
+                manifest.mark_done_for(wide_table, "observations")
+
+    if manifest is not None:
+        manifest.save()
+    with engine.connect() as conn:
+        stored = conn.execute(
+            text(f"SELECT COUNT(*) FROM {OBSERVATIONS_TABLE}")).scalar()
+    print(f"Wrote {total_rows} rows to `{OBSERVATIONS_TABLE}`, "
+          f"which holds {stored} rows")
+    return total_rows
+
+
+if __name__ == '__main__':
+    build_observations(manifest=DownloadManifest(CFG.paths.download_manifest))
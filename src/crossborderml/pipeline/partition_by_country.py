@@ -1,33 +1,64 @@
-"""A side module to make table for each country"""
-
+"""
+A side module to make table for each country
+
+The modes (CFG.sql.partition_mode):
+    - "table": one `country_<code>_wide` table per country, a copy
+      of its rows of every wide table.
+    - "view": the wide tables get an index on "Country Code" and
+      `country_<code>_wide` is a view over them, so nothing is
+      copied and a query on a country is an index seek per wide
+      table. Everything is made in one transaction.
+    - "batch": the "table" copies, all made in one transaction with
+      the country code as a bound parameter; the progress is printed
+      per batch of CFG.sql.partition_batch countries.
+
+The country lists of the wide tables are checked before, by
+`CountryConsistency`: a table × country presence bitmap built from
+one query per CFG.sql.compound_limit tables.
+"""
+
+import time
+from dataclasses import dataclass
 from pathlib import Path
-from collections import Counter
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
 
 from crossborderml.config import CFG
-from crossborderml.utils.io_utils import FileFinder, get_snippet
+from crossborderml.utils import db_utils, instrument
+from crossborderml.utils.io_utils import ArchiveMember, FileFinder, \
+    SNIPPETS, SqlTemplate, get_snippet, render_snippet
 from crossborderml.utils.string_utils import derive_table_name
+from crossborderml.pipeline.backends import backend_for
 
+PARTITION_MODES: tuple[str, ...] = ("view", "table", "batch")
 
-def get_files() -> set[Path]:
+
+def get_files(
+        from_archives: bool = CFG.csv.from_archives
+        ) -> set[Path] | set[ArchiveMember]:
     """Return the paths for CSV files"""
     csv_finder = FileFinder(
-        directory=CFG.paths.extracted_data_dir,
+        directory=CFG.paths.raw_data_dir if from_archives
+        else CFG.paths.extracted_data_dir,
         prefix=CFG.validd.file_prefix,
-        extension=CFG.validd.file_extentions)
+        extension=CFG.validd.file_extentions,
+        in_archives=from_archives)
     return csv_finder.get_file_paths()
 
 
 def get_engine(db_url: str) -> Engine:
     """
-    Create (or return a cached) SQLAlchemy engine based on
-    CFG.sql.db_url
+    Return the shared SQLAlchemy engine based on CFG.sql.db_url
     """
-    return create_engine(db_url)
+    return db_utils.get_engine(db_url)
 
 
-def get_all_tables(files: set[Path], suffix: str) -> list[str]:
+def get_all_tables(files: set[Path] | set[ArchiveMember],
+                   suffix: str
+                   ) -> list[str]:
     """Get name of the all the table with _wide in their name"""
     tables: list[str] = []
     for csv_path in files:
@@ -36,118 +67,179 @@ def get_all_tables(files: set[Path], suffix: str) -> list[str]:
     return tables
 
 
-def get_main_columns(
+def fetch_country_rows(
         engine: Engine,
         snipt_path: Path,
-        in_tables: list[str]
-        ) -> dict[str, set[tuple[str, str, str]]]:
+        in_tables: list[str],
+        chunk: int = CFG.sql.compound_limit
+        ) -> list[tuple]:
     """
-    Get the set of (Country Name, Country Code, Indicator
-    Code) tuples for all specified tables.
-
-    Args:
-        engine: SQLAlchemy Engine connected to the database.
-        snipt_path: Path to the SQL snippet file with a
-        {table} placeholder.
-        in_tables: List of table names to query.
-
-    Returns:
-        Dictionary mapping table name to a set of tuples
-        with country info.
+    The rows of the `snipt_path` query of every table, each one
+    led by the position of its table in `in_tables`. The per-table
+    queries are glued with UNION ALL, `chunk` of them per statement
+    (SQLite refuses more than 500), and run on one connection.
+    The snippet has a {table} and may have an {index} placeholder.
     """
-    snippet: str = get_snippet(snipt_path)
-    columns_per_table: dict[str, set[tuple[str, str, str]]] = {}
-
-    for table in in_tables:
-        sql_text = snippet.format(table=table)
-        with engine.begin() as conn:
-            results = conn.execute(text(sql_text))
-            rows = results.fetchall()
-            columns_per_table[table] = {tuple(row) for row in rows}
-
-    return columns_per_table
-
-
-def get_black_sheep(data: dict[str, set[str]]) -> list[str]:
-    """
-    Identify all 'black sheep' in the dataset — keys whose
-    associated sets have a length that is unique (occurs
-    only once).
-
-    Parameters:
-        data (dict[str, set[str]]): Dictionary mapping keys
-        to sets.
-
-    Returns:
-        list[str]: List of keys corresponding to unique-length
-        sets.
-    """
-    # Step 1: Compute the length of each set
-    lengths = {key: len(value_set) for key, value_set in data.items()}
-
-    # Step 2: Count how many times each length occurs
-    length_counts = Counter(lengths.values())
-
-    # Step 3: Identify all lengths that occur only once
-    unique_lengths = {length for length, count in
-                      length_counts.items() if count == 1}
-
-    # Step 4: Return all keys with one of the unique lengths
-    return [key for key, length in lengths.items() if length in unique_lengths]
-
-
-def get_country_set(
-        countries_dict: dict[str, set[tuple[str, str, str]]]
-        ) -> dict[str, set[str]]:
+    snippet: str = get_snippet(snipt_path).strip().rstrip(";")
+    rows: list[tuple] = []
+    chunk = max(1, chunk)
+    with engine.connect() as conn:
+        for first in range(0, len(in_tables), chunk):
+            union_block = "\nUNION ALL\n".join(
+                f"SELECT {index} AS table_index, * FROM "
+                f"({render_snippet(snippet, table=table, index=index)})"
+                for index, table in enumerate(
+                    in_tables[first:first + chunk], start=first))
+            rows.extend(conn.exec_driver_sql(union_block).fetchall())
+    return rows
+
+
+@dataclass(frozen=True)
+class CountryConsistency:
     """
-    return the dict with only the ids of the countries
+    Which country is in which wide table: `presence[i, j]` is True
+    if `countries[j]` is a row of `tables[i]`. The reference is the
+    most common country set; an outlier is a table whose set is
+    another one.
     """
-    return {
-        key: {country for _, country, _ in entries}
-        for key, entries in countries_dict.items()
-    }
-
-
-def sanity_check_names(
-        countries_dict: dict[str, set[tuple[str, str, str]]]
-        ) -> dict[str, set[tuple[str, str, str]]]:
+    tables: list[str]
+    countries: list[str]
+    presence: np.ndarray
+
+    @classmethod
+    def from_codes(cls,
+                   tables: list[str],
+                   table_index: np.ndarray,
+                   countries: pd.Series | np.ndarray | list[str]
+                   ) -> "CountryConsistency":
+        """
+        From aligned pairs: `table_index` the position in `tables`
+        and `countries` the country code of each row.
+        """
+        c_codes, country_axis = pd.factorize(
+            pd.Series(countries, dtype=object), sort=True)
+        presence = np.zeros((len(tables), len(country_axis)), dtype=bool)
+        keep = c_codes >= 0  # no NULL country codes
+        presence[np.asarray(table_index, dtype=np.intp)[keep],
+                 c_codes[keep]] = True
+        return cls(list(tables), [str(c) for c in country_axis], presence)
+
+    @classmethod
+    def from_engine(cls,
+                    engine: Engine,
+                    in_tables: list[str],
+                    snipt_path: Path = CFG.sql.snippets_dir / "country_codes",
+                    chunk: int = CFG.sql.compound_limit
+                    ) -> "CountryConsistency":
+        """
+        From the wide tables of a database, with batched queries; the
+        snippet gives one row per table, its codes joined by commas,
+        so few rows cross from SQLite to Python.
+        """
+        codes: list[list[str]] = [[] for _ in in_tables]
+        for table_index, joined in fetch_country_rows(
+                engine, snipt_path, in_tables, chunk):
+            if joined:
+                codes[table_index] = joined.split(",")
+        index = np.repeat(np.arange(len(in_tables)),
+                          [len(table_codes) for table_codes in codes])
+        return cls.from_codes(
+            in_tables, index, [code for table_codes in codes
+                               for code in table_codes])
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """Number of countries of each table"""
+        return self.presence.sum(axis=1)
+
+    def reference(self) -> np.ndarray:
+        """The most common country set, as a presence row"""
+        if not self.tables or not self.countries:
+            return np.zeros(len(self.countries), dtype=bool)
+        # one bytes value per row, cheaper to sort than the rows
+        packed = np.ascontiguousarray(np.packbits(self.presence, axis=1))
+        keys = packed.view(np.dtype((np.void, max(1, packed.shape[1]))))
+        _, first, counts = np.unique(keys.ravel(), return_index=True,
+                                     return_counts=True)
+        return self.presence[first[np.argmax(counts)]]
+
+    def outliers(self) -> dict[str, dict[str, list[str]]]:
+        """
+        {table: {"adds": [...], "drops": [...]}} of the tables whose
+        countries differ from the reference set.
+        """
+        reference = self.reference()
+        adds = self.presence & ~reference
+        drops = ~self.presence & reference
+        countries = np.asarray(self.countries, dtype=object)
+        return {
+            self.tables[i]: {"adds": list(countries[adds[i]]),
+                             "drops": list(countries[drops[i]])}
+            for i in np.flatnonzero((adds | drops).any(axis=1))}
+
+    def country_sets(self) -> dict[str, set[str]]:
+        """{table: the codes of its countries}"""
+        countries = np.asarray(self.countries, dtype=object)
+        return {table: set(countries[row])
+                for table, row in zip(self.tables, self.presence)}
+
+    def unique_size_tables(self) -> list[str]:
+        """The tables whose number of countries no other table has"""
+        sizes = self.sizes
+        values, counts = np.unique(sizes, return_counts=True)
+        unique_sizes = values[counts == 1]
+        return [self.tables[i]
+                for i in np.flatnonzero(np.isin(sizes, unique_sizes))]
+
+    def report(self) -> str:
+        """The outliers and what they add or drop"""
+        lines = [f"{len(self.tables)} tables, "
+                 f"{len(self.countries)} countries, "
+                 f"reference set of {int(self.reference().sum())}"]
+        for table, diff in self.outliers().items():
+            lines.append(f"- {table}: adds {diff['adds']}, "
+                         f"drops {diff['drops']}")
+        return "\n".join(lines)
+
+
+def consistent_countries(consistency: CountryConsistency
+                         ) -> dict[str, set[str]]:
     """
-    Filter out files whose country lists deviate from the
-    others.
-
-    The function assumes that the second element of each
-    tuple is the country name.
-    It uses set length comparison to detect outliers (black
-    sheep).
-    Parameters:
-        countries_dict (dict[str, set[tuple]]): Mapping of
-        filename -> set of (id, country, value)
-    Returns:
-        dict[str, set[tuple]]: Filtered dictionary excluding
-        black sheep files
+    The country codes of each wide table, without the tables whose
+    number of countries no other table has; the tables whose set
+    differs from the most common one are reported.
     """
-
-    country_sets: dict[str, set[str]] = get_country_set(countries_dict)
-
-    black_sheep_keys = get_black_sheep(country_sets)
-
+    black_sheep_keys = consistency.unique_size_tables()
     if black_sheep_keys:
         print(f"Files with inconsistent country sets: {black_sheep_keys}"
               " -> droped!")
+    if consistency.outliers():
+        print(consistency.report())
+    return {table: codes
+            for table, codes in consistency.country_sets().items()
+            if table not in black_sheep_keys}
+
 
-    return {
-        key: entries for key, entries in countries_dict.items()
-        if key not in black_sheep_keys
-    }
+def relation_types(conn: Connection) -> dict[str, str]:
+    """{name: "table" | "view"} of the database"""
+    return dict(conn.execute(text(
+        "SELECT name, type FROM sqlite_master "
+        "WHERE type IN ('table', 'view')")).fetchall())
 
 
-def mk_tables_name(
-        data: dict[str, set[tuple[str, str, str]]]
-        ) -> set[str]:
-    """Get a set of all the countries"""
-    countries_name: dict[str, set[str]] = get_country_set(data)
-    first_key = next(iter(countries_name))
-    return {f"country_{code}_wide" for code in countries_name[first_key]}
+def drop_relation(conn: Connection,
+                  name: str,
+                  kinds: dict[str, str] | None = None
+                  ) -> None:
+    """
+    Drop `name` whether it is a table or a view; `kinds` is the
+    result of `relation_types`, looked up if not given.
+    """
+    if kinds is None:
+        kinds = relation_types(conn)
+    kind = kinds.get(name)
+    if kind is not None:
+        conn.exec_driver_sql(f"DROP {kind.upper()} IF EXISTS {name}")
 
 
 class CreateCountryWideTables:
@@ -172,44 +264,147 @@ class CreateCountryWideTables:
         self.countries_code: set[str] = \
             next(iter(countries_indicators.values()))
 
-    def create(self, snippet_path: Path, year_range: tuple[int, int]) -> None:
-        """self explanatory"""
+    def create(self,
+               snippet_path: Path,
+               year_range: tuple[int, int],
+               mode: str = CFG.sql.partition_mode,
+               batch_size: int = CFG.sql.partition_batch,
+               param_snippet_path: Path =
+               CFG.sql.snippets_dir / "per_country_wide_param"
+               ) -> None:
+        """
+        self explanatory; the "batch" mode uses `param_snippet_path`
+        where the country code is the :country_code parameter
+        """
+        if mode not in PARTITION_MODES:
+            raise ValueError(
+                f"Unknown partition mode '{mode}', expected one of "
+                f"{PARTITION_MODES}")
+        backend = backend_for(self.engine)
+        if mode not in backend.partition_modes:
+            raise ValueError(
+                f"The partition mode '{mode}' is not available on "
+                f"{backend.name}, use one of {backend.partition_modes}")
         sql_temp: str = get_snippet(snippet_path)
         year_cols: str = self.get_years(year_range)
-        for country_code, table_name in zip(self.countries_code,
-                                            self.tables_name):
-            selects = self.mk_country(country_code, year_cols, sql_temp)
-            union_block = "\nUNION ALL\n".join(selects)
-            drop_table: str = f"DROP TABLE IF EXISTS {table_name};\n"
+        if mode == "view":
+            self.create_views(year_cols, sql_temp, backend.index_views)
+            return
+        if mode == "batch":
+            self.create_batched(
+                year_cols, get_snippet(param_snippet_path), batch_size)
+            return
+        for country_code in sorted(self.countries_code):
+            table_name = self.table_for(country_code)
+            union_block = self.country_union(country_code, year_cols, sql_temp)
             sql_txt: str = (
                 f"CREATE TABLE {table_name} AS \n"
                 f"{union_block}\n"
                 ";"
             )
-            with self.engine.begin() as conn:
-                conn.execute(text(drop_table))
+            with instrument.unit(country_code, "country"), \
+                    self.engine.begin() as conn:
+                drop_relation(conn, table_name)
                 conn.execute(text(sql_txt))
 
-    def mk_country(
-            self,
-            country_code: str,
-            years: str,
-            sql_temp: str
-            ) -> list[str]:
-        """make a sql text for each country"""
-        selects: list[str] = []
-        for wt, indicator in zip(self.in_tables, self.indicators):
-            selects.append(sql_temp.format(
+    def create_views(self,
+                     year_cols: str,
+                     sql_temp: str,
+                     index: bool = True
+                     ) -> None:
+        """
+        Index "Country Code" in every wide table (if `index`) and
+        make each `country_<code>_wide` a view, in one transaction.
+        """
+        with self.engine.begin() as conn:
+            for wide_table in self.in_tables if index else []:
+                conn.exec_driver_sql(
+                    f"CREATE INDEX IF NOT EXISTS {wide_table}_country "
+                    f'ON {wide_table} ("Country Code")')
+            kinds = relation_types(conn)
+            for country_code in sorted(self.countries_code):
+                view_name = self.table_for(country_code)
+                union_block = self.country_union(
+                    country_code, year_cols, sql_temp)
+                drop_relation(conn, view_name, kinds)
+                conn.exec_driver_sql(
+                    f"CREATE VIEW {view_name} AS \n{union_block}")
+
+    def create_batched(self,
+                       year_cols: str,
+                       sql_temp: str,
+                       batch_size: int
+                       ) -> None:
+        """
+        Create all the country tables in one transaction. The
+        statement is formatted once and the country code is bound.
+        """
+        union_block = self.country_union("", year_cols, sql_temp)
+        codes: list[str] = sorted(self.countries_code)
+        batch_size = max(1, batch_size)
+        start = time.perf_counter()
+        with self.engine.begin() as conn:
+            kinds = relation_types(conn)
+            for first in range(0, len(codes), batch_size):
+                batch_start = time.perf_counter()
+                batch = codes[first:first + batch_size]
+                with instrument.unit(f"{batch[0]}-{batch[-1]}", "batch"):
+                    for country_code in batch:
+                        table_name = self.table_for(country_code)
+                        drop_relation(conn, table_name, kinds)
+                        conn.exec_driver_sql(
+                            f"CREATE TABLE {table_name} AS \n{union_block}",
+                            {"country_code": country_code})
+                print(f"- Batch {first // batch_size + 1}: {len(batch)} "
+                      f"tables in {time.perf_counter() - batch_start:.2f}s "
+                      f"({first + len(batch)}/{len(codes)})")
+        print(f"Created {len(codes)} country tables in one transaction "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    @staticmethod
+    def table_for(country_code: str) -> str:
+        """Name of the table or view of a country"""
+        return f"country_{country_code}_wide"
+
+    def country_union(self,
+                      country_code: str,
+                      years: str,
+                      sql_temp: str
+                      ) -> str:
+        """
+        The UNION ALL of `sql_temp` over the wide tables for one
+        country. The union is built once per template, years and
+        tables and kept split at {country_code}, so a country costs
+        one join.
+        """
+        pieces: tuple[str, ...] = SNIPPETS.cached(
+            ("country_union", sql_temp, years,
+             tuple(self.in_tables), tuple(self.indicators)),
+            lambda: self._union_pieces(years, sql_temp))
+        return country_code.join(pieces)
+
+    def _union_pieces(self, years: str, sql_temp: str) -> tuple[str, ...]:
+        """The union of `country_union`, split at {country_code}"""
+        template = SqlTemplate.compile("\nUNION ALL\n".join(
+            SqlTemplate.compile(sql_temp).partial(
                 indicator=indicator,
                 year_columns=years,
-                wide_table=wt,
-                country_code=country_code
-            ))
-        return selects
+                wide_table=wt).text
+            for wt, indicator in zip(self.in_tables, self.indicators)))
+        extra = template.fields - {"country_code"}
+        if extra:
+            raise KeyError(f"No value for {sorted(extra)} in the snippet")
+        return tuple(template.text.split("{country_code}"))
 
     def get_years(self, year_range: tuple[int, int]) -> str:
-        """return columns of years """
-        years = [str(y) for y in range(*year_range)]
+        """
+        return columns of years which all the wide tables have; a
+        missing one would be read by SQLite as a string literal
+        """
+        columns = [set(cols) for cols in db_utils.tables_columns(
+            self.engine, self.in_tables).values()]
+        years = [str(y) for y in range(*year_range)
+                 if all(str(y) in cols for cols in columns)]
         return ", ".join(f'"{y}"' for y in years)
 
     def get_indicators(self,
@@ -222,18 +417,24 @@ class CreateCountryWideTables:
             for item in raw_keys]
 
 
-def create_tables() -> None:
-    """Orchestrate the actions"""
-    sql_engine: Engine = create_engine(CFG.sql.db_url)
-    csv_files: set[Path] = get_files()
+def create_tables(db_url: str = CFG.sql.db_url,
+                  mode: str = CFG.sql.partition_mode,
+                  wide_tables: list[str] | None = None
+                  ) -> None:
+    """
+    Orchestrate the actions, over `wide_tables` or the wide tables
+    of the CSV files
+    """
+    sql_engine: Engine = get_engine(db_url)
+    if wide_tables is None:
+        csv_files: set[Path] | set[ArchiveMember] = get_files()
+        wide_tables = get_all_tables(csv_files, 'wide')
 
-    all_in_tables: list[str] = \
-        get_all_tables(csv_files, 'wide')
-    all_columns: dict[str, set[tuple[str, str, str]]] = get_main_columns(
-        sql_engine, CFG.sql.snippets_dir / 'countries_name', all_in_tables)
-    all_columns = sanity_check_names(all_columns)
-    tables_name: set[str] = mk_tables_name(all_columns)
-    countries_indicators: dict[str, set[str]] = get_country_set(all_columns)
+    countries_indicators: dict[str, set[str]] = consistent_countries(
+        CountryConsistency.from_engine(sql_engine, wide_tables))
+    tables_name: set[str] = {
+        CreateCountryWideTables.table_for(code)
+        for code in next(iter(countries_indicators.values()))}
 
     country_tables = CreateCountryWideTables(
         engine=sql_engine,
@@ -242,7 +443,8 @@ def create_tables() -> None:
         const_str=CFG.validd
         )
     country_tables.create(CFG.sql.snippets_dir / "per_country_wide",
-                          CFG.sql.year_range)
+                          CFG.sql.year_range,
+                          mode)
 
 
 if __name__ == '__main__':
@@ -1,13 +1,18 @@
 """
-Pivot a wide table to a long table
+Pivot a wide table to a long table, with one SELECT per year glued
+with UNION ALL.
+
+For the parallel pivot (`transform.pivot_parallel`) a worker builds
+the long table in its own "part" database file (`build_into`), and
+the writer copies it into the main database (`merge_from`).
 """
 
 from pathlib import Path
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
 from crossborderml.config import CFG
-from crossborderml.utils import io_utils
+from crossborderml.utils import db_utils, io_utils
 
 
 class PivotOneIndicator:
@@ -31,11 +36,20 @@ class PivotOneIndicator:
                 f"Expected wide_table to end with '_wide' got '{wide_table}")
         self.long_table: str = wide_table.replace("_wide", "_long")
 
-        self.engine: Engine = create_engine(db_url)
-        self.year_column: list[str] = \
-            [str(y) for y in range(*CFG.sql.year_range)]
+        self.engine: Engine = db_utils.get_engine(db_url)
+        self.year_column: list[str] = self.existing_years()
         self.sql_select: str = io_utils.get_snippet(snipt_path)
 
+    def existing_years(self) -> list[str]:
+        """
+        The years of CFG.sql.year_range which are columns of the
+        wide table. A missing column would be read by SQLite as a
+        string literal, e.g. "2025" -> '2025', and end up as value.
+        """
+        columns = set(db_utils.table_columns(self.engine, self.wide_table))
+        return [str(y) for y in range(*CFG.sql.year_range)
+                if str(y) in columns]
+
     def build_select_clause(self) -> list[str]:
         """
         For each year in self.year_column, format the SQL
@@ -46,32 +60,82 @@ class PivotOneIndicator:
         Returns a list of SELECT…WHERE… strings, one for
         each year.
         """
-        clauses: list[str] = []
-        for yr in self.year_column:
-            filled = self.sql_select.format(
-                year=yr,
-                wide_table=self.wide_table
-            )
-            clauses.append(filled)
-
-        return clauses
+        template = io_utils.SNIPPETS.template(self.sql_select)
+        # the same clauses again for the same table and years
+        clauses = io_utils.SNIPPETS.cached(
+            ("per_year", template.text, self.wide_table,
+             tuple(self.year_column)),
+            lambda: tuple(template.render({"year": yr,
+                                           "wide_table": self.wide_table})
+                          for yr in self.year_column))
+        return list(clauses)
 
-    def assemble_union_query(self, select_clauses: list[str]) -> str:
+    def assemble_union_query(self,
+                             select_clauses: list[str],
+                             target: str | None = None
+                             ) -> str:
         """
         Given a list of per-year SELECT strings, produce one
         complete SQL statement that:
             1. Drops any existing `self.long_table`
-            2. Creates `self.long_table` AS the UNION ALL of
-            all those SELECTs.
+            2. Creates `self.long_table` (or `target`) AS the
+            UNION ALL of all those SELECTs.
         Returns a single SQL string ready for execution.
         """
-        create_line = f"CREATE TABLE {self.long_table} AS"
+        create_line = f"CREATE TABLE {target or self.long_table} AS"
         # Join all SELECT clauses with “UNION ALL”
         union_block = "\nUNION ALL\n".join(select_clauses)
         # Put it all together
         full_sql = f"{create_line}\n{union_block};"
         return full_sql
 
+    def assemble_query(self, target: str | None = None) -> str:
+        """The statement creating the long table (or `target`)"""
+        if not self.year_column:
+            raise ValueError(f"No year columns in '{self.wide_table}'")
+        return self.assemble_union_query(self.build_select_clause(), target)
+
+    def build_into(self, part_path: Path) -> None:
+        """
+        Worker side of the parallel pivot: create the long table in
+        the database file `part_path`, attached to a connection of
+        the main database which is only read.
+        """
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("ATTACH DATABASE ? AS part",
+                                 (str(part_path),))
+            try:
+                conn.exec_driver_sql(
+                    f"DROP TABLE IF EXISTS part.{self.long_table}")
+                conn.exec_driver_sql(
+                    self.assemble_query(f"part.{self.long_table}"))
+                conn.commit()
+            finally:
+                conn.exec_driver_sql("DETACH DATABASE part")
+
+    def merge_from(self, part_path: Path) -> None:
+        """
+        Writer side of the parallel pivot: replace the long table by
+        the one built in `part_path`. The copy keeps the column
+        types and the row order.
+        """
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("ATTACH DATABASE ? AS part",
+                                 (str(part_path),))
+            conn.commit()
+            try:
+                with conn.begin():
+                    conn.exec_driver_sql(
+                        f"DROP TABLE IF EXISTS main.{self.long_table}")
+                    conn.exec_driver_sql(
+                        f"CREATE TABLE main.{self.long_table} AS "
+                        f"SELECT * FROM part.{self.long_table} WHERE 0")
+                    conn.exec_driver_sql(
+                        f"INSERT INTO main.{self.long_table} "
+                        f"SELECT * FROM part.{self.long_table}")
+            finally:
+                conn.exec_driver_sql("DETACH DATABASE part")
+
     def execute_union(self, full_sql: str) -> None:
         """
         create the long table
@@ -82,7 +146,9 @@ class PivotOneIndicator:
             conn.execute(text(full_sql))
 
 
-def create_long_table(wide_table: str) -> None:
+def create_long_table(wide_table: str,
+                      db_url: str = CFG.sql.db_url
+                      ) -> None:
     """
     Orchestrates:
       1. Building the per-year SELECT clauses
@@ -92,11 +158,9 @@ def create_long_table(wide_table: str) -> None:
     """
     pivot = PivotOneIndicator(
         wide_table=wide_table,
-        db_url=CFG.sql.db_url,
+        db_url=db_url,
         snipt_path=CFG.sql.snippets_dir / "per_year_select")
-    clauses: list[str] = pivot.build_select_clause()
-    main_sql = pivot.assemble_union_query(clauses)
-    pivot.execute_union(main_sql)
+    pivot.execute_union(pivot.assemble_query())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,341 @@
+"""
+Run the stages as a DAG and skip the ones whose inputs did not
+change:
+
+    download ─ unzip ─ check_files ─ load ─┬─ pivot
+                                           ├─ partition
+                                           └─ observations ─┬─ cube
+                                                            └─ features
+
+A stage's fingerprint is the SHA-256 of:
+    - its input files (archives, CSVs, the indicator list),
+    - the text of its SQL snippets,
+    - the CFG sections it reads,
+    - the fingerprints its dependencies published.
+After a stage succeeds its fingerprint goes to a JSON state file
+(CFG.paths.pipeline_state); next time the stage runs only if the
+fingerprint differs or one of its outputs is missing. A stage which
+ran publishes its fingerprint mixed with a fresh nonce, so the
+stages after it run as well, also when it only ran to remake a
+missing output. "download" always runs, since only the server
+knows whether an archive changed; it sends conditional requests,
+and the archives are then inputs of "unzip". With
+CFG.csv.from_archives there is no "unzip", the CSVs are read out
+of the archives.
+
+pivot, partition and observations read the same database they
+write to, so each gets its input set explicitly: the wide tables
+of the source CSVs. A rerun never takes the country_<code>_wide
+tables of the partition for indicators.
+
+Within a stage that runs, the download manifest still skips the
+indicators whose archive did not change, so a one-indicator update
+reloads and pivots that indicator only.
+
+Each run is measured (utils/instrument.py): the report of the
+stages and of their units goes to CFG.paths.reports_dir and a
+summary table is printed.
+"""
+
+import os
+import json
+import uuid
+import hashlib
+from dataclasses import dataclass
+from graphlib import TopologicalSorter
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+from sqlalchemy import make_url
+
+from crossborderml.config import CFG
+from crossborderml.utils.instrument import RunReport, recording
+from crossborderml.pipeline.manifest import DownloadManifest, file_sha256
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A node of the pipeline"""
+    name: str
+    # called with the shared download manifest
+    run: Callable[[DownloadManifest], Any]
+    deps: tuple[str, ...] = ()
+    # files read by the stage, hashed by content
+    inputs: Callable[[], Iterable[Path]] = tuple
+    snippets: tuple[Path, ...] = ()
+    # CFG sections (frozen dataclasses), hashed by their repr
+    config: tuple[Any, ...] = ()
+    # files the stage makes, rerun if one is missing
+    outputs: Callable[[], Iterable[Path]] = tuple
+    always: bool = False
+
+
+class PipelineState:
+    """
+    The JSON state file: the fingerprint of each completed stage
+    and the one it published to its dependents, the hash of each
+    input file keyed by its size and mtime, so unchanged files are
+    not read again, and the id of the last run in which a stage ran
+    (the ETags of api/server.py).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.stages: dict[str, str] = {}
+        self.published: dict[str, str] = {}
+        self.files: dict[str, list] = {}
+        self.run_id: str = ""
+        if path.exists():
+            try:
+                data = json.loads(path.read_text(encoding='utf-8'))
+                self.stages = data.get("stages", {})
+                self.published = data.get("published", {})
+                self.files = data.get("files", {})
+                self.run_id = data.get("run_id", "")
+            except (json.JSONDecodeError, OSError, AttributeError):
+                # A broken state only costs a full run
+                self.stages, self.published, self.files = {}, {}, {}
+
+    def save(self) -> None:
+        """Write the state atomically"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({"stages": self.stages,
+                        "published": self.published,
+                        "files": self.files, "run_id": self.run_id},
+                       indent=2, sort_keys=True),
+            encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+    def file_hash(self, path: Path) -> str:
+        """SHA-256 of a file, from the cache if its size and mtime agree"""
+        stat = path.stat()
+        key = str(path.resolve())
+        cached = self.files.get(key)
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        digest = file_sha256(path)
+        self.files[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+
+def fingerprint(stage: Stage,
+                state: PipelineState,
+                upstream: dict[str, str]
+                ) -> str:
+    """The fingerprint of a stage, its dependencies already run"""
+    files = {str(path): state.file_hash(path)
+             for path in sorted(set(stage.inputs())) if path.is_file()}
+    snippets = {str(path): hashlib.sha256(path.read_bytes()).hexdigest()
+                for path in stage.snippets}
+    payload = json.dumps({
+        "name": stage.name,
+        "files": files,
+        "snippets": snippets,
+        "config": [repr(section) for section in stage.config],
+        "deps": {dep: upstream[dep] for dep in stage.deps},
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def plan(stages: list[Stage],
+         targets: Iterable[str] | None = None
+         ) -> list[Stage]:
+    """
+    The stages needed for `targets` (all by default), dependencies
+    first.
+
+    Raises:
+        ValueError: unknown stage or dependency, or a cycle
+    """
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(
+                    f"Stage '{stage.name}' depends on unknown '{dep}'")
+    wanted: set[str] = set()
+    todo = list(by_name if targets is None else targets)
+    while todo:
+        name = todo.pop()
+        if name not in by_name:
+            raise ValueError(
+                f"Unknown stage '{name}', expected one of {tuple(by_name)}")
+        if name not in wanted:
+            wanted.add(name)
+            todo.extend(by_name[name].deps)
+    graph = {name: by_name[name].deps for name in wanted}
+    # graphlib.CycleError is a ValueError
+    return [by_name[name] for name in TopologicalSorter(graph).static_order()]
+
+
+def _source_files() -> list[Path]:
+    """The archives or the extracted CSVs the load reads"""
+    # pylint: disable=import-outside-toplevel
+    from crossborderml.pipeline import load_sql
+    return [getattr(f, "archive", f) for f in load_sql.get_files()]
+
+
+def _wide_tables() -> list[str]:
+    """The wide tables of the source CSVs, as the load names them"""
+    # pylint: disable=import-outside-toplevel
+    from crossborderml.pipeline import load_sql
+    from crossborderml.utils.string_utils import derive_table_name
+    return sorted(derive_table_name(f, suffix="wide")
+                  for f in load_sql.get_files(CFG.csv.from_archives))
+
+
+def _raw_archives() -> list[Path]:
+    """self explanatory"""
+    return sorted(CFG.paths.raw_data_dir.glob("*.zip"))
+
+
+def _database_files() -> list[Path]:
+    """The database file of CFG.sql.db_url"""
+    database = make_url(CFG.sql.db_url).database
+    return [Path(database)] if database else []
+
+
+def default_stages() -> list[Stage]:
+    """The stages of the pipeline, their modules are imported lazily"""
+    # pylint: disable=import-outside-toplevel
+    from crossborderml.pipeline import fetch_extract, file_validation, \
+        ingest, transform, partition_by_country, observations, cube, \
+        features
+
+    snippets = CFG.sql.snippets_dir
+    tables_sql = CFG.sql.queries_dir / "tables_name.sql"
+    stages = [
+        Stage("download",
+              lambda m: fetch_extract.run_download(manifest=m),
+              inputs=lambda: [CFG.paths.indicator_yaml],
+              config=(CFG.urls,),
+              always=True),
+        Stage("unzip",
+              lambda m: fetch_extract.run_unzip(manifest=m),
+              deps=("download",),
+              inputs=_raw_archives,
+              config=(CFG.validd,),
+              outputs=lambda: [CFG.paths.extracted_data_dir]),
+        Stage("check_files",
+              lambda m: file_validation.main(CFG.csv.from_archives),
+              deps=("download",) if CFG.csv.from_archives else ("unzip",),
+              inputs=lambda: [CFG.paths.indicator_yaml, *_source_files()],
+              config=(CFG.validd, CFG.csv)),
+        # validates each CSV and loads it in one pass
+        Stage("load",
+              lambda m: ingest.ingest_parallel(db_url=CFG.sql.db_url,
+                                               manifest=m),
+              deps=("check_files",),
+              inputs=_source_files,
+              config=(CFG.csv, CFG.sql, CFG.validd),
+              outputs=_database_files),
+        Stage("pivot",
+              lambda m: transform.pivot_all_indicators(
+                  tables_sql, CFG.sql.db_url, m,
+                  wide_tables=_wide_tables()),
+              deps=("load",),
+              snippets=(snippets / "per_year_select",
+                        snippets / "per_year_unpivot"),
+              config=(CFG.sql,)),
+        Stage("partition",
+              lambda m: partition_by_country.create_tables(
+                  CFG.sql.db_url, CFG.sql.partition_mode, _wide_tables()),
+              deps=("load",),
+              snippets=(snippets / "country_codes",
+                        snippets / "per_country_wide",
+                        snippets / "per_country_wide_param"),
+              config=(CFG.sql, CFG.validd)),
+        Stage("observations",
+              lambda m: observations.build_observations(
+                  CFG.sql.db_url, m, wide_tables=_wide_tables()),
+              deps=("load",),
+              snippets=(snippets / "per_year_observation",
+                        CFG.sql.schema_path),
+              config=(CFG.sql,)),
+        Stage("cube",
+              lambda m: cube.build_cube(CFG.sql.db_url, CFG.paths.cube_dir),
+              deps=("observations",),
+              config=(CFG.sql, CFG.cube),
+              outputs=lambda: [CFG.paths.cube_dir / CFG.cube.data_file,
+                               CFG.paths.cube_dir / CFG.cube.axes_file]),
+        # cached by the version of the observations, see features.py
+        Stage("features",
+              lambda m: features.build_features(CFG.sql.db_url,
+                                                CFG.paths.features_dir),
+              deps=("observations",),
+              config=(CFG.sql, CFG.features)),
+    ]
+    if CFG.csv.from_archives:
+        # nothing to extract
+        stages = [stage for stage in stages if stage.name != "unzip"]
+    return stages
+
+
+def run_pipeline(targets: Iterable[str] | None = None,
+                 stages: list[Stage] | None = None,
+                 state_path: Path = CFG.paths.pipeline_state,
+                 manifest: DownloadManifest | None = None,
+                 force: bool = False,
+                 report_dir: Path | None = CFG.paths.reports_dir
+                 ) -> dict[str, str]:
+    """
+    Run the stages needed for `targets`, skipping the unchanged
+    ones (all of them run with `force`). The state is saved after
+    each stage, so a failed run resumes at the stage which failed.
+    The run report is written to `report_dir`, also when a stage
+    fails (None: only the summary is printed).
+
+    Returns:
+        {stage: "ran" or "skipped"}, in the order of the run
+    """
+    if stages is None:
+        stages = default_stages()
+    if manifest is None:
+        manifest = DownloadManifest(CFG.paths.download_manifest)
+    state = PipelineState(state_path)
+    report = RunReport()
+    done: dict[str, str] = {}
+    fingerprints: dict[str, str] = {}
+
+    try:
+        with recording(report):
+            for stage in plan(stages, targets):
+                key = fingerprint(stage, state, fingerprints)
+                missing = [path for path in stage.outputs()
+                           if not path.exists()]
+                if not (force or stage.always or missing or
+                        state.stages.get(stage.name) != key):
+                    print(f"- Stage: {stage.name} is unchanged, skipped")
+                    report.skipped(stage.name)
+                    fingerprints[stage.name] = \
+                        state.published.get(stage.name, key)
+                    done[stage.name] = "skipped"
+                    continue
+                print(f"[RUN] {stage.name}")
+                # a failed stage keeps no fingerprint and is run again
+                state.stages.pop(stage.name, None)
+                state.published.pop(stage.name, None)
+                state.save()
+                with report.stage(stage.name):
+                    stage.run(manifest)
+                state.stages[stage.name] = key
+                # an `always` stage passes its changes on through the
+                # input files of its dependents
+                fingerprints[stage.name] = state.published[stage.name] = \
+                    key if stage.always else hashlib.sha256(
+                        f"{key}:{uuid.uuid4().hex}".encode()).hexdigest()
+                state.run_id = report.run_id
+                state.save()
+                done[stage.name] = "ran"
+    finally:
+        print(report.summary())
+        if report_dir is not None:
+            json_path, _ = report.write(report_dir)
+            print(f"Run report  →  {json_path}")
+    return done
+
+
+if __name__ == '__main__':
+    run_pipeline()
@@ -5,33 +5,117 @@ analysis.
 transform.py
 """
 
+import tempfile
 from pathlib import Path
+from collections import deque
+from concurrent.futures import Future
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import inspect, text
 from sqlalchemy.engine import Engine
 
 from crossborderml.config import CFG
-from crossborderml.utils import io_utils
-from crossborderml.pipeline.pivot_wide_to_long import create_long_table
+from crossborderml.utils import db_utils, instrument, io_utils
+from crossborderml.utils.pool_utils import process_pool
+from crossborderml.pipeline.backends import get_backend
+from crossborderml.pipeline.manifest import DownloadManifest
+from crossborderml.pipeline.pivot_wide_to_long import PivotOneIndicator
 
 
-def pivot_all_indicators(snippet_path: Path, db_url: str) -> None:
+def _pivot_job(wide_table: str,
+               db_url: str,
+               part_path: Path
+               ) -> Path:
+    """Worker side of `pivot_parallel`"""
+    PivotOneIndicator(
+        wide_table, db_url, CFG.sql.snippets_dir / "per_year_select"
+        ).build_into(part_path)
+    return part_path
+
+
+def pivot_parallel(wide_tables: list[str],
+                   db_url: str,
+                   max_workers: int = CFG.parallel.pivot_workers
+                   ) -> None:
+    """
+    Pivot the wide tables in `max_workers` processes. Each worker
+    builds its long table in a temporary database file, reading the
+    main database only; this process copies them in, one at a time
+    and in the order of `wide_tables`, so the result is the one of
+    the serial pivot.
     """
-    1. Query sqlite_master for all table names ending in "_wide".
+    def merge(job: tuple[str, Future]) -> None:
+        wide_table, future = job
+        # the wait for the worker and the copy
+        with instrument.unit(wide_table, "table"):
+            part_path: Path = future.result()
+            PivotOneIndicator(
+                wide_table, db_url, CFG.sql.snippets_dir / "per_year_select"
+                ).merge_from(part_path)
+        part_path.unlink()
+
+    with tempfile.TemporaryDirectory(prefix="pivot_") as tmp_dir, \
+            process_pool(max_workers,
+                         ("crossborderml.pipeline.transform",)) as pool:
+        in_flight: deque = deque()
+        for wide_table in wide_tables:
+            if len(in_flight) >= max_workers:
+                merge(in_flight.popleft())
+            part_path = Path(tmp_dir) / f"{wide_table}.sqlite"
+            in_flight.append((wide_table, pool.submit(
+                _pivot_job, wide_table, db_url, part_path)))
+        while in_flight:
+            merge(in_flight.popleft())
+
+
+def pivot_all_indicators(snippet_path: Path,
+                         db_url: str,
+                         manifest: DownloadManifest | None = None,
+                         max_workers: int = CFG.parallel.pivot_workers,
+                         wide_tables: list[str] | None = None
+                         ) -> None:
+    """
+    1. Query sqlite_master for all table names ending in "_wide",
+       unless the `wide_tables` to pivot are given.
     2. For each name:
-        create a long table with „create_long_table”
+        create a long table with the backend of `db_url`, or
+        with `pivot_parallel` if more than one worker is asked
+        for and the backend is SQLite
+    With a manifest, the wide tables whose archive did not change
+    since their last pivot are skipped.
     """
 
-    sql_select: str = io_utils.get_snippet(snippet_path)
-    engine: Engine = create_engine(db_url)
-    with engine.begin() as conn:
-        result = conn.execute(text(sql_select))
-        wide_tables = [row[0] for row in result]
+    engine: Engine = db_utils.get_engine(db_url)
+    if wide_tables is None:
+        sql_select: str = io_utils.get_snippet(snippet_path)
+        with engine.begin() as conn:
+            result = conn.execute(text(sql_select))
+            wide_tables = [row[0] for row in result]
+
+    pending: list[str] = []
+    for wide_table in sorted(wide_tables):
+        long_table = wide_table.replace("_wide", "_long")
+        if manifest is not None and \
+           manifest.is_unchanged(wide_table, "pivot") and \
+           inspect(engine).has_table(long_table):
+            continue
+        pending.append(wide_table)
+
+    backend = get_backend(db_url)
+    if backend.parallel_pivot and max_workers > 1 and len(pending) > 1:
+        pivot_parallel(pending, db_url, max_workers)
+    else:
+        for wide_table in pending:
+            with instrument.unit(wide_table, "table"):
+                backend.create_long_table(wide_table)
+    if manifest is not None:
+        for wide_table in pending:
+            manifest.mark_done_for(wide_table, "pivot")
 
-    for wide_table in wide_tables:
-        create_long_table(wide_table=wide_table)
+    if manifest is not None:
+        manifest.save()
 
 
 if __name__ == '__main__':
     pivot_all_indicators(
-        CFG.sql.queries_dir / "tables_name.sql", CFG.sql.db_url)
+        CFG.sql.queries_dir / "tables_name.sql", CFG.sql.db_url,
+        DownloadManifest(CFG.paths.download_manifest))
@@ -0,0 +1,147 @@
+"""
+One SQLAlchemy engine per database URL, shared by all the
+pipeline stages, so a run opens one connection pool instead of
+an engine per table.
+"""
+
+import os
+import threading
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import Connection, Engine
+
+from crossborderml.config import CFG
+
+
+_ENGINES: dict[str, Engine] = {}
+_LOCK = threading.Lock()
+
+
+def _add_pragmas(engine: Engine, pragmas: tuple[str, ...]) -> None:
+    """Run the PRAGMAs on every new connection of the pool"""
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record) -> None:
+        cursor = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def get_engine(
+        db_url: str,
+        pragmas: tuple[str, ...] = CFG.sql.connect_pragmas
+        ) -> Engine:
+    """
+    Return the engine of `db_url`, creating it on the first call.
+    For SQLite, `pragmas` are set on each new connection; they are
+    fixed by the first call for a URL.
+    """
+    with _LOCK:
+        engine = _ENGINES.get(db_url)
+        if engine is None:
+            engine = create_engine(db_url)
+            if engine.dialect.name == "sqlite":
+                _add_pragmas(engine, pragmas)
+            _ENGINES[db_url] = engine
+        return engine
+
+
+def dispose_engines() -> None:
+    """Close all the pools and forget the engines"""
+    with _LOCK:
+        for engine in _ENGINES.values():
+            engine.dispose()
+        _ENGINES.clear()
+
+
+def table_columns(conn: Engine | Connection, table: str) -> list[str]:
+    """
+    The column names of `table`, from an empty result. Unlike
+    `inspect(...).get_columns` this needs no catalog reflection, which
+    the DuckDB dialect does not fully support.
+    """
+    if isinstance(conn, Engine):
+        with conn.connect() as new_conn:
+            return table_columns(new_conn, table)
+    return list(conn.exec_driver_sql(f"SELECT * FROM {table} LIMIT 0").keys())
+
+
+def tables_columns(conn: Engine | Connection,
+                   tables: list[str]
+                   ) -> dict[str, list[str]]:
+    """
+    The column names of each table, read from the catalog in one
+    query. pragma_table_info takes only literal names on DuckDB, so
+    the tables are a UNION ALL rather than a join of sqlite_master.
+    """
+    if isinstance(conn, Engine):
+        with conn.connect() as new_conn:
+            return tables_columns(new_conn, tables)
+    columns: dict[str, list[str]] = {table: [] for table in tables}
+    if not tables:
+        return columns
+    literals = [table.replace("'", "''") for table in tables]
+    query = " UNION ALL ".join(
+        f"SELECT '{name}', cid, name FROM pragma_table_info('{name}')"
+        for name in literals)
+    for table, _, column in conn.exec_driver_sql(
+            f"{query} ORDER BY 1, 2"):
+        columns[table].append(column)
+    return columns
+
+
+VERSIONS_TABLE: str = "_table_versions"
+
+
+def bump_table_version(conn: Connection, table: str) -> None:
+    """
+    Raise the version of `table` in the _table_versions table
+    (sql/schema.sql), in the transaction which rewrote it.
+    """
+    conn.execute(text(
+        f"INSERT INTO {VERSIONS_TABLE} (table_name, version, updated_at) "
+        "VALUES (:table, 1, CURRENT_TIMESTAMP) "
+        "ON CONFLICT (table_name) DO UPDATE SET "
+        "version = version + 1, updated_at = excluded.updated_at"),
+        {"table": table})
+
+
+def table_version(conn: Connection, table: str) -> int:
+    """The version of `table`, 0 if it was never raised"""
+    try:
+        version = conn.execute(text(
+            f"SELECT version FROM {VERSIONS_TABLE} "
+            "WHERE table_name = :table"), {"table": table}).scalar()
+    except DBAPIError:
+        # no _table_versions table yet
+        conn.rollback()
+        return 0
+    return int(version or 0)
+
+
+def table_stamp(conn: Connection, table: str) -> str:
+    """
+    The version of `table` and the time it was raised; unlike the
+    version alone it differs between two databases built anew.
+    """
+    try:
+        row = conn.execute(text(
+            f"SELECT version, updated_at FROM {VERSIONS_TABLE} "
+            "WHERE table_name = :table"), {"table": table}).first()
+    except DBAPIError:
+        conn.rollback()
+        return "0"
+    return "0" if row is None else f"{row[0]}@{row[1]}"
+
+
+def _after_fork_in_child() -> None:
+    """
+    A forked worker must not reuse the connections of its parent;
+    it gets fresh pools instead.
+    """
+    for engine in _ENGINES.values():
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
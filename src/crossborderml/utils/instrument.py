@@ -0,0 +1,224 @@
+"""
+Measure a pipeline run: each stage, and each unit of work inside a
+stage (an indicator, a table, a batch of countries).
+
+For every record:
+    - wall_s, cpu_s:       elapsed and CPU seconds. A stage counts the
+                           CPU of this process and of its finished
+                           worker processes; a unit counts its thread.
+    - peak_rss_mb:         high-water mark of the resident memory at
+                           the end of the record (ru_maxrss), of this
+                           process or of the largest worker.
+    - rows_in, rows_out:   reported by the code of the unit; a stage
+                           sums the ones of its units.
+    - bytes_read/written:  a stage reads the I/O counters of this
+                           process (/proc/self/io on Linux, otherwise
+                           the sum of its units); a unit reports its
+                           file sizes.
+
+`unit` does nothing unless a run is recorded, so the stages keep
+their cost when they are called on their own. The runner records
+the run (`recording`) and writes a JSON and a CSV report, plus a
+summary table, see `RunReport.write`.
+"""
+
+import csv
+import json
+import sys
+import time
+import resource
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+_PROC_IO = Path("/proc/self/io")
+
+
+@dataclass
+class Measurement:
+    """One stage or one unit of a run"""
+    name: str
+    # "stage", or the kind of unit: "indicator", "table", "batch"...
+    kind: str = "stage"
+    # the stage a unit belongs to
+    stage: str = ""
+    status: str = "ok"  # "ok", "failed" or "skipped"
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    peak_rss_mb: float = 0.0
+    rows_in: int = 0
+    rows_out: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+
+
+def _max_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """ru_maxrss in MB; it is in KB on Linux and in bytes on macOS"""
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def _cpu_seconds() -> float:
+    """User and system time of this process and its reaped children"""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        total += usage.ru_utime + usage.ru_stime
+    return total
+
+
+def _io_counters() -> tuple[int, int] | None:
+    """(bytes read, bytes written) by this process, if known"""
+    try:
+        lines = _PROC_IO.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return None
+    counters = dict(line.split(": ") for line in lines if ": " in line)
+    return int(counters.get("rchar", 0)), int(counters.get("wchar", 0))
+
+
+class RunReport:
+    """The measurements of one run, safe to add to from threads"""
+
+    def __init__(self, run_id: str | None = None) -> None:
+        self.run_id: str = run_id or datetime.now().strftime("%Y%m%dT%H%M%S")
+        self.records: list[Measurement] = []
+        self.current_stage: str = ""
+        self._lock = threading.Lock()
+
+    def add(self, record: Measurement) -> None:
+        """self explanatory"""
+        with self._lock:
+            self.records.append(record)
+
+    def units_of(self, stage: str) -> list[Measurement]:
+        """The unit records of a stage"""
+        with self._lock:
+            return [r for r in self.records
+                    if r.kind != "stage" and r.stage == stage]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Measurement]:
+        """Measure a stage; the units recorded meanwhile belong to it"""
+        record = Measurement(name)
+        self.current_stage = name
+        io_start = _io_counters()
+        cpu_start = _cpu_seconds()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record.status = "failed"
+            raise
+        finally:
+            record.wall_s = time.perf_counter() - start
+            record.cpu_s = _cpu_seconds() - cpu_start
+            record.peak_rss_mb = max(_max_rss_mb(),
+                                     _max_rss_mb(resource.RUSAGE_CHILDREN))
+            units = self.units_of(name)
+            record.rows_in += sum(u.rows_in for u in units)
+            record.rows_out += sum(u.rows_out for u in units)
+            io_end = _io_counters()
+            if io_start is not None and io_end is not None:
+                record.bytes_read = io_end[0] - io_start[0]
+                record.bytes_written = io_end[1] - io_start[1]
+            else:
+                record.bytes_read = sum(u.bytes_read for u in units)
+                record.bytes_written = sum(u.bytes_written for u in units)
+            self.current_stage = ""
+            self.add(record)
+
+    def skipped(self, name: str) -> None:
+        """Record a stage which did not run"""
+        self.add(Measurement(name, status="skipped"))
+
+    def summary(self, slowest: int = 5) -> str:
+        """A table of the stages and the slowest units"""
+        header = (f"{'stage':<14}{'status':<9}{'units':>6}{'wall s':>9}"
+                  f"{'cpu s':>9}{'peak MB':>9}{'rows in':>10}"
+                  f"{'rows out':>10}{'MB read':>9}{'MB written':>11}")
+        lines = [f"Run {self.run_id}", header, "-" * len(header)]
+        stages = [r for r in self.records if r.kind == "stage"]
+        for r in stages:
+            lines.append(
+                f"{r.name:<14}{r.status:<9}{len(self.units_of(r.name)):>6}"
+                f"{r.wall_s:>9.2f}{r.cpu_s:>9.2f}{r.peak_rss_mb:>9.1f}"
+                f"{r.rows_in:>10}{r.rows_out:>10}"
+                f"{r.bytes_read / 2**20:>9.1f}"
+                f"{r.bytes_written / 2**20:>11.1f}")
+        units = sorted((r for r in self.records if r.kind != "stage"),
+                       key=lambda r: r.wall_s, reverse=True)[:slowest]
+        if units:
+            lines.append("Slowest units:")
+            lines.extend(f"  {r.stage}/{r.name} ({r.kind}): {r.wall_s:.2f}s"
+                         for r in units)
+        return "\n".join(lines)
+
+    def write(self, directory: Path) -> tuple[Path, Path]:
+        """
+        Write run_<id>.json and run_<id>.csv in `directory`.
+
+        Returns:
+            the paths of the two files
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            rows = [asdict(r) for r in self.records]
+        json_path = directory / f"run_{self.run_id}.json"
+        json_path.write_text(
+            json.dumps({"run_id": self.run_id, "records": rows}, indent=2),
+            encoding="utf-8")
+        csv_path = directory / f"run_{self.run_id}.csv"
+        with open(csv_path, "w", encoding="utf-8", newline="") as f_out:
+            writer = csv.DictWriter(
+                f_out, ["run_id"] + [f.name for f in fields(Measurement)])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({"run_id": self.run_id, **row})
+        return json_path, csv_path
+
+
+_ACTIVE: RunReport | None = None
+
+
+@contextmanager
+def recording(report: RunReport) -> Iterator[RunReport]:
+    """Make `report` collect the units measured meanwhile"""
+    global _ACTIVE  # pylint: disable=global-statement
+    previous, _ACTIVE = _ACTIVE, report
+    try:
+        yield report
+    finally:
+        _ACTIVE = previous
+
+
+@contextmanager
+def unit(name: str, kind: str = "indicator", **counters: int
+         ) -> Iterator[Measurement]:
+    """
+    Measure a unit of work of the current stage; the counters
+    (rows_in, rows_out, bytes_read, bytes_written) can be given or
+    set on the yielded record. Without a recorded run it only
+    yields a record.
+    """
+    report = _ACTIVE
+    record = Measurement(name, kind, **counters)
+    if report is None:
+        yield record
+        return
+    record.stage = report.current_stage
+    cpu_start = time.thread_time()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record.status = "failed"
+        raise
+    finally:
+        record.wall_s = time.perf_counter() - start
+        record.cpu_s = time.thread_time() - cpu_start
+        record.peak_rss_mb = _max_rss_mb()
+        report.add(record)
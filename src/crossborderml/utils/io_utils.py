@@ -2,8 +2,23 @@
 A module for containing utility functions
 """
 
-from pathlib import Path
+import io
+import os
+import csv
+import string
+import zipfile
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import IO, Any, Callable, Hashable, Iterator
+from pathlib import Path, PurePosixPath
+from contextlib import contextmanager
+from dataclasses import dataclass
+
 import yaml
+import pandas as pd
+
+from crossborderml.config import CFG
 
 
 def load_yaml(yaml_path: Path, main_key: str) -> dict[str, str]:
@@ -43,12 +58,88 @@ def load_yaml(yaml_path: Path, main_key: str) -> dict[str, str]:
     return yaml_data[main_key]
 
 
+@dataclass(frozen=True, order=True)
+class ArchiveMember:
+    """
+    A file inside a zip archive. It has the `name` and `stem` of a
+    Path, so it can be used wherever a CSV path is expected, and
+    is read by streaming it out of the archive.
+    """
+    archive: Path
+    member: str
+
+    @property
+    def name(self) -> str:
+        """File name of the member"""
+        return PurePosixPath(self.member).name
+
+    @property
+    def stem(self) -> str:
+        """File name of the member without its suffix"""
+        return PurePosixPath(self.member).stem
+
+    @property
+    def size(self) -> int:
+        """Uncompressed size of the member in bytes"""
+        with zipfile.ZipFile(self.archive, 'r') as zf:
+            return zf.getinfo(self.member).file_size
+
+    @contextmanager
+    def open(self) -> Iterator[IO[bytes]]:
+        """Open the member for reading without extracting it"""
+        with zipfile.ZipFile(self.archive, 'r') as zf, \
+                zf.open(self.member) as handle:
+            yield handle
+
+    def __str__(self) -> str:
+        return f"{self.archive}/{self.member}"
+
+
+def read_csv(source: Path | ArchiveMember, **kwargs) -> pd.DataFrame:
+    """`pd.read_csv` for a file on disk or a member of an archive"""
+    if isinstance(source, ArchiveMember):
+        with source.open() as handle:
+            return pd.read_csv(handle, **kwargs)
+    return pd.read_csv(source, **kwargs)
+
+
+def locate_header(source: Path | ArchiveMember,
+                  header_rows: int
+                  ) -> tuple[int, list[str]]:
+    """
+    Return the line of the header of a CSV, counted from 0 with the
+    blank lines, and its column names, without parsing the body.
+    Like `pd.read_csv(header=header_rows)` the blank lines are not
+    counted in `header_rows`; the pyarrow engine counts them.
+    """
+    def first_row(handle: IO[str]) -> tuple[int, list[str]]:
+        reader = csv.reader(handle)
+        rows = (row for row in reader if row)
+        try:
+            for _ in range(header_rows):
+                next(rows)
+            names = next(rows)
+        except StopIteration as exc:
+            raise pd.errors.EmptyDataError(
+                f"No header row in {source}") from exc
+        return reader.line_num - 1, names
+
+    if isinstance(source, ArchiveMember):
+        with source.open() as raw:
+            return first_row(
+                io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+    with open(source, 'r', encoding='utf-8-sig', newline='') as handle:
+        return first_row(handle)
+
+
 class FileFinder:
     """
     Find files in a directory matching an optional prefix
     and extension, and (optionally) return either their full
     Path objects or just the „stem“ (filename with prefix
     and suffix removed).
+    With `in_archives`, the members of the zip files in the
+    directory are listed instead of the files themselves.
     """
     # pylint: disable=too-few-public-methods
 
@@ -56,7 +147,8 @@ class FileFinder:
         self,
         directory: Path,
         prefix: str = "",
-        extension: str = ""
+        extension: str = "",
+        in_archives: bool = False
     ) -> None:
         """
         Args:
@@ -66,19 +158,26 @@ class FileFinder:
             filenames that start with this.
             - extension:     If non-empty, only consider files
             with this suffix (e.g. ".csv").
+            - in_archives:   Look inside the *.zip files of the
+            folder instead.
         """
         self.directory = directory
         self.prefix = prefix
         self.extension = extension
+        self.in_archives = in_archives
 
-    def get_file_paths(self) -> set[Path]:
+    def get_file_paths(self) -> set[Path] | set[ArchiveMember]:
         """
         Returns a set of Path objects for every file in
-        `directory` whose name starts with `prefix`.
+        `directory` whose name starts with `prefix`, or the
+        matching archive members with `in_archives`.
         """
         if not self.directory.exists() or not self.directory.is_dir():
             raise FileNotFoundError(f"Directory not found: {self.directory}")
 
+        if self.in_archives:
+            return self.get_archive_members()
+
         results: set[Path] = set()
         for p in self.directory.iterdir():
             if not p.is_file():
@@ -93,6 +192,28 @@ class FileFinder:
 
         return results
 
+    def get_archive_members(self) -> set[ArchiveMember]:
+        """
+        Returns a set of ArchiveMember for every file in the zip
+        files of `directory` whose name starts with `prefix` and
+        ends with `extension`. Unreadable archives are ignored.
+        """
+        results: set[ArchiveMember] = set()
+        for archive in self.directory.glob("*.zip"):
+            try:
+                with zipfile.ZipFile(archive, 'r') as zf:
+                    names = zf.namelist()
+            except zipfile.BadZipFile:
+                continue
+            for member in names:
+                name = PurePosixPath(member).name
+                if self.prefix and not name.startswith(self.prefix):
+                    continue
+                if self.extension and not name.endswith(self.extension):
+                    continue
+                results.add(ArchiveMember(archive, member))
+        return results
+
     def get_file_names(self,
                        strip_prefix: str,
                        strip_suffix: str
@@ -133,7 +254,191 @@ class FileFinder:
         return names
 
 
+_MISSING = object()
+
+
+class LruCache:
+    """
+    A mapping which keeps the most recently used items up to
+    `maxsize`, safe to use from threads. The size is the number of
+    items, or the sum of `weigh(value)`, e.g. bytes; a value heavier
+    than `maxsize` is not kept.
+    """
+
+    def __init__(self,
+                 maxsize: int,
+                 weigh: Callable[[Any], int] | None = None
+                 ) -> None:
+        self.maxsize = max(1, maxsize)
+        self.weigh = weigh
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self._items: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """The value of `key`, now the most recently used"""
+        with self._lock:
+            item = self._items.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Add or refresh `key`, evicting the least recently used"""
+        weight = 1 if self.weigh is None else self.weigh(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if weight > self.maxsize:
+                return
+            self._items[key] = (value, weight)
+            self.size += weight
+            while self.size > self.maxsize:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self) -> None:
+        """self explanatory"""
+        with self._lock:
+            self._items.clear()
+            self.size = self.hits = self.misses = 0
+
+
+@dataclass(frozen=True)
+class SqlTemplate:
+    """A snippet parsed once: its text and its {placeholders}"""
+    text: str
+    fields: frozenset[str]
+
+    @classmethod
+    def compile(cls, text: str) -> "SqlTemplate":
+        """self explanatory"""
+        fields = {name for _, name, _, _ in string.Formatter().parse(text)
+                  if name}
+        return cls(text, frozenset(fields))
+
+    def render(self, params: dict[str, Any]) -> str:
+        """
+        Fill the placeholders.
+
+        Raises:
+            KeyError: naming the placeholders without a value
+        """
+        missing = self.fields - params.keys()
+        if missing:
+            raise KeyError(f"No value for {sorted(missing)} in the snippet")
+        return self.text.format_map(params)
+
+    def partial(self, **params: Any) -> "SqlTemplate":
+        """
+        A template with the given placeholders filled and the others
+        kept, to be rendered later; the snippets have no escaped
+        braces, which a second formatting would unescape.
+        """
+        if "{{" in self.text or "}}" in self.text:
+            raise ValueError("A partial template cannot have {{ or }}")
+        return SqlTemplate.compile(self.text.format_map(_KeepMissing(params)))
+
+
+class _KeepMissing(dict):
+    """format_map leaves the missing placeholders as they are"""
+    def __missing__(self, key: str) -> str:
+        return "{" + key + "}"
+
+
+class SnippetRegistry:
+    """
+    The SQL snippets and the statements built from them, in two LRU
+    caches:
+        - files: {path: (mtime, size, template)}, a file is read
+          again only if it changed on disk.
+        - rendered: {key: value} of `cached`, whole statements a
+          stage builds once, e.g. the per-year SELECTs of a pivot
+          or the union of a country.
+    A source is a snippet file or the text of a template. `render`
+    only formats: a lookup per placeholder set would cost more than
+    the str.format it saves.
+    """
+
+    def __init__(self,
+                 max_files: int = CFG.sql.snippet_cache,
+                 max_rendered: int = CFG.sql.render_cache
+                 ) -> None:
+        self.files = LruCache(max_files)
+        self.rendered = LruCache(max_rendered)
+        self._texts = LruCache(max_files)
+
+    def template(self, source: Path | str) -> SqlTemplate:
+        """The parsed template of a snippet file or of a text"""
+        if isinstance(source, str):
+            template = self._texts.get(source)
+            if template is None:
+                template = SqlTemplate.compile(source)
+                self._texts.put(source, template)
+            return template
+        stat = source.stat()
+        key = str(source)
+        cached = self.files.get(key)
+        if cached is not None and cached[:2] == \
+           (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        with open(source, 'r', encoding='utf-8') as sql:
+            template = SqlTemplate.compile(sql.read())
+        self.files.put(key, (stat.st_mtime_ns, stat.st_size, template))
+        return template
+
+    def text(self, source: Path | str) -> str:
+        """The raw text of a snippet"""
+        return self.template(source).text
+
+    def render(self, source: Path | str, **params: Any) -> str:
+        """The snippet with its placeholders filled"""
+        return self.template(source).render(params)
+
+    def cached(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """The rendered value of `key`, built on the first call"""
+        value = self.rendered.get(key, _MISSING)
+        if value is _MISSING:
+            value = build()
+            self.rendered.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Forget every snippet and statement"""
+        for cache in (self.files, self.rendered, self._texts):
+            cache.clear()
+
+
+SNIPPETS = SnippetRegistry()
+
+
 def get_snippet(snipt: Path) -> str:
-    """Read and return the snippet"""
-    with open(snipt, 'r', encoding='utf-8') as sql:
-        return ''.join(sql.readlines())
+    """Read and return the snippet, from the registry"""
+    return SNIPPETS.text(snipt)
+
+
+def render_snippet(source: Path | str, **params: Any) -> str:
+    """A snippet file or template text with its placeholders filled"""
+    return SNIPPETS.render(source, **params)
+
+
+def replace_atomically(target: Path, write: Callable[[Path], None]) -> None:
+    """Call write(tmp_path), then move the file in place"""
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent,
+                                    prefix=f".{target.name}.")
+    os.close(fd)
+    try:
+        write(Path(tmp_name))
+        os.replace(tmp_name, target)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
@@ -0,0 +1,28 @@
+"""
+Process pools which are safe to start next to threads
+
+A forked child gets a copy of every lock of the parent, but only the
+thread calling fork; a lock another thread held at that moment
+(the SQLite writer of `ingest_parallel`, pyarrow's thread pools)
+stays held in the child forever. The workers are therefore forked
+from a "forkserver" process, which runs no other threads.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool(max_workers: int,
+                 preload: tuple[str, ...] = ()
+                 ) -> ProcessPoolExecutor:
+    """
+    A process pool with forkserver workers ("spawn" where there is
+    no forkserver). The modules in `preload` are imported once by
+    the server, so each worker does not import them again.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(list(preload))
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
@@ -0,0 +1,38 @@
+"""
+Fixtures shared by the tests
+"""
+
+import sqlite3
+
+import pytest
+
+from crossborderml.pipeline.observations import build_observations
+
+
+@pytest.fixture
+def observed_db(tmp_path):
+    """
+    Two indicators in wide tables and in observations:
+
+        NY.GDP   AAA  1.5  2.0      SP.POP   AAA  5.0  -
+                 BBB  -    4.0
+                 CCC  3.0  1.0
+    Returns:
+        (database path, database URL)
+    """
+    db_path = tmp_path / "test.db"
+    con = sqlite3.connect(db_path)
+    for table, code, rows in (
+            ("gdp_wide", "NY.GDP", [("AAA", 1.5, 2.0), ("BBB", None, 4.0),
+                                    ("CCC", 3.0, 1.0)]),
+            ("pop_wide", "SP.POP", [("AAA", 5.0, None)])):
+        con.execute(f'CREATE TABLE {table} ("Country Name" TEXT, '
+                    '"Country Code" TEXT, "Indicator Code" TEXT, '
+                    '"2020" FLOAT, "2021" FLOAT)')
+        con.executemany(f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?)',
+                        [(c.lower(), c, code, *v) for c, *v in rows])
+    con.commit()
+    con.close()
+    db_url = f"sqlite:///{db_path}"
+    build_observations(db_url)
+    return db_path, db_url
@@ -0,0 +1,123 @@
+"""
+Tests for the DuckDB backend in pipline: the stages give the same
+tables as on SQLite
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from crossborderml.config import CFG
+from crossborderml.api.query import QueryService
+from crossborderml.pipeline import backends, cube, load_sql
+from crossborderml.pipeline import partition_by_country as pbc
+from crossborderml.pipeline.observations import build_observations
+from crossborderml.pipeline.transform import pivot_all_indicators
+
+pytest.importorskip("duckdb_engine")
+
+FRAMES = {
+    "API_GDP_DS2_wide": pd.DataFrame({
+        "Country Name": ["ccc", "aaa", "bbb"],
+        "Country Code": ["CCC", "AAA", "BBB"],
+        "Indicator Code": ["GDP"] * 3,
+        "2020": [1.0, None, 3.0],
+        "2021": [4.0, 5.0, None]}),
+    "API_POP_DS2_wide": pd.DataFrame({
+        "Country Name": ["aaa", "bbb", "ccc"],
+        "Country Code": ["AAA", "BBB", "CCC"],
+        "Indicator Code": ["POP"] * 3,
+        "2020": [7.0, 8.0, 9.0],
+        "2021": [None, 11.0, 12.0]}),
+}
+
+
+def load_frames(db_url: str) -> None:
+    """Write the wide frames through the loader"""
+    engine = load_sql.get_engine(db_url)
+    with load_sql.bulk_connection(engine) as conn:
+        for table, df_i in FRAMES.items():
+            load_sql.write_wide_table(conn, table, df_i)
+
+
+def read_table(db_url: str, table: str) -> list[tuple]:
+    """All the rows of a table, in its own order"""
+    with load_sql.get_engine(db_url).connect() as conn:
+        return [tuple(row) for row in conn.execute(
+            text(f"SELECT * FROM {table}"))]
+
+
+@pytest.fixture
+def both_dbs(tmp_path):
+    """The same wide tables in a SQLite and in a DuckDB file"""
+    urls = {"sqlite": f"sqlite:///{tmp_path / 'test.db'}",
+            "duckdb": f"duckdb:///{tmp_path / 'test.duckdb'}"}
+    for db_url in urls.values():
+        load_frames(db_url)
+    return urls
+
+
+def test_get_backend(both_dbs):
+    assert isinstance(backends.get_backend(both_dbs["sqlite"]),
+                      backends.SqliteBackend)
+    assert isinstance(backends.get_backend(both_dbs["duckdb"]),
+                      backends.DuckDbBackend)
+    with pytest.raises(ValueError):
+        backends.get_backend("postgresql://localhost/db")
+
+
+def test_duckdb_matches_sqlite(both_dbs):
+    """Wide, long and country tables agree between the backends"""
+    snippet = CFG.sql.queries_dir / "tables_name.sql"
+    for db_url in both_dbs.values():
+        pivot_all_indicators(snippet, db_url, max_workers=2)
+    for table in FRAMES:
+        assert read_table(both_dbs["duckdb"], table) == \
+            read_table(both_dbs["sqlite"], table)
+        long_table = table.replace("_wide", "_long")
+        # same rows in the same order: year, then the wide row order
+        assert read_table(both_dbs["duckdb"], long_table) == \
+            read_table(both_dbs["sqlite"], long_table)
+
+    for db_url in both_dbs.values():
+        engine = pbc.get_engine(db_url)
+        countries = pbc.consistent_countries(
+            pbc.CountryConsistency.from_engine(engine, list(FRAMES)))
+        partition = pbc.CreateCountryWideTables(
+            engine=engine,
+            tables_name={pbc.CreateCountryWideTables.table_for(code)
+                         for code in next(iter(countries.values()))},
+            countries_indicators=countries,
+            const_str=CFG.validd)
+        partition.create(CFG.sql.snippets_dir / "per_country_wide",
+                         (2020, 2026), mode="view")
+        if db_url == both_dbs["duckdb"]:
+            with pytest.raises(ValueError):
+                partition.create(CFG.sql.snippets_dir / "per_country_wide",
+                                 (2020, 2026), mode="batch")
+    for code in ("AAA", "BBB", "CCC"):
+        table = f"country_{code}_wide"
+        assert sorted(read_table(both_dbs["duckdb"], table)) == \
+            sorted(read_table(both_dbs["sqlite"], table))
+
+
+def test_observations_on_duckdb(both_dbs, tmp_path):
+    """The fact table and the stages reading it agree as well"""
+    for db_url in both_dbs.values():
+        assert build_observations(db_url) == 9
+        # the schema is safe to run again, the version goes up
+        assert build_observations(db_url) == 9
+    rows = {name: sorted(read_table(db_url, "observations"))
+            for name, db_url in both_dbs.items()}
+    assert rows["duckdb"] == rows["sqlite"]
+    assert read_table(both_dbs["duckdb"], "_table_versions")[0][:2] == \
+        ("observations", 2)
+
+    cubes = {name: cube.build_cube(db_url, tmp_path / name)
+             for name, db_url in both_dbs.items()}
+    assert cubes["duckdb"].countries == cubes["sqlite"].countries
+    np.testing.assert_array_equal(cubes["duckdb"].data, cubes["sqlite"].data)
+    pd.testing.assert_frame_equal(
+        QueryService(both_dbs["duckdb"]).get_panel(["POP", "GDP"]),
+        QueryService(both_dbs["sqlite"]).get_panel(["POP", "GDP"]))
@@ -0,0 +1,46 @@
+"""
+Tests for the columnar (Parquet / Feather) copies
+"""
+
+import sys
+from dataclasses import replace
+
+import pytest
+
+from crossborderml.config import CFG
+from crossborderml.pipeline import columnar
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "feather"])
+def test_export_and_read(observed_db, tmp_path, file_format):
+    """Round trip, partition pruning and the compact types"""
+    pa = pytest.importorskip("pyarrow")
+    _, db_url = observed_db
+    root = tmp_path / "columnar"
+    cfg = replace(CFG.columnar, file_format=file_format)
+
+    assert columnar.export_columnar(db_url, root, cfg) == \
+        {"long": 6, "wide": 4}
+    assert (root / "long" / "indicator_code=NY.GDP").is_dir()
+
+    table = columnar.read_columnar(
+        "long", indicators=["NY.GDP"], root=root, file_format=file_format)
+    assert table.schema.field("country_code").type == \
+        pa.dictionary(pa.int32(), pa.string())
+    assert table.schema.field("year").type == pa.int16()
+    assert table.schema.field("value").type == pa.float32()
+    assert sorted(table.column("value").to_pylist()) == \
+        [1.0, 1.5, 2.0, 3.0, 4.0]
+
+    df = columnar.read_frame(
+        "wide", countries=["AAA"], columns=["indicator_code", "2021"],
+        root=root, file_format=file_format)
+    assert sorted(df["indicator_code"]) == ["NY.GDP", "SP.POP"]
+    assert sorted(df["2021"].fillna(-1)) == [-1, 2.0]
+
+
+def test_missing_pyarrow(monkeypatch, observed_db, tmp_path):
+    """Without pyarrow the error says how to install it"""
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(ImportError, match="crossborderml\\[columnar\\]"):
+        columnar.export_columnar(observed_db[1], tmp_path / "columnar")
@@ -0,0 +1,46 @@
+"""
+Tests for the indicator × country × year cube
+"""
+
+import sqlite3
+
+import numpy as np
+import pytest
+
+from crossborderml.pipeline import cube
+
+
+def test_build_and_load(observed_db, tmp_path):
+    """Sorted axes, NaN gaps and a read only memory map"""
+    root = tmp_path / "cube"
+    built = cube.build_cube(observed_db[1], root)
+    assert built.indicators == ["NY.GDP", "SP.POP"]
+    assert built.countries == ["AAA", "BBB", "CCC"]
+    assert built.years == [2020, 2021]
+
+    loaded = cube.load_cube(root)
+    assert isinstance(loaded.data, np.memmap)
+    assert loaded.data.dtype == np.float32
+    assert not loaded.data.flags.writeable
+    np.testing.assert_array_equal(loaded.data, built.data)
+    np.testing.assert_array_equal(
+        loaded.indicator("NY.GDP"),
+        [[1.5, 2.0], [np.nan, 4.0], [3.0, 1.0]])
+    np.testing.assert_array_equal(
+        loaded.series("SP.POP", "AAA"), [5.0, np.nan])
+    # one indicator is a view of the mapped file, not a copy
+    assert np.shares_memory(loaded.indicator("SP.POP"), loaded.data)
+
+    np.testing.assert_array_equal(
+        loaded.select(countries=["BBB"], years=(2021, 2022)),
+        [[[4.0]], [[np.nan]]])
+    with pytest.raises(KeyError):
+        loaded.series("NY.GDP", "ZZZ")
+
+
+def test_missing_observations(tmp_path):
+    """Without the fact table there is nothing to build"""
+    db_path = tmp_path / "empty.db"
+    sqlite3.connect(db_path).close()
+    with pytest.raises(ValueError):
+        cube.build_cube(f"sqlite:///{db_path}", tmp_path / "cube")
@@ -4,9 +4,13 @@ Created by CodePilot and I fixed them
 """
 
 
+import zipfile
+
 import pytest
 import pandas as pd
 from crossborderml.pipeline.data_validation import ReadCsv, ValidateCsv
+from crossborderml.utils.io_utils import ArchiveMember, FileFinder
+from crossborderml.config import CsvConfig
 
 
 def test_readcsv_valid(tmp_path):
@@ -66,3 +70,81 @@ def test_validatecsv_assert_cols():
     with pytest.raises(AssertionError) as excinfo:
         val.assert_cols(["a", "b", "c"])
     assert "Missing columns" in str(excinfo.value)
+
+
+def test_readcsv_from_archive(tmp_path):
+    """test"""
+    with zipfile.ZipFile(tmp_path / "gdp.zip", "w") as zf:
+        zf.writestr("API_GDP_DS2.csv", "a,b\n1,2\n3,4\n")
+        zf.writestr("Metadata_Country_API_GDP_DS2.csv", "c\n")
+    (tmp_path / "broken.zip").write_bytes(b"not a zip")
+
+    finder = FileFinder(tmp_path, prefix="API_", extension="csv",
+                        in_archives=True)
+    members = finder.get_file_paths()
+    assert members == {ArchiveMember(tmp_path / "gdp.zip", "API_GDP_DS2.csv")}
+    assert finder.get_file_names("API_", "_DS2") == {"GDP"}
+
+    member = next(iter(members))
+    assert member.stem == "API_GDP_DS2"
+    reader = ReadCsv(member, header_rows=0)
+    assert reader.df.shape == (2, 2)
+    # nothing was written next to the archive
+    assert sorted(p.name for p in tmp_path.iterdir()) == \
+        ["broken.zip", "gdp.zip"]
+
+
+WIDE_CSV = (
+    '"Data Source","World Development Indicators",\n'
+    '\n'
+    '"Last Updated Date","2025-04-15",\n'
+    '\n'
+    '"Country Name","Country Code","Indicator Name","Indicator Code",'
+    '"2020","2021",\n'
+    '"Aruba","ABW","GDP","NY.GDP","1.5","",\n'
+    '"Chad","TCD","GDP","NY.GDP","2","3",\n'
+)
+
+
+def test_readcsv_typed_schema(tmp_path):
+    """test"""
+    csv_path = tmp_path / "wide.csv"
+    csv_path.write_text(WIDE_CSV)
+
+    plain = ReadCsv(csv_path, header_rows=2).df
+    assert plain.columns[-1].startswith("Unnamed")
+
+    schema = CsvConfig(value_dtype="float32", id_dtype="category")
+    typed = ReadCsv(csv_path, header_rows=2, schema=schema).df
+    assert list(typed.columns) == list(plain.columns[:-1])
+    assert typed["2020"].dtype == "float32"
+    assert typed["2021"].dtype == "float32"
+    assert typed["Country Code"].dtype == "category"
+
+    default = ReadCsv(csv_path, header_rows=2, schema=CsvConfig()).df
+    assert default["2021"].dtype == "float64"
+    assert default["2020"].tolist() == [1.5, 2.0]
+
+
+def test_readcsv_typed_rejects_text_in_years(tmp_path):
+    """test"""
+    csv_path = tmp_path / "wide.csv"
+    csv_path.write_text(WIDE_CSV.replace('"1.5"', '"abc"'))
+    with pytest.raises(ValueError):
+        ReadCsv(csv_path, header_rows=2, schema=CsvConfig())
+
+
+def test_readcsv_typed_pyarrow(tmp_path):
+    """The pyarrow engine reads the wide files as the C engine"""
+    pytest.importorskip("pyarrow")
+    csv_path = tmp_path / "wide.csv"
+    csv_path.write_text(WIDE_CSV)
+    with zipfile.ZipFile(tmp_path / "gdp.zip", "w") as zf:
+        zf.writestr("API_GDP_DS2.csv", "\ufeff" + WIDE_CSV)
+
+    expected = ReadCsv(csv_path, header_rows=2, schema=CsvConfig()).df
+    schema = CsvConfig(parse_engine="pyarrow")
+    for source in (csv_path, ArchiveMember(tmp_path / "gdp.zip",
+                                           "API_GDP_DS2.csv")):
+        pd.testing.assert_frame_equal(
+            ReadCsv(source, header_rows=2, schema=schema).df, expected)
@@ -0,0 +1,81 @@
+"""
+Tests for the feature matrix: the vectorized features agree with
+pandas group operations, and the matrix is cached by data version
+"""
+
+import sqlite3
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from crossborderml.config import CFG
+from crossborderml.pipeline import features
+from crossborderml.pipeline.cube import frame_to_cube
+from crossborderml.pipeline.observations import build_observations
+
+
+def test_matches_pandas():
+    rng = np.random.default_rng(0)
+    rows = [(ind, cty, year, rng.normal(10, 3))
+            for ind in ("A.X", "B.Y") for cty in ("AAA", "BBB", "CCC")
+            for year in range(2000, 2012)]
+    df = pd.DataFrame(rows, columns=["indicator_code", "country_code",
+                                     "year", "value"])
+    # gaps, and a zero before a growth
+    df = df.drop(index=[3, 4, 20, 30]).reset_index(drop=True)
+    df.loc[10, "value"] = 0.0
+    cfg = replace(CFG.features, dtype="float64")
+    matrix = features.cube_features(frame_to_cube(df, "float64"), cfg)
+    got = matrix.to_frame(dropna=False)
+
+    wide = df.pivot(index=["country_code", "year"],
+                    columns="indicator_code", values="value")
+    wide = wide.reindex(got.index)
+    by_country = wide.groupby(level="country_code")
+    expected = {"": wide, "_missing": wide.isna().astype(float)}
+    for k in cfg.lags:
+        expected[f"_lag{k}"] = by_country.shift(k)
+    previous = by_country.shift(1)
+    expected["_yoy"] = (wide / previous - 1).where(previous != 0)
+    for w in cfg.windows:
+        expected[f"_mean{w}"] = by_country.transform(
+            lambda s, w=w: s.rolling(w, min_periods=cfg.min_periods).mean())
+    for suffix, frame in expected.items():
+        for code in ("A.X", "B.Y"):
+            np.testing.assert_allclose(got[f"{code}{suffix}"], frame[code],
+                                       rtol=1e-12, err_msg=suffix)
+    assert matrix.columns[:2] == ["A.X", "B.Y"]
+    # B.Y has every country-year, so no row is empty
+    assert len(matrix.to_frame()) == len(got)
+
+
+def test_cache_by_version(observed_db, tmp_path):
+    db_path, db_url = observed_db
+    root = tmp_path / "features"
+    first = features.build_features(db_url, root)
+    assert first.to_frame().loc[("CCC", 2021), "NY.GDP_yoy"] == \
+        pytest.approx(1 / 3 - 1)
+    # the second build maps the cached file
+    again = features.build_features(db_url, root)
+    assert again.key == first.key and isinstance(again.data, np.memmap)
+
+    # another configuration, another key
+    other = features.build_features(db_url, root,
+                                    replace(CFG.features, lags=(1,)))
+    assert other.key != first.key
+    assert "NY.GDP_lag2" not in other.columns
+
+    # a rebuilt table makes a new matrix and removes the old one
+    con = sqlite3.connect(db_path)
+    con.execute("UPDATE gdp_wide SET \"2021\" = 6.0 WHERE "
+                "\"Country Code\" = 'CCC'")
+    con.commit()
+    con.close()
+    build_observations(db_url)
+    rebuilt = features.build_features(db_url, root)
+    assert rebuilt.key != first.key
+    assert rebuilt.to_frame().loc[("CCC", 2021), "NY.GDP_yoy"] == 1.0
+    assert sorted(p.name for p in root.iterdir()) == [
+        f"features_{rebuilt.key}.json", f"features_{rebuilt.key}.npy"]
@@ -7,22 +7,37 @@ mostly by ChatGPT, but all corrected!
 
 import io
 import os
+import threading
+import time
+import zipfile
 from pathlib import Path
 import requests
 
 from crossborderml.pipeline.downloader import IndicatorDownloader
+from crossborderml.pipeline.fetch_extract import run_download, run_unzip
+from crossborderml.pipeline.manifest import DownloadManifest
+from crossborderml.pipeline.extractor import extract_all
 from crossborderml.config import CFG
 
 
 class DummyResponse:
-    def __init__(self, content: bytes, status_code: int = 200):
+    def __init__(self, content: bytes, status_code: int = 200,
+                 headers: dict | None = None):
         self.content = content
         self.status_code = status_code
+        self.headers = headers or {}
 
     def raise_for_status(self):
-        if not 200 <= self.status_code < 300:
+        if self.status_code >= 400:
             raise requests.HTTPError(f"HTTP {self.status_code}")
 
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
 
 class FakeSession:
     def __init__(self, response: DummyResponse):
@@ -98,3 +113,158 @@ def test_download_timeout(tmp_path: Path):
     ok = dl.download("TMP", "TEST.CODE")
     assert ok is False
     assert "timed out" in log.getvalue().lower()
+
+
+def test_run_download_concurrent_keeps_order(tmp_path: Path):
+    # the first indicator is the slowest, its log must still come first
+    class SlowSession:
+        def __init__(self):
+            self.active = 0
+            self.peak = 0
+            self.lock = threading.Lock()
+
+        def get(self, url, timeout, stream=False):
+            with self.lock:
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+            time.sleep(0.2 if "SLOW" in url else 0.05)
+            with self.lock:
+                self.active -= 1
+            if "BAD" in url:
+                return DummyResponse(b"", status_code=500)
+            return DummyResponse(b"zip")
+
+    yaml_path = tmp_path / "indicators.yaml"
+    yaml_path.write_text(
+        'INDICATORS:\n  "a": "SLOW"\n  "b": "FAST"\n  "c": "BAD"\n')
+    readme = tmp_path / "README.md"
+    session = SlowSession()
+
+    run_download(yaml_path, tmp_path / "raw", readme,
+                 max_workers=3, session=session)
+
+    logs = readme.read_text()
+    assert session.peak > 1
+    assert logs.index("'a'") < logs.index("'b'") < logs.index("'c'")
+    assert "2 succeeded, 1 failed" in logs
+    assert "Failed indicators: ['c']" in logs
+
+
+def test_download_stream(tmp_path: Path):
+    class StreamSession:
+        def get(self, url, timeout, stream=False):
+            assert stream is True
+            return DummyResponse(b"x" * 1000)
+
+    log = io.StringIO()
+    dl = IndicatorDownloader(dest_dir=tmp_path, logger=log,
+                             session=StreamSession(), stream=True,
+                             chunk_size=64)
+
+    assert dl.download("GDP", "NY.GDP.MKTP.CD") is True
+    assert (tmp_path / "GDP.zip").read_bytes() == b"x" * 1000
+    # no temporary part files are left behind
+    assert [p.name for p in tmp_path.iterdir()] == ["GDP.zip"]
+    assert "1000 bytes" in log.getvalue()
+    assert "/s)" in log.getvalue()
+
+
+def test_download_stream_broken_transfer(tmp_path: Path):
+    class BrokenResponse(DummyResponse):
+        def iter_content(self, chunk_size):
+            yield b"partial"
+            raise requests.ConnectionError("connection reset")
+
+    class BrokenSession:
+        def get(self, url, timeout, stream=False):
+            return BrokenResponse(b"")
+
+    (tmp_path / "GDP.zip").write_bytes(b"old")
+    log = io.StringIO()
+    dl = IndicatorDownloader(dest_dir=tmp_path, logger=log,
+                             session=BrokenSession(), stream=True)
+
+    assert dl.download("GDP", "NY.GDP.MKTP.CD") is False
+    # the previous archive is kept and the partial one removed
+    assert (tmp_path / "GDP.zip").read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["GDP.zip"]
+    assert "connection reset" in log.getvalue()
+
+
+def test_download_conditional_with_manifest(tmp_path: Path):
+    class EtagSession:
+        def __init__(self):
+            self.sent = []
+
+        def get(self, url, timeout, headers=None):
+            self.sent.append(headers)
+            if headers and headers.get("If-None-Match") == '"v1"':
+                return DummyResponse(b"", status_code=304)
+            return DummyResponse(b"zipcontent", headers={"ETag": '"v1"'})
+
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+    session = EtagSession()
+    log = io.StringIO()
+    dl = IndicatorDownloader(dest_dir=tmp_path, logger=log,
+                             session=session, manifest=manifest)
+
+    assert dl.download("GDP", "NY.GDP.MKTP.CD") is True
+    assert dl.download("GDP", "NY.GDP.MKTP.CD") is True
+    assert session.sent == [None, {"If-None-Match": '"v1"'}]
+    assert "not modified" in log.getvalue()
+
+    manifest.save()
+    entry = DownloadManifest(tmp_path / "manifest.json").entries["GDP"]
+    assert entry["etag"] == '"v1"'
+    assert entry["size"] == len(b"zipcontent")
+    assert len(entry["sha256"]) == 64
+
+
+def test_unzip_skips_unchanged_archives(tmp_path: Path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    with zipfile.ZipFile(raw / "gdp.zip", "w") as zf:
+        zf.writestr("API_NY.GDP.MKTP.CD_DS2_en_csv_v2_1.csv", "a,b\n1,2\n")
+        zf.writestr("Metadata_Country_API_NY.GDP.MKTP.CD.csv", "c\n")
+    manifest = DownloadManifest(tmp_path / "manifest.json")
+    manifest.record("gdp", "NY.GDP.MKTP.CD", raw / "gdp.zip", None, None)
+    extracted = tmp_path / "extracted"
+    readme = tmp_path / "README.md"
+
+    run_unzip(raw, extracted, readme, manifest=manifest)
+    run_unzip(raw, extracted, readme, manifest=manifest)
+
+    logs = readme.read_text()
+    assert logs.count("Extracted `gdp.zip`") == 1
+    assert "Skipped unchanged `gdp.zip`" in logs
+    assert manifest.is_unchanged(
+        "API_NY.GDP.MKTP.CD_DS2_en_csv_v2_1.csv", "unzip")
+    assert not manifest.is_unchanged(
+        "API_NY_GDP_MKTP_CD_DS2_en_csv_v2_1_wide", "load")
+
+
+def test_extract_all_selective_and_up_to_date(tmp_path: Path):
+    zips = []
+    for i in range(3):
+        zip_path = tmp_path / f"ind{i}.zip"
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            zf.writestr(f"API_IND{i}_DS2.csv", f"a,b\n{i},2\n")
+            zf.writestr(f"Metadata_Indicator_API_IND{i}_DS2.csv", "m\n")
+        zips.append(zip_path)
+    (tmp_path / "bad.zip").write_bytes(b"not a zip")
+    zips.append(tmp_path / "bad.zip")
+    out = tmp_path / "out"
+
+    first = extract_all(zips, out, "API_", max_workers=2)
+    assert [r.zip_path for r in first] == zips
+    assert sorted(p.name for p in out.iterdir()) == \
+        ["API_IND0_DS2.csv", "API_IND1_DS2.csv", "API_IND2_DS2.csv"]
+    assert first[0].extracted == ["API_IND0_DS2.csv"]
+    assert "Bad zip file" in first[-1].error
+
+    # a changed file on disk is rewritten, the others are left alone
+    (out / "API_IND1_DS2.csv").write_text("a,b\n9,9\n")
+    second = extract_all(zips[:3], out, "API_", max_workers=1)
+    assert [r.extracted for r in second] == [[], ["API_IND1_DS2.csv"], []]
+    assert second[0].skipped == ["API_IND0_DS2.csv"]
+    assert (out / "API_IND1_DS2.csv").read_text() == "a,b\n1,2\n"
@@ -0,0 +1,50 @@
+"""
+Tests for the run instrumentation in utils
+"""
+
+import csv
+import json
+
+import pytest
+
+from crossborderml.utils import instrument
+
+
+def test_stage_and_units(tmp_path):
+    """Units belong to their stage, which sums their rows"""
+    report = instrument.RunReport("test")
+    with instrument.recording(report):
+        with report.stage("load"):
+            for name, rows in (("gdp_wide", 3), ("pop_wide", 4)):
+                with instrument.unit(name, "table", rows_in=rows) as record:
+                    record.rows_out = rows - 1
+        with pytest.raises(RuntimeError):
+            with report.stage("pivot"):
+                with instrument.unit("gdp_wide", "table"):
+                    raise RuntimeError("boom")
+        report.skipped("partition")
+
+    stages = {r.name: r for r in report.records if r.kind == "stage"}
+    assert stages["load"].status == "ok"
+    assert (stages["load"].rows_in, stages["load"].rows_out) == (7, 5)
+    assert stages["load"].wall_s >= 0 and stages["load"].peak_rss_mb > 0
+    assert stages["pivot"].status == "failed"
+    assert stages["partition"].status == "skipped"
+    assert [u.status for u in report.units_of("pivot")] == ["failed"]
+
+    json_path, csv_path = report.write(tmp_path)
+    data = json.loads(json_path.read_text(encoding="utf-8"))
+    assert data["run_id"] == "test" and len(data["records"]) == 6
+    with open(csv_path, encoding="utf-8", newline="") as f_in:
+        rows = list(csv.DictReader(f_in))
+    assert [r["name"] for r in rows if r["kind"] == "table"] == \
+        ["gdp_wide", "pop_wide", "gdp_wide"]
+    summary = report.summary()
+    assert "load" in summary and "Slowest units:" in summary
+
+
+def test_unit_without_run():
+    """Outside a recorded run a unit only yields its record"""
+    with instrument.unit("gdp_wide", rows_out=2) as record:
+        pass
+    assert record.rows_out == 2 and record.wall_s == 0.0
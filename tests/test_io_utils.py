@@ -0,0 +1,87 @@
+"""
+Tests for the snippet registry in utils
+"""
+
+import os
+
+import pytest
+
+from crossborderml.utils.io_utils import LruCache, SnippetRegistry, \
+    SqlTemplate, replace_atomically
+
+
+def test_lru_cache_evicts_least_recent():
+    cache = LruCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recent
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2 and (cache.hits, cache.misses) == (3, 1)
+
+
+def test_registry_reads_once_and_reloads(tmp_path):
+    snippet = tmp_path / "per_year_select"
+    snippet.write_text('SELECT "{year}" FROM {wide_table}', encoding="utf-8")
+    registry = SnippetRegistry(max_files=4, max_rendered=4)
+
+    first = registry.render(snippet, year=2020, wide_table="gdp_wide")
+    assert first == 'SELECT "2020" FROM gdp_wide'
+    assert registry.render(snippet, year=2021, wide_table="gdp_wide") == \
+        'SELECT "2021" FROM gdp_wide'
+    assert registry.files.misses == 1
+    # renders are not kept, whole statements are
+    assert len(registry.rendered) == 0
+    calls = []
+    for _ in range(2):
+        registry.cached(("union", "gdp_wide"),
+                        lambda: calls.append(1) or "SELECT 1")
+    assert calls == [1]
+    with pytest.raises(KeyError):
+        registry.render(snippet, year=2020)
+
+    # a changed file is read again
+    snippet.write_text('SELECT {year} FROM {wide_table};', encoding="utf-8")
+    stat = snippet.stat()
+    os.utime(snippet, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert registry.text(snippet) == "SELECT {year} FROM {wide_table};"
+
+
+def test_partial_template():
+    template = SqlTemplate.compile("SELECT {year} FROM {wide_table}")
+    assert template.fields == {"year", "wide_table"}
+    partial = template.partial(wide_table="gdp_wide")
+    assert partial.fields == {"year"}
+    assert partial.render({"year": 2021}) == "SELECT 2021 FROM gdp_wide"
+    with pytest.raises(ValueError):
+        SqlTemplate.compile("SELECT '{{x}}' {y}").partial(y=1)
+
+
+def test_lru_cache_by_weight():
+    cache = LruCache(10, weigh=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "yyyy")
+    cache.put("c", "zzzz")  # 12 > 10, "a" goes
+    assert cache.get("a") is None and cache.size == 8
+    cache.put("d", "w" * 11)  # heavier than the whole cache
+    assert cache.get("d") is None and len(cache) == 2
+
+
+def test_replace_atomically(tmp_path):
+    target = tmp_path / "cube.npy"
+    target.write_text("old", encoding="utf-8")
+
+    def fail(path):
+        path.write_text("half", encoding="utf-8")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        replace_atomically(target, fail)
+    # the old file stays and the temporary file is removed
+    assert target.read_text(encoding="utf-8") == "old"
+    assert os.listdir(tmp_path) == ["cube.npy"]
+    replace_atomically(
+        target, lambda path: path.write_text("new", encoding="utf-8"))
+    assert target.read_text(encoding="utf-8") == "new"
+    assert os.listdir(tmp_path) == ["cube.npy"]
@@ -9,6 +9,7 @@ from pathlib import Path
 import pandas as pd
 
 from crossborderml.pipeline import load_sql
+from crossborderml.pipeline.ingest import ingest_all, ingest_parallel
 
 
 def test_derive_table_name():
@@ -32,6 +33,19 @@ def test_get_engine(tmp_path):
         assert result[0] == 1
 
 
+def test_get_engine_is_shared(tmp_path):
+    """test"""
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    engine = load_sql.get_engine(url)
+    assert load_sql.get_engine(url) is engine
+    assert load_sql.get_engine(f"sqlite:///{tmp_path / 'other.db'}") \
+        is not engine
+    with engine.connect() as conn:
+        # the connect PRAGMAs are set on every pooled connection
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+
+
 def test_load_csv_to_sql(tmp_path, monkeypatch):
     """test"""
     # Prepare a fake config
@@ -72,3 +86,88 @@ def test_load_csv_to_sql(tmp_path, monkeypatch):
     assert df.shape == (2, 2)
     assert list(df.columns) == ["a", "b"]
     con.close()
+
+
+def test_ingest_all_blocks_invalid_files(tmp_path):
+    """test"""
+    good = tmp_path / "good.csv"
+    good.write_text("Country Name,Country Code,2020\nA,AAA,1.5\n")
+    bad = tmp_path / "bad.csv"
+    bad.write_text("Country Name,2020\nA,1.5\n")
+    empty = tmp_path / "empty.csv"
+    empty.write_text("")
+    db_path = tmp_path / "test.db"
+
+    failures = ingest_all([good, bad, empty], f"sqlite:///{db_path}",
+                          header_rows=0,
+                          base_cols=["Country Name", "Country Code"])
+
+    assert set(failures) == {"bad.csv", "empty.csv"}
+    assert "Missing columns" in failures["bad.csv"]
+    con = sqlite3.connect(db_path)
+    tables = {row[0] for row in con.execute(
+        "SELECT name FROM sqlite_master WHERE type='table'")}
+    df = pd.read_sql_query("SELECT * FROM good_wide", con)
+    con.close()
+    assert tables == {"good_wide"}
+    assert df.shape == (1, 3)
+
+
+def test_bulk_write_matches_to_sql(tmp_path):
+    """test"""
+    df = pd.DataFrame({
+        "Country Code": pd.Series(["AAA", None, "CCC"], dtype="category"),
+        "2020": pd.Series([1.5, None, 3.0], dtype="float32"),
+        "2021": [10.0, 20.0, None],
+    })
+    db_path = tmp_path / "test.db"
+    engine = load_sql.get_engine(f"sqlite:///{db_path}")
+
+    with load_sql.bulk_connection(engine) as conn:
+        sync = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        assert sync == 0
+        for method in ("bulk", "multi", "default"):
+            load_sql.write_wide_table(conn, f"t_{method}", df, method,
+                                      chunksize=2)
+
+    con = sqlite3.connect(db_path)
+    frames = [pd.read_sql_query(f"SELECT * FROM t_{m}", con)
+              for m in ("bulk", "multi", "default")]
+    nulls = con.execute(
+        'SELECT COUNT(*) FROM t_bulk WHERE "2020" IS NULL').fetchone()[0]
+    journal = con.execute("PRAGMA journal_mode").fetchone()[0]
+    con.close()
+    assert frames[0].equals(frames[1]) and frames[0].equals(frames[2])
+    assert nulls == 1
+    assert journal == "wal"
+    with engine.connect() as conn:
+        # the loading pragmas do not leak into the pool
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() != 0
+
+
+def test_ingest_parallel_matches_serial(tmp_path):
+    """test"""
+    files = []
+    for i in range(5):
+        csv_path = tmp_path / f"ind{i}.csv"
+        csv_path.write_text(
+            f"Country Name,Country Code,2020\nA,AAA,{i}.5\nB,BBB,\n")
+        files.append(csv_path)
+    bad = tmp_path / "bad.csv"
+    bad.write_text("Country Name,2020\nA,1.5\n")
+    files.append(bad)
+    kwargs = {"header_rows": 0, "base_cols": ["Country Name", "Country Code"]}
+
+    serial = ingest_all(files, f"sqlite:///{tmp_path / 's.db'}", **kwargs)
+    parallel = ingest_parallel(files, f"sqlite:///{tmp_path / 'p.db'}",
+                               max_workers=2, queue_size=1, **kwargs)
+
+    assert serial.keys() == parallel.keys() == {"bad.csv"}
+    con_s = sqlite3.connect(tmp_path / "s.db")
+    con_p = sqlite3.connect(tmp_path / "p.db")
+    for i in range(5):
+        query = f"SELECT * FROM ind{i}_wide"
+        assert pd.read_sql_query(query, con_s).equals(
+            pd.read_sql_query(query, con_p))
+    con_s.close()
+    con_p.close()
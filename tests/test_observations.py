@@ -0,0 +1,105 @@
+"""
+Tests for the observations fact table in pipline
+"""
+
+import sqlite3
+
+from crossborderml.config import CFG
+from crossborderml.pipeline import partition_by_country as pbc
+from crossborderml.pipeline.observations import build_observations
+
+
+def test_build_observations(tmp_path):
+    """All the wide tables end up in one indexed fact table"""
+    db_path = tmp_path / "test.db"
+    db_url = f"sqlite:///{db_path}"
+    con = sqlite3.connect(db_path)
+    for table, code, rows in (
+            ("gdp_wide", "NY.GDP", [("AAA", 1.0, 2.0), ("BBB", None, 4.0)]),
+            ("pop_wide", "SP.POP", [("AAA", 5.0, None)])):
+        con.execute(f'CREATE TABLE {table} ("Country Code" TEXT, '
+                    '"Indicator Code" TEXT, "2020" FLOAT, "2021" FLOAT)')
+        con.executemany(f'INSERT INTO {table} VALUES (?, ?, ?, ?)',
+                        [(c, code, *v) for c, *v in rows])
+    con.commit()
+    con.close()
+
+    assert build_observations(db_url) == 4
+    # a second run replaces the rows instead of adding them
+    assert build_observations(db_url) == 4
+
+    con = sqlite3.connect(db_path)
+    rows = con.execute("SELECT * FROM observations ORDER BY "
+                       "indicator_code, country_code, year").fetchall()
+    assert rows == [("NY.GDP", "AAA", 2020, 1.0),
+                    ("NY.GDP", "AAA", 2021, 2.0),
+                    ("NY.GDP", "BBB", 2021, 4.0),
+                    ("SP.POP", "AAA", 2020, 5.0)]
+    plan = " ".join(str(r) for r in con.execute(
+        "EXPLAIN QUERY PLAN SELECT value FROM observations "
+        "WHERE country_code = 'AAA' AND year = 2020").fetchall())
+    assert "observations_country_year" in plan
+    con.close()
+
+
+def write_wide(db_path, tables: dict[str, list[tuple]]) -> None:
+    """Wide tables of (country, indicator, 2020, 2021) rows"""
+    con = sqlite3.connect(db_path)
+    for table, rows in tables.items():
+        con.execute(f'CREATE TABLE {table} ("Country Name" TEXT, '
+                    '"Country Code" TEXT, "Indicator Code" TEXT, '
+                    '"2020" FLOAT, "2021" FLOAT)')
+        con.executemany(f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?)',
+                        [(c.lower(), c, *v) for c, *v in rows])
+    con.commit()
+    con.close()
+
+
+def test_repeated_country(tmp_path, capsys):
+    """The first row of a country is kept, the others are logged"""
+    db_path = tmp_path / "test.db"
+    write_wide(db_path, {"co2_wide": [("AAA", "EN.CO2", 4.04, None),
+                                      ("BBB", "EN.CO2", 1.0, 2.0),
+                                      ("AAA", "EN.CO2", 426.88, 5.0)]})
+    assert build_observations(f"sqlite:///{db_path}") == 3
+    out = capsys.readouterr().out
+    assert "co2_wide: 1 rows repeat a country" in out
+    assert "which holds 3 rows" in out
+
+    con = sqlite3.connect(db_path)
+    assert con.execute("SELECT country_code, year, value FROM observations "
+                       "ORDER BY country_code, year").fetchall() == [
+        ("AAA", 2020, 4.04), ("BBB", 2020, 1.0), ("BBB", 2021, 2.0)]
+    con.close()
+
+
+def test_after_partition(tmp_path):
+    """The per-country tables of the partition are not indicators"""
+    db_path = tmp_path / "test.db"
+    db_url = f"sqlite:///{db_path}"
+    tables = {"API_GDP_DS2_wide": [("AAA", "NY.GDP", 1.0, 2.0),
+                                   ("BBB", "NY.GDP", None, 3.0)],
+              "API_POP_DS2_wide": [("BBB", "SP.POP", 4.0, 5.0),
+                                   ("AAA", "SP.POP", 6.0, None)]}
+    write_wide(db_path, tables)
+    assert build_observations(db_url) == 6
+
+    engine = pbc.get_engine(db_url)
+    countries = pbc.consistent_countries(
+        pbc.CountryConsistency.from_engine(engine, list(tables)))
+    pbc.CreateCountryWideTables(
+        engine=engine,
+        tables_name={pbc.CreateCountryWideTables.table_for(code)
+                     for code in countries["API_GDP_DS2_wide"]},
+        countries_indicators=countries,
+        const_str=CFG.validd).create(
+            CFG.sql.snippets_dir / "per_country_wide", (2020, 2022),
+            mode="table")
+
+    assert build_observations(db_url) == 6
+    con = sqlite3.connect(db_path)
+    assert con.execute("SELECT DISTINCT indicator_code, country_code "
+                       "FROM observations ORDER BY 1, 2").fetchall() == [
+        ("NY.GDP", "AAA"), ("NY.GDP", "BBB"),
+        ("SP.POP", "AAA"), ("SP.POP", "BBB")]
+    con.close()
@@ -0,0 +1,182 @@
+"""
+Tests for partition_by_country in pipline
+"""
+
+import sqlite3
+
+import pytest
+from sqlalchemy import event
+
+from crossborderml.config import CFG
+from crossborderml.pipeline import partition_by_country as pbc
+
+
+@pytest.fixture
+def country_tables(tmp_path):
+    """Two wide tables of three countries, and the partitioner"""
+    db_path = tmp_path / "test.db"
+    con = sqlite3.connect(db_path)
+    for table, rows in (
+            ("API_GDP_DS2_wide", [("AAA", 1.0, 2.0), ("BBB", 3.0, None),
+                                  ("CCC", None, 6.0)]),
+            ("API_POP_DS2_wide", [("CCC", 7.0, 8.0), ("AAA", 9.0, 10.0),
+                                  ("BBB", 11.0, 12.0)])):
+        con.execute(f'CREATE TABLE {table} ("Country Name" TEXT, '
+                    '"Country Code" TEXT, "Indicator Code" TEXT, '
+                    '"2020" FLOAT, "2021" FLOAT)')
+        con.executemany(f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?)',
+                        [(c.lower(), c, table, *v) for c, *v in rows])
+    con.commit()
+    con.close()
+
+    engine = pbc.get_engine(f"sqlite:///{db_path}")
+    tables = ["API_GDP_DS2_wide", "API_POP_DS2_wide"]
+    countries = pbc.consistent_countries(
+        pbc.CountryConsistency.from_engine(engine, tables))
+    country_tables = pbc.CreateCountryWideTables(
+        engine=engine,
+        tables_name={pbc.CreateCountryWideTables.table_for(code)
+                     for code in countries["API_GDP_DS2_wide"]},
+        countries_indicators=countries,
+        const_str=CFG.validd)
+    return db_path, country_tables
+
+
+def read_countries(db_path) -> dict[str, list[tuple]]:
+    """Rows and kind of every country_<code>_wide"""
+    con = sqlite3.connect(db_path)
+    result = {}
+    for name, kind in con.execute(
+            "SELECT name, type FROM sqlite_master "
+            "WHERE name GLOB 'country_*_wide' ORDER BY name").fetchall():
+        result[name] = (kind, sorted(
+            con.execute(f"SELECT * FROM {name}").fetchall()))
+    con.close()
+    return result
+
+
+def test_view_mode_matches_table_mode(country_tables):
+    """The views give the same rows as the copied tables"""
+    db_path, partition = country_tables
+    snippet = CFG.sql.snippets_dir / "per_country_wide"
+
+    # 2022-2025 are not columns of the wide tables
+    partition.create(snippet, (2020, 2026), mode="table")
+    tables = read_countries(db_path)
+    # each table holds the rows of its own country
+    assert tables["country_AAA_wide"] == (
+        "table", [("GDP", 1.0, 2.0),
+                  ("POP", 9.0, 10.0)])
+
+    # switching modes replaces the tables by views
+    partition.create(snippet, (2020, 2026), mode="view")
+    views = read_countries(db_path)
+    assert set(views) == {"country_AAA_wide", "country_BBB_wide",
+                          "country_CCC_wide"}
+    assert all(kind == "view" for kind, _ in views.values())
+    assert {k: rows for k, (_, rows) in views.items()} == \
+        {k: rows for k, (_, rows) in tables.items()}
+
+    con = sqlite3.connect(db_path)
+    plan = " ".join(str(r) for r in con.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM country_BBB_wide").fetchall())
+    con.close()
+    assert "API_GDP_DS2_wide_country" in plan
+
+    with pytest.raises(ValueError):
+        partition.create(snippet, (2020, 2026), mode="copy")
+
+
+def test_batch_mode_matches_table_mode(country_tables, capsys):
+    """One transaction with a bound country code, same tables"""
+    db_path, partition = country_tables
+    snippet = CFG.sql.snippets_dir / "per_country_wide"
+
+    partition.create(snippet, (2020, 2022), mode="table")
+    tables = read_countries(db_path)
+    capsys.readouterr()
+
+    partition.create(snippet, (2020, 2022), mode="batch", batch_size=2)
+    assert read_countries(db_path) == tables
+    out = capsys.readouterr().out
+    assert "Batch 1: 2 tables" in out
+    assert "Batch 2: 1 tables" in out
+    assert "(3/3)" in out
+
+
+def test_country_consistency(country_tables):
+    """The bitmap names the countries an outlier adds or drops"""
+    db_path, partition = country_tables
+    con = sqlite3.connect(db_path)
+    for table, codes in (("API_FDI_DS2_wide", ["AAA", "BBB", "DDD"]),
+                         ("API_TAX_DS2_wide", ["AAA", "BBB", "CCC"])):
+        con.execute(f'CREATE TABLE {table} ("Country Name" TEXT, '
+                    '"Country Code" TEXT, "Indicator Code" TEXT)')
+        con.executemany(f'INSERT INTO {table} VALUES (?, ?, ?)',
+                        [(c.lower(), c, table) for c in codes])
+    con.commit()
+    con.close()
+
+    tables = ["API_FDI_DS2_wide", "API_GDP_DS2_wide", "API_POP_DS2_wide",
+              "API_TAX_DS2_wide"]
+    snippet = CFG.sql.snippets_dir / "country_codes"
+    # one statement per table gives the rows of one statement in all
+    assert sorted(pbc.fetch_country_rows(
+        partition.engine, snippet, tables, chunk=1)) == \
+        sorted(pbc.fetch_country_rows(partition.engine, snippet, tables))
+
+    check = pbc.CountryConsistency.from_engine(partition.engine, tables)
+    assert check.countries == ["AAA", "BBB", "CCC", "DDD"]
+    assert check.presence.sum(axis=1).tolist() == [3, 3, 3, 3]
+    assert check.outliers() == {
+        "API_FDI_DS2_wide": {"adds": ["DDD"], "drops": ["CCC"]}}
+    # same size, so the length rule does not see it
+    assert not check.unique_size_tables()
+    assert "adds ['DDD'], drops ['CCC']" in check.report()
+    assert pbc.consistent_countries(check)["API_FDI_DS2_wide"] == \
+        {"AAA", "BBB", "DDD"}
+
+    # a table with a country count of its own is left out
+    con = sqlite3.connect(db_path)
+    con.execute('DELETE FROM API_TAX_DS2_wide WHERE "Country Code" = \'CCC\'')
+    con.commit()
+    con.close()
+    kept = pbc.consistent_countries(
+        pbc.CountryConsistency.from_engine(partition.engine, tables))
+    assert sorted(kept) == tables[:3]
+
+
+def test_country_union_matches_format(country_tables):
+    """The compiled union gives the selects of str.format"""
+    _, partition = country_tables
+    sql_temp = (CFG.sql.snippets_dir / "per_country_wide").read_text(
+        encoding="utf-8")
+    years = partition.get_years((2020, 2026))
+    for code in ("AAA", "CCC"):
+        assert partition.country_union(code, years, sql_temp) == \
+            "\nUNION ALL\n".join(
+                sql_temp.format(indicator=indicator, year_columns=years,
+                                wide_table=table, country_code=code)
+                for table, indicator in zip(partition.in_tables,
+                                            partition.indicators))
+
+
+def test_get_years_one_query(country_tables):
+    """The columns of all the tables come from one catalog query"""
+    db_path, partition = country_tables
+    con = sqlite3.connect(db_path)
+    con.execute('ALTER TABLE API_GDP_DS2_wide ADD COLUMN "2022" FLOAT')
+    con.commit()
+    con.close()
+    statements = []
+
+    def count(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(partition.engine, "before_cursor_execute", count)
+    try:
+        # 2022 is only in one table, so it is left out
+        assert partition.get_years((2020, 2023)) == '"2020", "2021"'
+    finally:
+        event.remove(partition.engine, "before_cursor_execute", count)
+    assert len(statements) == 1
@@ -7,6 +7,9 @@ import sqlite3
 import pandas as pd
 import pytest
 
+from crossborderml.config import CFG
+from crossborderml.pipeline.pivot_wide_to_long import create_long_table
+
 
 @pytest.fixture
 def setup_sqlite_and_snippt(tmp_path):
@@ -38,6 +41,7 @@ def setup_sqlite_and_snippt(tmp_path):
 
     return db_path, snippt_path, DummyCFG
 
+
 def test_pivot_one_indicator(monkeypatch, setup_sqlite_and_snippt):
     db_path, snippt_path, DummyCFG = setup_sqlite_and_snippt
 
@@ -73,3 +77,27 @@ def test_pivot_one_indicator(monkeypatch, setup_sqlite_and_snippt):
     assert set(df["value"]) == {"2020", "2021"} or \
         set(df["value"]) == {10, 20, 30, 40}
     con.close()
+
+
+def test_pivot_existing_years(tmp_path):
+    """Only the year columns of the table are pivoted, year by year"""
+    db_path = tmp_path / "test.db"
+    db_url = f"sqlite:///{db_path}"
+    con = sqlite3.connect(db_path)
+    # Only some of the years, as in the World Bank files
+    con.execute('CREATE TABLE foo_wide ("Country Code" TEXT, '
+                '"1960" FLOAT, "2000" FLOAT, "2024" FLOAT)')
+    con.executemany('INSERT INTO foo_wide VALUES (?, ?, ?, ?)',
+                    [("BBB", 1.5, None, 3.0),
+                     ("AAA", None, None, None),
+                     ("CCC", 2.0, 7.25, None)])
+    con.commit()
+    con.close()
+
+    create_long_table("foo_wide", db_url=db_url)
+    con = sqlite3.connect(db_path)
+    rows = con.execute("SELECT * FROM foo_long").fetchall()
+    con.close()
+    assert rows == [("BBB", 1960, 1.5), ("CCC", 1960, 2.0),
+                    ("CCC", 2000, 7.25), ("BBB", 2024, 3.0)]
+    assert {year for _, year, _ in rows} <= set(range(*CFG.sql.year_range))
@@ -0,0 +1,57 @@
+"""
+Tests for the cached query API
+"""
+
+import sqlite3
+
+import numpy as np
+
+from crossborderml.api.query import QueryService
+from crossborderml.pipeline.observations import build_observations
+
+
+def test_queries(observed_db):
+    _, db_url = observed_db
+    service = QueryService(db_url)
+
+    series = service.get_series("NY.GDP", "AAA")
+    assert series.to_dict() == {2020: 1.5, 2021: 2.0}
+    assert service.get_series("NY.GDP", "AAA", (2021, 2022)).tolist() == [2.0]
+
+    panel = service.get_panel(["SP.POP", "NY.GDP"], ["BBB", "AAA"])
+    assert list(panel.columns) == ["SP.POP", "NY.GDP"]
+    assert panel.index.tolist() == [("AAA", 2020), ("AAA", 2021),
+                                    ("BBB", 2021)]
+    np.testing.assert_array_equal(
+        panel.to_numpy(), [[5.0, 1.5], [np.nan, 2.0], [np.nan, 4.0]])
+    assert len(service.get_panel(["NY.GDP"])) == 5
+
+    top = service.top_n("NY.GDP", 2021, 2)
+    assert top.values.tolist() == [["BBB", 4.0], ["AAA", 2.0]]
+    assert service.top_n("NY.GDP", 2021, 1, ascending=True).values.tolist() \
+        == [["CCC", 1.0]]
+
+
+def test_cache_and_invalidation(observed_db):
+    db_path, db_url = observed_db
+    service = QueryService(db_url)
+    first = service.get_series("NY.GDP", "AAA")
+    # a repeated call is a hit, and a copy
+    first[2020] = -1.0
+    assert service.get_series("NY.GDP", "AAA")[2020] == 1.5
+    assert service.cache.hits == 1
+
+    # a rebuild of the table empties the cache
+    con = sqlite3.connect(db_path)
+    con.execute("UPDATE gdp_wide SET \"2020\" = 9.0 WHERE "
+                "\"Country Code\" = 'AAA'")
+    con.commit()
+    con.close()
+    build_observations(db_url)
+    assert service.get_series("NY.GDP", "AAA")[2020] == 9.0
+    assert service.version == 2
+
+    # the cache is bounded in bytes
+    small = QueryService(db_url, cache_bytes=1)
+    small.get_panel(["NY.GDP"])
+    assert len(small.cache) == 0
@@ -0,0 +1,198 @@
+"""
+Tests for the pipeline runner: stages are skipped until one of
+their inputs changes
+"""
+
+import sqlite3
+from dataclasses import replace
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from crossborderml.config import CFG
+from crossborderml.pipeline import runner
+from crossborderml.pipeline.manifest import DownloadManifest
+from crossborderml.pipeline.runner import PipelineState, Stage, plan, \
+    run_pipeline
+
+
+def toy_stages(tmp_path: Path, calls: list[str]) -> list[Stage]:
+    """raw.csv -> load -> pivot (with a snippet); load -> export"""
+    def record(name: str, out: Path | None = None):
+        def run(_manifest):
+            calls.append(name)
+            if out is not None:
+                out.write_text(name, encoding="utf-8")
+        return run
+
+    raw, snippet = tmp_path / "raw.csv", tmp_path / "per_year_select"
+    table = tmp_path / "table.out"
+    return [
+        Stage("pivot", record("pivot"), deps=("load",),
+              snippets=(snippet,)),
+        Stage("load", record("load", table), inputs=lambda: [raw],
+              outputs=lambda: [table]),
+        Stage("export", record("export"), deps=("load",),
+              config=({"dtype": "float32"},)),
+    ]
+
+
+@pytest.fixture
+def toy(tmp_path):
+    """The toy stages, their input files and the calls made"""
+    (tmp_path / "raw.csv").write_text("a,b\n1,2\n", encoding="utf-8")
+    (tmp_path / "per_year_select").write_text("SELECT 1", encoding="utf-8")
+    calls: list[str] = []
+    kwargs = {"stages": toy_stages(tmp_path, calls),
+              "state_path": tmp_path / "state.json",
+              "manifest": DownloadManifest(tmp_path / "manifest.json"),
+              "report_dir": tmp_path / "reports"}
+    return tmp_path, calls, kwargs
+
+
+def test_skip_until_changed(toy):
+    tmp_path, calls, kwargs = toy
+    first = run_pipeline(**kwargs)
+    # dependencies first
+    assert list(first)[0] == "load"
+    assert set(first.values()) == {"ran"}
+    run_id = PipelineState(kwargs["state_path"]).run_id
+    assert run_id
+
+    calls.clear()
+    assert set(run_pipeline(**kwargs).values()) == {"skipped"}
+    assert not calls
+    # a run with nothing to do keeps the id of the data
+    assert PipelineState(kwargs["state_path"]).run_id == run_id
+
+    # a snippet change reruns its stage only
+    (tmp_path / "per_year_select").write_text("SELECT 2", encoding="utf-8")
+    run_pipeline(**kwargs)
+    assert calls == ["pivot"]
+
+    # an input file change reruns the stage and everything after it
+    calls.clear()
+    (tmp_path / "raw.csv").write_text("a,b\n1,3\n", encoding="utf-8")
+    run_pipeline(**kwargs)
+    assert sorted(calls) == ["export", "load", "pivot"]
+
+    # a missing output reruns its stage; a target limits the run
+    calls.clear()
+    (tmp_path / "table.out").unlink()
+    assert run_pipeline(["load"], **kwargs) == {"load": "ran"}
+    assert calls == ["load"]
+
+    calls.clear()
+    run_pipeline(["export"], force=True, **kwargs)
+    assert calls == ["load", "export"]
+
+
+def test_missing_output_reruns_dependents(toy):
+    tmp_path, calls, kwargs = toy
+    run_pipeline(**kwargs)
+    calls.clear()
+    (tmp_path / "table.out").unlink()
+    done = run_pipeline(**kwargs)
+    assert sorted(calls) == ["export", "load", "pivot"]
+    assert set(done.values()) == {"ran"}
+
+    # and the next run skips them all again
+    calls.clear()
+    run_pipeline(**kwargs)
+    assert not calls
+
+
+def test_failed_stage_runs_again(toy):
+    tmp_path, calls, kwargs = toy
+    run_pipeline(**kwargs)
+
+    def broken(_manifest):
+        raise RuntimeError("boom")
+
+    stages = [Stage(s.name, broken, s.deps, s.inputs, s.snippets, s.config,
+                    s.outputs) if s.name == "pivot" else s
+              for s in kwargs["stages"]]
+    (tmp_path / "per_year_select").write_text("SELECT 3", encoding="utf-8")
+    with pytest.raises(RuntimeError):
+        run_pipeline(**{**kwargs, "stages": stages})
+    assert "pivot" not in PipelineState(kwargs["state_path"]).stages
+
+    calls.clear()
+    run_pipeline(**kwargs)
+    assert calls == ["pivot"]
+
+
+def test_plan_errors(toy):
+    _, _, kwargs = toy
+    stages = kwargs["stages"]
+    with pytest.raises(ValueError):
+        plan(stages, ["unknown"])
+    with pytest.raises(ValueError):
+        plan([Stage("a", print, deps=("b",)), Stage("b", print, deps=("a",))])
+    with pytest.raises(ValueError):
+        plan([Stage("a", print, deps=("missing",))])
+
+
+def database_outputs(tmp_path: Path) -> dict:
+    """The rows of every table and view, the cube and the features"""
+    con = sqlite3.connect(tmp_path / "test.db")
+    outputs: dict = {name: sorted(con.execute(f"SELECT * FROM {name}"))
+                     for (name,) in con.execute(
+                         "SELECT name FROM sqlite_master WHERE type IN "
+                         "('table', 'view') AND name != '_table_versions'")}
+    con.close()
+    outputs["cube"] = np.load(tmp_path / "cube" / CFG.cube.data_file,
+                              allow_pickle=False).tobytes()
+    outputs["features"] = [
+        np.load(path, allow_pickle=False).tobytes()
+        for path in sorted((tmp_path / "features").glob("*.npy"))]
+    return outputs
+
+
+def test_rerun_gives_same_outputs(tmp_path, monkeypatch):
+    """A second run does not read the tables the first one made"""
+    con = sqlite3.connect(tmp_path / "test.db")
+    tables = {"API_GDP_DS2_wide": [("AAA", "NY.GDP", 1.0, 2.0),
+                                   ("BBB", "NY.GDP", None, 3.0)],
+              "API_POP_DS2_wide": [("BBB", "SP.POP", 4.0, 5.0),
+                                   ("AAA", "SP.POP", 6.0, None)]}
+    for table, rows in tables.items():
+        con.execute(f'CREATE TABLE {table} ("Country Name" TEXT, '
+                    '"Country Code" TEXT, "Indicator Code" TEXT, '
+                    '"2020" FLOAT, "2021" FLOAT)')
+        con.executemany(f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?)',
+                        [(c.lower(), c, *v) for c, *v in rows])
+    con.commit()
+    con.close()
+
+    cfg = replace(
+        CFG,
+        sql=replace(CFG.sql, db_url=f"sqlite:///{tmp_path / 'test.db'}"),
+        paths=replace(CFG.paths, cube_dir=tmp_path / "cube",
+                      features_dir=tmp_path / "features"))
+    monkeypatch.setattr(runner, "CFG", cfg)
+    monkeypatch.setattr(runner, "_wide_tables", lambda: sorted(tables))
+    names = ("pivot", "partition", "observations", "cube", "features")
+    stages = [replace(s, deps=tuple(d for d in s.deps if d in names))
+              for s in runner.default_stages() if s.name in names]
+    kwargs = {"stages": stages,
+              "state_path": tmp_path / "state.json",
+              "manifest": DownloadManifest(tmp_path / "manifest.json"),
+              "report_dir": None}
+
+    run_pipeline(**kwargs)
+    first = database_outputs(tmp_path)
+    assert "API_GDP_DS2_long" in first and "country_AAA_wide" in first
+    run_pipeline(force=True, **kwargs)
+    assert database_outputs(tmp_path) == first
+
+
+def test_no_unzip_from_archives(monkeypatch):
+    """The CSVs read out of the archives need no extraction"""
+    monkeypatch.setattr(runner, "CFG", replace(
+        CFG, csv=replace(CFG.csv, from_archives=True)))
+    stages = {stage.name: stage for stage in runner.default_stages()}
+    assert "unzip" not in stages
+    assert stages["check_files"].deps == ("download",)
+    plan(list(stages.values()))
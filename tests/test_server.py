@@ -0,0 +1,187 @@
+"""
+Tests for the HTTP server of the observations
+"""
+
+import json
+import sqlite3
+import time
+import threading
+import http.client
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+import pytest
+
+from crossborderml.config import CFG
+from crossborderml.api import server as server_mod
+from crossborderml.api.server import QueryServer
+from crossborderml.pipeline.observations import build_observations
+from crossborderml.pipeline.runner import PipelineState
+
+
+@pytest.fixture
+def server(observed_db, tmp_path):
+    """A server on a free port, over the observed database"""
+    db_path, db_url = observed_db
+    state = PipelineState(tmp_path / "state.json")
+    state.run_id = "run1"
+    state.save()
+    cfg = replace(CFG.server, port=0, pool_size=4, fetch_rows=2)
+    srv = QueryServer(db_url, cfg, state.path)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv, db_path, db_url, state
+    srv.shutdown()
+    srv.server_close()
+
+
+def get(srv, path, **headers):
+    """(status, headers, body) of a GET"""
+    host, port = srv.server_address[:2]
+    request = urllib.request.Request(f"http://{host}:{port}{path}",
+                                     headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as err:
+        return err.code, err.headers, err.read()
+
+
+def test_long_and_wide(server):
+    srv = server[0]
+    status, headers, body = get(srv, "/long?indicators=NY.GDP")
+    assert status == 200 and headers["Transfer-Encoding"] == "chunked"
+    assert json.loads(body) == {
+        "columns": ["indicator_code", "country_code", "year", "value"],
+        "data": [["NY.GDP", "AAA", 2020, 1.5], ["NY.GDP", "CCC", 2020, 3.0],
+                 ["NY.GDP", "AAA", 2021, 2.0], ["NY.GDP", "BBB", 2021, 4.0],
+                 ["NY.GDP", "CCC", 2021, 1.0]]}
+
+    _, _, body = get(srv, "/wide?indicators=SP.POP,NY.GDP&countries=AAA,BBB")
+    wide = json.loads(body)
+    assert wide["columns"] == ["country_code", "year", "SP.POP", "NY.GDP"]
+    assert wide["data"] == [["AAA", 2020, 5.0, 1.5], ["AAA", 2021, None, 2.0],
+                            ["BBB", 2021, None, 4.0]]
+    _, _, body = get(srv, "/wide?indicators=NY.GDP&start=2021&stop=2022")
+    assert [row[0] for row in json.loads(body)["data"]] == \
+        ["AAA", "BBB", "CCC"]
+
+    assert get(srv, "/long")[0] == 400
+    assert get(srv, "/long?indicators=NY.GDP&start=x")[0] == 400
+    assert get(srv, "/nothing")[0] == 404
+    assert json.loads(get(srv, "/health")[2])["run_id"] == "run1"
+
+
+def test_arrow(server):
+    pa = pytest.importorskip("pyarrow")
+    srv = server[0]
+    _, headers, body = get(srv, "/wide?indicators=NY.GDP,SP.POP",
+                           Accept="application/vnd.apache.arrow.stream")
+    assert headers["Content-Type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.column_names == ["country_code", "year", "NY.GDP", "SP.POP"]
+    assert table.num_rows == 5
+    assert table.column("SP.POP").to_pylist() == [5.0] + [None] * 4
+
+
+def test_etag(server):
+    srv, db_path, db_url, state = server
+    path = "/long?indicators=NY.GDP"
+    _, headers, _ = get(srv, path)
+    etag = headers["ETag"]
+    assert etag.startswith('"run1-1-')
+    assert get(srv, path, **{"If-None-Match": etag})[0] == 304
+    # another request, another tag
+    assert get(srv, path + "&format=arrow")[1]["ETag"] != etag
+
+    # rebuilt data or a new run change the tag
+    con = sqlite3.connect(db_path)
+    con.execute("UPDATE gdp_wide SET \"2020\" = 9.0")
+    con.commit()
+    con.close()
+    build_observations(db_url)
+    status, headers, _ = get(srv, path, **{"If-None-Match": etag})
+    assert status == 200 and headers["ETag"].startswith('"run1-2-')
+    state.run_id = "run2"
+    state.save()
+    assert get(srv, path)[1]["ETag"].startswith('"run2-2-')
+
+
+def test_readers_while_writing(server):
+    """Many readers and a writer rebuilding the table, no lock errors"""
+    srv, db_path, db_url, _ = server
+    stop = threading.Event()
+
+    def write():
+        value = 0.0
+        while not stop.is_set():
+            con = sqlite3.connect(db_path)
+            con.execute("UPDATE gdp_wide SET \"2021\" = ?", (value,))
+            con.commit()
+            con.close()
+            build_observations(db_url)
+            value += 1
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        with ThreadPoolExecutor(16) as pool:
+            results = list(pool.map(
+                lambda _: get(srv, "/wide?indicators=NY.GDP,SP.POP"),
+                range(200)))
+    finally:
+        stop.set()
+        writer.join()
+    assert {status for status, _, _ in results} == {200}
+    assert all(len(json.loads(body)["data"]) == 5
+               for _, _, body in results)
+
+
+def locked_fetch(_request, _cursor, _fetch_rows):
+    """Rows of a fetch which fails after its first batch"""
+    yield [["AAA", 2020, 1.0]]
+    raise sqlite3.OperationalError("database is locked")
+
+
+def text_value(_request, _cursor, _fetch_rows):
+    """Rows Arrow cannot put in the float column"""
+    yield [["AAA", 2020, "n/a"]]
+
+
+@pytest.mark.parametrize("rows, query", [
+    (locked_fetch, "indicators=NY.GDP"),
+    (text_value, "indicators=NY.GDP&format=arrow")])
+def test_error_while_streaming(server, monkeypatch, capsys, rows, query):
+    """A failed fetch or batch cuts the body, it adds no response"""
+    if "arrow" in query:
+        pytest.importorskip("pyarrow")
+    srv = server[0]
+    monkeypatch.setattr(server_mod.PanelRequest, "rows", rows)
+    host, port = srv.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    conn.request("GET", f"/wide?{query}")
+    response = conn.getresponse()
+    assert response.status == 200
+    with pytest.raises(http.client.IncompleteRead) as err:
+        response.read()
+    assert b"HTTP/1.1" not in err.value.partial
+    conn.close()
+    # handled by the server, not left to the traceback of socketserver
+    deadline = time.monotonic() + 5
+    out = ""
+    while "failed" not in out and time.monotonic() < deadline:
+        out += capsys.readouterr().out
+        time.sleep(0.01)
+    assert f"Stream of /wide?{query} failed" in out
+
+    # the connection went back to the pool, out of its transaction
+    monkeypatch.undo()
+    assert get(srv, "/wide?indicators=NY.GDP")[0] == 200
+    # the handler returns its connection after the client has read
+    deadline = time.monotonic() + 5
+    while srv.pool._idle.qsize() < srv.pool.size and \
+            time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not any(c.in_transaction for c in srv.pool._all)
@@ -0,0 +1,38 @@
+"""
+Tests for the pivot of all the indicators in pipline
+"""
+
+import sqlite3
+
+from crossborderml.config import CFG
+from crossborderml.pipeline.transform import pivot_all_indicators
+
+
+def test_parallel_pivot_matches_serial(tmp_path):
+    """Worker processes give the tables of the serial pivot"""
+    results = {}
+    for workers in (1, 2):
+        db_path = tmp_path / f"test_{workers}.db"
+        con = sqlite3.connect(db_path)
+        for i in range(3):
+            con.execute(f'CREATE TABLE t{i}_wide ("Country Code" TEXT, '
+                        '"2020" FLOAT, "2021" INTEGER)')
+            con.executemany(f'INSERT INTO t{i}_wide VALUES (?, ?, ?)',
+                            [("BBB", i + 0.5, None), ("AAA", None, i)])
+        con.commit()
+        con.close()
+
+        pivot_all_indicators(CFG.sql.queries_dir / "tables_name.sql",
+                             f"sqlite:///{db_path}",
+                             max_workers=workers)
+        con = sqlite3.connect(db_path)
+        results[workers] = [
+            (name, ddl, con.execute(f"SELECT * FROM {name}").fetchall())
+            for name, ddl in con.execute(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE name GLOB '*_long' ORDER BY name")]
+        con.close()
+
+    assert len(results[1]) == 3
+    assert results[1][0][2] == [("BBB", 2020, 0.5), ("AAA", 2021, 0)]
+    assert results[2] == results[1]